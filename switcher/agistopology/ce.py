@@ -3,6 +3,8 @@
 
 class AGISCE(object):
 
+    __slots__ = ('endpoint', 'name', 'state')
+
     def __init__(self, endpoint):
         self.endpoint = endpoint
         self.name = None 
@@ -26,10 +28,18 @@ class AGISCEHandler(object):
         :param CE ce: 
         """
         endpoint = ce.endpoint
-        if endpoint not in self.ce_d.keys():
+        if endpoint not in self.ce_d:
             self.ce_d[endpoint] = ce
 
 
+    def remove(self, ce):
+        """
+        removes an object CE from the list
+        :param CE ce:
+        """
+        self.ce_d.pop(ce.endpoint, None)
+
+
     def getlist(self):
         """
         get the list of CEs
@@ -0,0 +1,482 @@
+#!/usr/bin/env python
+
+import logging
+from array import array
+
+from switcher.agistopology.ddm import get_ddm_endpoints
+
+
+# =============================================================================
+#   Views
+#
+#       thin objects pointing to a row in the columns of the topology,
+#       so the columns can be read and written like attributes
+# =============================================================================
+
+class AGISQueueView(object):
+
+    __slots__ = ('topology', 'index')
+
+    def __init__(self, topology, index):
+        self.topology = topology
+        self.index = index
+
+    @property
+    def qname(self):
+        return self.topology.queue_names[self.index]
+
+    @property
+    def name(self):
+        return self.topology.queue_resources[self.index]
+
+    @property
+    def status(self):
+        return self.topology.status_names[self.topology.queue_status[self.index]]
+
+    @status.setter
+    def status(self, value):
+        topology = self.topology
+        topology.queue_status[self.index] = topology._intern(topology.status_names, topology.status_index_d, value)
+
+    @property
+    def type(self):
+        return self.topology.type_names[self.topology.queue_type[self.index]]
+
+    @property
+    def token(self):
+        code = self.topology.queue_token[self.index]
+        if code < 0:
+            return None
+        return self.topology.token_names[code]
+
+    @property
+    def site(self):
+        return self.topology.site_names[self.topology.queue_site[self.index]]
+
+    @property
+    def cloud(self):
+        return self.topology.cloud_names[self.topology.queue_cloud[self.index]]
+
+    def data(self):
+        """
+        get the record for this queue in schedconfig,
+        for the fields not kept in the columns
+        :return dict:
+        """
+        return self.topology.schedconfig_data[self.qname]
+
+    def getces(self):
+        """
+        :return list: AGISCEView objects for the CEs of this queue
+        """
+        topology = self.topology
+        return [AGISCEView(topology, ce_index) for ce_index in topology.get_ce_indexes(self.index)]
+
+    def getddm(self):
+        """
+        :return AGISDDMView: the DDM endpoint for this queue, or None
+        """
+        ddm_index = self.topology.queue_ddm[self.index]
+        if ddm_index < 0:
+            return None
+        return AGISDDMView(self.topology, ddm_index)
+
+
+class AGISCEView(object):
+
+    __slots__ = ('topology', 'index')
+
+    def __init__(self, topology, index):
+        self.topology = topology
+        self.index = index
+
+    @property
+    def endpoint(self):
+        return self.topology.ce_endpoints[self.index]
+
+    @property
+    def name(self):
+        return self.topology.ce_names[self.index]
+
+    @property
+    def state(self):
+        return self.topology.state_names[self.topology.ce_state[self.index]]
+
+    @state.setter
+    def state(self, value):
+        topology = self.topology
+        topology.ce_state[self.index] = topology._intern(topology.state_names, topology.state_index_d, value)
+
+
+class AGISDDMView(object):
+
+    __slots__ = ('topology', 'index')
+
+    def __init__(self, topology, index):
+        self.topology = topology
+        self.index = index
+
+    @property
+    def endpoint(self):
+        return self.topology.ddm_endpoints[self.index]
+
+    @property
+    def token(self):
+        return self.topology.ddm_tokens[self.index]
+
+
+# =============================================================================
+
+class AGISColumnarTopology(object):
+    """
+    alternative to AGISTopology for very large grids.
+    Instead of a tree of Cloud, Site, Queue, CE and DDM objects,
+    each entity is an integer, the index of a row in a set of parallel arrays:
+
+        queue_site[q], queue_cloud[q]     site and cloud of queue q
+        queue_status[q], queue_type[q]    coded values from schedconfig
+        queue_ddm[q]                      DDM endpoint of queue q, or -1
+        queue_ce[queue_ce_start[q]:queue_ce_start[q+1]]
+                                          CEs of queue q (CSR form)
+        ce_state[c]                       coded state of CE c
+
+    Strings are kept only once, in tables like queue_names or status_names,
+    with a dictionary to get the index of each value.
+    The reverse indexes (which queues use a CE, a DDM endpoint, or a site)
+    are kept in CSR form too.
+    View objects (AGISQueueView, AGISCEView, AGISDDMView) can be used
+    to read and write a row as if it was an object.
+    """
+
+    def __init__(self, schedconfig_data, allowed_clouds, allowed_sites, allowed_queues, ddm_topology_data=None):
+        """
+        :param dict schedconfig_data: decoded content of AGIS schedconfig
+        :param AllowedEntities allowed_clouds: clouds to be considered
+        :param AllowedEntities allowed_sites: sites to be considered
+        :param AllowedEntities allowed_queues: queues to be considered
+        :param dict ddm_topology_data: decoded content of AGIS DDM topology
+        """
+        self.log = logging.getLogger('agistopology')
+        self.allowed_clouds = allowed_clouds
+        self.allowed_sites = allowed_sites
+        self.allowed_queues = allowed_queues
+        self.__build(schedconfig_data, ddm_topology_data)
+        self.log.debug('Object AGISColumnarTopology created with %s queues and %s CEs.' %(len(self.queue_names), len(self.ce_endpoints)))
+
+    # -------------------------------------------------------------------------
+
+    def update(self, schedconfig_data, ddm_topology_data=None):
+        """
+        updates the topology for a new cycle.
+        The columns are built again only if the data changed.
+        Otherwise, the status of queues and CEs are set back
+        to their values in schedconfig.
+        The data is compared by value, as the same content 
+        may come in new objects, for example after a snapshot is loaded.
+        :param dict schedconfig_data: decoded content of AGIS schedconfig
+        :param dict ddm_topology_data: decoded content of AGIS DDM topology
+        :return bool: True if the columns were built again
+        """
+        if self.__changed(self.schedconfig_data, schedconfig_data) or\
+           self.__changed(self.ddm_topology_data, ddm_topology_data):
+            self.log.info('Inputs changed. Building the columns again.')
+            self.__build(schedconfig_data, ddm_topology_data)
+            return True
+        # same content: the new objects are kept, 
+        # so next time they are found identical at once
+        self.schedconfig_data = schedconfig_data
+        self.ddm_topology_data = ddm_topology_data
+        self.queue_status = array('h', self.__queue_status)
+        self.ce_state = array('h', self.__ce_state)
+        return False
+
+
+    def __changed(self, old_data, new_data):
+        """
+        checks if the content of a source changed
+        :return bool:
+        """
+        return old_data is not new_data and old_data != new_data
+
+
+    def _intern(self, names_l, index_d, value):
+        """
+        get the code for a value, adding it to the table if it is new
+        :param list names_l: the table of values
+        :param dict index_d: the code for each value in the table
+        :return int:
+        """
+        code = index_d.get(value, None)
+        if code is None:
+            code = len(names_l)
+            names_l.append(value)
+            index_d[value] = code
+        return code
+
+
+    def __csr(self, nkeys, pair_l):
+        """
+        builds a reverse index in CSR form
+        :param int nkeys: number of different keys
+        :param list pair_l: list of (key, value) tuples
+        :return tuple: (array of start positions for each key, array of values)
+        """
+        start = array('i', [0]) * (nkeys + 1)
+        for key, value in pair_l:
+            start[key + 1] += 1
+        for i in range(nkeys):
+            start[i + 1] += start[i]
+        values = array('i', [0]) * len(pair_l)
+        position = array('i', start)
+        for key, value in pair_l:
+            values[position[key]] = value
+            position[key] += 1
+        return start, values
+
+    # -------------------------------------------------------------------------
+
+    def __build(self, schedconfig_data, ddm_topology_data):
+        """
+        builds all columns from AGIS schedconfig and DDM topology
+        """
+        self.log.debug('Starting.')
+        self.schedconfig_data = schedconfig_data
+        self.ddm_topology_data = ddm_topology_data
+
+        self.cloud_names, self.cloud_index_d = [], {}
+        self.site_names, self.site_index_d = [], {}
+        self.queue_names, self.queue_index_d = [], {}
+        self.queue_resources = []
+        self.ce_endpoints, self.ce_index_d = [], {}
+        self.ce_names = []
+        self.ddm_endpoints, self.ddm_index_d = [], {}
+        self.ddm_tokens = []
+        self.token_names, self.token_index_d = [], {}
+        self.status_names, self.status_index_d = [], {}
+        self.type_names, self.type_index_d = [], {}
+        self.state_names, self.state_index_d = [], {}
+
+        self.queue_cloud = array('i')
+        self.queue_site = array('i')
+        self.queue_status = array('h')
+        self.queue_type = array('h')
+        self.queue_token = array('i')
+        self.queue_ddm = array('i')
+        self.queue_ce_start = array('i', [0])
+        self.queue_ce = array('i')
+        self.ce_state = array('h')
+
+        for qname, qdata in schedconfig_data.items():
+            try:
+                self.__add_queue(qname, qdata)
+            except Exception as ex:
+                self.log.error('Failure processing queue %s: %s' %(qname, ex))
+
+        self.site_nucleus = array('b', [0]) * len(self.site_names)
+        if ddm_topology_data is not None:
+            self.__add_ddm(ddm_topology_data)
+
+        nqueues = len(self.queue_names)
+        pair_l = []
+        for q in range(nqueues):
+            for i in range(self.queue_ce_start[q], self.queue_ce_start[q + 1]):
+                pair_l.append((self.queue_ce[i], q))
+        self.ce_queue_start, self.ce_queue = self.__csr(len(self.ce_endpoints), pair_l)
+        self.site_queue_start, self.site_queue = self.__csr(len(self.site_names), [(self.queue_site[q], q) for q in range(nqueues)])
+        self.ddm_queue_start, self.ddm_queue = self.__csr(len(self.ddm_endpoints), [(self.queue_ddm[q], q) for q in range(nqueues) if self.queue_ddm[q] >= 0])
+
+        # values from schedconfig, to set them back on a new cycle
+        self.__queue_status = array('h', self.queue_status)
+        self.__ce_state = array('h', self.ce_state)
+        self.log.debug('Leaving.')
+
+
+    def __add_queue(self, qname, qdata):
+        """
+        adds a row for a queue from schedconfig, if it is not excluded.
+        All values are read before any column is modified,
+        so a malformed record leaves no partial row.
+        """
+        if qdata['vo_name'] != 'atlas':
+            self.log.warning('queue %s does not belong to ATLAS. Skipping it.' %qname)
+            return
+        cloudname = qdata['cloud']
+        if cloudname not in self.allowed_clouds:
+            self.log.warning('cloud %s is excluded. Skipping it.' %cloudname)
+            return
+        sitename = qdata['atlas_site']
+        if sitename not in self.allowed_sites:
+            self.log.warning('site %s is excluded. Skipping it.' %sitename)
+            return
+        if qname not in self.allowed_queues:
+            self.log.warning('queue %s is excluded. Skipping it.' %qname)
+            return
+
+        panda_resource = qdata['panda_resource']
+        status = qdata['status']
+        type = qdata['type']
+        try:
+            token = qdata['astorages']['write_lan'][0]
+        except:
+            token = None
+        ce_l = [(q['ce_name'], q['ce_endpoint'], q['ce_state']) for q in qdata['queues']]
+
+        self.queue_index_d[qname] = len(self.queue_names)
+        self.queue_names.append(qname)
+        self.queue_resources.append(panda_resource)
+        self.queue_cloud.append(self._intern(self.cloud_names, self.cloud_index_d, cloudname))
+        self.queue_site.append(self._intern(self.site_names, self.site_index_d, sitename))
+        self.queue_status.append(self._intern(self.status_names, self.status_index_d, status))
+        self.queue_type.append(self._intern(self.type_names, self.type_index_d, type))
+        if token:
+            self.queue_token.append(self._intern(self.token_names, self.token_index_d, token))
+        else:
+            self.queue_token.append(-1)
+        self.queue_ddm.append(-1)
+
+        seen_s = set()
+        for ce_name, ce_endpoint, ce_state in ce_l:
+            ce_index = self.ce_index_d.get(ce_endpoint, None)
+            if ce_index is None:
+                ce_index = len(self.ce_endpoints)
+                self.ce_index_d[ce_endpoint] = ce_index
+                self.ce_endpoints.append(ce_endpoint)
+                self.ce_names.append(ce_name)
+                self.ce_state.append(0)
+            # as with the CE objects, the last queue processed sets the values
+            self.ce_names[ce_index] = ce_name
+            self.ce_state[ce_index] = self._intern(self.state_names, self.state_index_d, ce_state)
+            if ce_index not in seen_s:
+                seen_s.add(ce_index)
+                self.queue_ce.append(ce_index)
+        self.queue_ce_start.append(len(self.queue_ce))
+
+
+    def __add_ddm(self, ddm_topology_data):
+        """
+        finds the DDM endpoint for each queue with a token:
+        the first one in write_lan, or in write_wan if there is no write_lan.
+        The endpoint is found only once per token.
+        """
+        self.log.debug('Starting.')
+        endpoint_d = get_ddm_endpoints(ddm_topology_data, self.token_names)
+        token_ddm_l = [endpoint_d.get(token, None) for token in self.token_names]
+
+        for q in range(len(self.queue_names)):
+            code = self.queue_token[q]
+            if code < 0:
+                continue
+            endpoint = token_ddm_l[code]
+            if endpoint is None:
+                continue
+            ddm_index = self.ddm_index_d.get(endpoint, None)
+            if ddm_index is None:
+                ddm_index = len(self.ddm_endpoints)
+                self.ddm_index_d[endpoint] = ddm_index
+                self.ddm_endpoints.append(endpoint)
+                self.ddm_tokens.append(None)
+            self.ddm_tokens[ddm_index] = self.token_names[code]
+            self.queue_ddm[q] = ddm_index
+        self.log.debug('Leaving.')
+
+    # -------------------------------------------------------------------------
+
+    def get_ce_indexes(self, queue_index):
+        """
+        :param int queue_index: the row of a queue
+        :return array: the rows of its CEs
+        """
+        return self.queue_ce[self.queue_ce_start[queue_index]:self.queue_ce_start[queue_index + 1]]
+
+
+    def get_queue(self, qname):
+        """
+        :param str qname: the queue name, as in schedconfig
+        :return AGISQueueView: or None if the queue is not in the topology
+        """
+        index = self.queue_index_d.get(qname, None)
+        if index is None:
+            return None
+        return AGISQueueView(self, index)
+
+
+    def get_ce(self, endpoint):
+        """
+        :param str endpoint: the CE endpoint
+        :return AGISCEView: or None if the CE is not in the topology
+        """
+        index = self.ce_index_d.get(endpoint, None)
+        if index is None:
+            return None
+        return AGISCEView(self, index)
+
+
+    def iter_queues(self):
+        """
+        iterates over all queues, as AGISQueueView objects
+        """
+        for index in xrange(len(self.queue_names)):
+            yield AGISQueueView(self, index)
+
+    # -------------------------------------------------------------------------
+
+    def __lookup(self, index_d, start, values, key):
+        index = index_d.get(key, None)
+        if index is None:
+            return []
+        return [self.queue_names[q] for q in values[start[index]:start[index + 1]]]
+
+
+    def queues_for_ce(self, endpoint):
+        """
+        :param str endpoint: the CE endpoint
+        :return list: names of the queues using that CE
+        """
+        return self.__lookup(self.ce_index_d, self.ce_queue_start, self.ce_queue, endpoint)
+
+
+    def queues_for_ddm(self, endpoint):
+        """
+        :param str endpoint: the DDM endpoint
+        :return list: names of the queues using that DDM
+        """
+        return self.__lookup(self.ddm_index_d, self.ddm_queue_start, self.ddm_queue, endpoint)
+
+
+    def queues_for_site(self, sitename):
+        """
+        :param str sitename: the site name
+        :return list: names of the queues in that site
+        """
+        return self.__lookup(self.site_index_d, self.site_queue_start, self.site_queue, sitename)
+
+    # --------------------------------------------------------------------------
+
+    def add_nucleus(self, data):
+        """
+        checks which site is a nucleus and which one is not
+        :param list data: decoded content of AGIS sites
+        """
+        self.log.debug('Starting.')
+        for siteinfo in data:
+            sitename = siteinfo['name']
+            if 'Nucleus' in siteinfo['datapolicies']:
+                index = self.site_index_d.get(sitename, None)
+                if index is not None:
+                    self.site_nucleus[index] = 1
+                else:
+                    self.log.warning('Site %s is not in the Topology. Skipping it.' %sitename)
+        self.log.debug('Leaving.')
+
+    # --------------------------------------------------------------------------
+
+    def __str__(self):
+        """
+        ancillary method to get a friendly, easy to read,
+        representation of the topology
+        """
+        return 'Topology: %s clouds, %s sites, %s queues, %s CEs, %s DDM endpoints\n' %(len(self.cloud_names),
+                                                                                      len(self.site_names),
+                                                                                      len(self.queue_names),
+                                                                                      len(self.ce_endpoints),
+                                                                                      len(self.ddm_endpoints))
@@ -1,8 +1,15 @@
 #!/usr/bin/env python
 
+import logging
+
+
+log = logging.getLogger('agistopology')
+
 
 class AGISDDM(object):
 
+    __slots__ = ('endpoint', 'name', 'token')
+
     def __init__(self, endpoint):
         self.endpoint = endpoint
         self.name = None
@@ -25,10 +32,18 @@ class AGISDDMHandler(object):
         :param DDM ddm:
         """
         endpoint = ddm.endpoint
-        if endpoint not in self.ddm_d.keys():
+        if endpoint not in self.ddm_d:
             self.ddm_d[endpoint] = ddm
 
 
+    def remove(self, ddm):
+        """
+        removes an object DDM from the list dict.
+        :param DDM ddm:
+        """
+        self.ddm_d.pop(ddm.endpoint, None)
+
+
     def getlist(self):
         """
         get the list of DDM objects
@@ -36,3 +51,47 @@ class AGISDDMHandler(object):
         return self.ddm_d.values()
 
 
+# =============================================================================
+
+def get_ddm_endpoint(token, data):
+    """
+    get the preferred endpoint for a token in DDM topology:
+    the first one in write_lan or, if there is no write_lan, 
+    the first one in write_wan
+    :param str token: the space token
+    :param dict data: the record for that token in DDM topology
+    :return str: the endpoint, or None
+    """
+    arprotocols = data['arprotocols']
+    if 'write_lan' in arprotocols:
+        return arprotocols['write_lan'][0]['endpoint']
+    if 'write_wan' in arprotocols:
+        return arprotocols['write_wan'][0]['endpoint']
+    log.info('There is neither write_lan nor write_wan section in "arprotocols" for token %s.' %token)
+    return None
+
+
+def get_ddm_endpoints(ddm_topology_data, token_l=None):
+    """
+    get the preferred endpoint for each token in DDM topology, 
+    in a single pass.
+    Tokens with no valid endpoint are not included.
+    :param dict ddm_topology_data: decoded content of AGIS DDM topology
+    :param list token_l: only these tokens, or all of them if None
+    :return dict: token -> endpoint
+    """
+    if token_l is None:
+        token_l = ddm_topology_data.keys()
+    out = {}
+    for token in token_l:
+        data = ddm_topology_data.get(token, None)
+        if data is None:
+            continue
+        try:
+            endpoint = get_ddm_endpoint(token, data)
+        except Exception as ex:
+            log.warning('Malformed record for token %s in DDM topology: %s. Skipping it.' %(token, ex))
+            continue
+        if endpoint:
+            out[token] = endpoint
+    return out
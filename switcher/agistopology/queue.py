@@ -5,14 +5,22 @@ from switcher.agistopology.ce import AGISCEHandler
 from switcher.agistopology.ddm  import AGISDDMHandler
 
 class AGISQueue(object):
+
+    __slots__ = ('name', 'status', 'tier_level', 'type', 'token', 'probe', 
+                 'cehandler', 'ddmhandler')
+
+    # classes for the handlers, to be replaced by subclasses
+    cehandler_class = AGISCEHandler
+    ddmhandler_class = AGISDDMHandler
     
     def __init__(self, name, data_d):
         self.name = name
         self.status = None
         self.tier_level = None
         self.type = None
-        self.cehandler = AGISCEHandler()
-        self.ddmhandler = AGISDDMHandler()
+        self.probe = None
+        self.cehandler = self.cehandler_class()
+        self.ddmhandler = self.ddmhandler_class()
         ###self.ddm = None
         self.__configure(data_d)
 
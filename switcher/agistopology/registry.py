@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+import logging
+
+
+class AGISRegistry(object):
+    """
+    class with the reverse indexes of the topology,
+    to answer in constant time which queues are using
+    a given CE endpoint, DDM endpoint, site or token,
+    and which DDM object was chosen for each token,
+    without walking the whole tree.
+
+    Each index maps a key to the set of names of the queues referring to it.
+    A key is removed from the index when no queue refers to it anymore.
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger('agistopology')
+        # CE endpoint -> set of queue names
+        self.ce_queue_d = {}
+        # DDM endpoint -> set of queue names
+        self.ddm_queue_d = {}
+        # site name -> set of queue names
+        self.site_queue_d = {}
+        # token -> set of queue names
+        self.token_queue_d = {}
+        # token -> DDM object found for that token in DDM topology
+        self.token_ddm_d = {}
+        self.log.debug('Object AGISRegistry created.')
+
+    # -------------------------------------------------------------------------
+
+    def __link(self, index_d, key, qname):
+        index_d.setdefault(key, set()).add(qname)
+
+
+    def __unlink(self, index_d, key, qname):
+        """
+        removes a queue from the set of queues referring to a key
+        :return bool: True if no queue refers to that key anymore
+        """
+        qname_s = index_d.get(key, None)
+        if qname_s is None:
+            return False
+        qname_s.discard(qname)
+        if qname_s:
+            return False
+        del index_d[key]
+        return True
+
+    # -------------------------------------------------------------------------
+
+    def link_ce(self, endpoint, qname):
+        self.__link(self.ce_queue_d, endpoint, qname)
+
+    def unlink_ce(self, endpoint, qname):
+        return self.__unlink(self.ce_queue_d, endpoint, qname)
+
+    def link_ddm(self, endpoint, qname):
+        self.__link(self.ddm_queue_d, endpoint, qname)
+
+    def unlink_ddm(self, endpoint, qname):
+        return self.__unlink(self.ddm_queue_d, endpoint, qname)
+
+    def link_site(self, sitename, qname):
+        self.__link(self.site_queue_d, sitename, qname)
+
+    def unlink_site(self, sitename, qname):
+        return self.__unlink(self.site_queue_d, sitename, qname)
+
+    def link_token(self, token, qname):
+        self.__link(self.token_queue_d, token, qname)
+
+    def unlink_token(self, token, qname):
+        """
+        when no queue uses the token anymore,
+        the DDM object found for it is forgotten too
+        """
+        out = self.__unlink(self.token_queue_d, token, qname)
+        if out:
+            self.token_ddm_d.pop(token, None)
+        return out
+
+    # -------------------------------------------------------------------------
+
+    def queues_for_ce(self, endpoint):
+        """
+        :param str endpoint: the CE endpoint
+        :return set: names of the queues using that CE
+        """
+        return self.ce_queue_d.get(endpoint, frozenset())
+
+    def queues_for_ddm(self, endpoint):
+        """
+        :param str endpoint: the DDM endpoint
+        :return set: names of the queues using that DDM
+        """
+        return self.ddm_queue_d.get(endpoint, frozenset())
+
+    def queues_for_site(self, sitename):
+        """
+        :param str sitename: the site name
+        :return set: names of the queues in that site
+        """
+        return self.site_queue_d.get(sitename, frozenset())
+
+    def queues_for_token(self, token):
+        """
+        :param str token: the space token
+        :return set: names of the queues with that token
+        """
+        return self.token_queue_d.get(token, frozenset())
+
+    # -------------------------------------------------------------------------
+
+    def ddm_for_token(self, token):
+        """
+        :param str token: the space token
+        :return DDM: the DDM object found for that token, or None
+        """
+        return self.token_ddm_d.get(token, None)
+
+    def set_ddm_for_token(self, token, ddm):
+        self.token_ddm_d[token] = ddm
+
+    def forget_token(self, token):
+        """
+        forgets the DDM object found for a token,
+        for example, because its data in DDM topology changed
+        """
+        self.token_ddm_d.pop(token, None)
@@ -7,21 +7,25 @@ import urllib
 import urllib2
 from pprint import pprint as pp
 
-from switcher.switcherexceptions import SwitcherConfigurationFailure
 from switcher.agistopology.cloud import AGISCloud
 from switcher.agistopology.site import AGISSite 
 from switcher.agistopology.queue import AGISQueue 
 from switcher.agistopology.ce import AGISCE, AGISCEHandler
-from switcher.agistopology.ddm import AGISDDM
+from switcher.agistopology.ddm import AGISDDM, get_ddm_endpoints
+from switcher.agistopology.registry import AGISRegistry
 from switcher.downtime import Downtime
-from switcher.utils import load_json
 
 # =============================================================================
 
 class AGISTopology(object):
 
-    def __init__(self, schedconfig, allowed_clouds, allowed_sites, allowed_queues, ddm_topology=None):
+    def __init__(self, schedconfig_data, allowed_clouds, allowed_sites, allowed_queues, ddm_topology_data=None):
         """
+        :param dict schedconfig_data: decoded content of AGIS schedconfig
+        :param AllowedEntities allowed_clouds: clouds to be considered
+        :param AllowedEntities allowed_sites: sites to be considered
+        :param AllowedEntities allowed_queues: queues to be considered
+        :param dict ddm_topology_data: decoded content of AGIS DDM topology
         """
 
         self.log = logging.getLogger('agistopology')
@@ -32,19 +36,169 @@ class AGISTopology(object):
         self.ce_d = {}
         self.ddm_d = {}
 
+        # which queues refer to each CE endpoint, DDM endpoint, site and token
+        self.registry = AGISRegistry()
+        self.ddm_topology_data = None
+        # token -> preferred endpoint in DDM topology
+        self.ddm_endpoint_d = {}
+
         self.allowed_clouds = allowed_clouds
         self.allowed_sites = allowed_sites
         self.allowed_queues = allowed_queues
         # build the topology 
-        self.__build_topology_from_schedconfig(schedconfig)
-        self.__add_ddm_to_topology(ddm_topology)
+        self.__build_topology_from_schedconfig(schedconfig_data)
+        if ddm_topology_data is not None:
+            self.__add_ddm_to_topology(ddm_topology_data)
         self.log.debug('Object Topology created.')
 
     # -------------------------------------------------------------------------
+
+    def update(self, schedconfig_data, ddm_topology_data=None):
+        """
+        updates the topology with the content of schedconfig 
+        and DDM topology for a new cycle.
+        Only the queues that were added, removed or changed 
+        since the previous data are built again, 
+        and only they, or those with a token that changed, 
+        get their DDM endpoint associated again.
+        :param dict schedconfig_data: decoded content of AGIS schedconfig
+        :param dict ddm_topology_data: decoded content of AGIS DDM topology
+        :return bool: True if something changed in the topology
+        """
+        self.log.debug('Starting.')
+        changed_s = set()
+        removed_s = set()
+        token_l = []
+        if schedconfig_data is not self.schedconfig_data:
+            changed_s, removed_s = self.__apply_schedconfig_diff(schedconfig_data)
+
+        if ddm_topology_data is not None:
+            affected_s = set(changed_s)
+            if ddm_topology_data is not self.ddm_topology_data:
+                token_l = self.__diff_keys(self.ddm_topology_data or {}, ddm_topology_data)
+                for token in token_l:
+                    self.registry.forget_token(token)
+                    affected_s.update(self.registry.queues_for_token(token))
+                    self.ddm_endpoint_d.pop(token, None)
+                self.ddm_endpoint_d.update(get_ddm_endpoints(ddm_topology_data, token_l))
+                self.ddm_topology_data = ddm_topology_data
+            for qname in affected_s:
+                queue = self.queue_d.get(qname, None)
+                if queue:
+                    self.__remove_ddm_from_queue(qname, queue)
+                    self.__add_ddm_to_queue(qname, queue)
+        changed = bool(changed_s or removed_s or token_l)
+        self.log.debug('Leaving with output %s.' %changed)
+        return changed
+
+
+    def __diff_keys(self, old_d, new_d):
+        """
+        get the keys that were added, removed or changed
+        between two dictionaries
+        :return list:
+        """
+        out = [key for key in old_d if key not in new_d]
+        for key, value in new_d.items():
+            if key not in old_d or old_d[key] != value:
+                out.append(key)
+        return out
+
+
+    def __apply_schedconfig_diff(self, schedconfig_data):
+        """
+        removes the queues that are not in the new schedconfig, 
+        or which data changed, and builds again the latter.
+        :param dict schedconfig_data: decoded content of AGIS schedconfig
+        :return tuple: set of names of the queues built again, 
+                       and set of names of the queues removed 
+                       and not built again
+        """
+        self.log.debug('Starting.')
+        qname_l = self.__diff_keys(self.schedconfig_data, schedconfig_data)
+        self.log.info('%s queues were added, removed or changed.' %len(qname_l))
+        old_s = set([qname for qname in qname_l if qname in self.queue_d])
+        for qname in qname_l:
+            self.__remove_queue(qname)
+        self.schedconfig_data = schedconfig_data
+        for qname in qname_l:
+            qdata = schedconfig_data.get(qname, None)
+            if qdata is None:
+                continue
+            self.log.info('Processing queue %s' %qname)
+            try:
+                self.__build_topology_queue(qname, qdata)
+            except Exception as ex:
+                self.log.error('Failure processing queue %s: %s' %(qname, ex))
+        built_s = set([qname for qname in qname_l if qname in self.queue_d])
+        self.log.debug('Leaving.')
+        return built_s, old_s - built_s
+
+
+    def __remove_queue(self, qname):
+        """
+        removes a queue from the topology, 
+        together with the CEs, DDMs, sites and clouds 
+        no other queue refers to
+        """
+        queue = self.queue_d.pop(qname, None)
+        if queue is None:
+            return
+        self.log.info('Removing queue %s' %qname)
+        qdata = self.schedconfig_data[qname]
+        site = self.site_d.get(qdata['atlas_site'], None)
+        if site:
+            site.queue_d.pop(qname, None)
+            self.registry.unlink_site(site.name, qname)
+            cloudname = qdata['cloud']
+            cloud = self.cloud_d.get(cloudname, None)
+            # the site stays in the cloud while any queue there belongs to it
+            if cloud and not [x for x in self.registry.queues_for_site(site.name) if self.schedconfig_data[x]['cloud'] == cloudname]:
+                cloud.site_d.pop(site.name, None)
+                if not cloud.site_d:
+                    del self.cloud_d[cloudname]
+            if not site.queue_d:
+                del self.site_d[site.name]
+
+        for ce in queue.cehandler.getlist():
+            if self.registry.unlink_ce(ce.endpoint, qname):
+                self.ce_d.pop(ce.endpoint, None)
+        self.__remove_ddm_from_queue(qname, queue)
+
+
+    def __remove_ddm_from_queue(self, qname, queue):
+        """
+        removes the association between a queue and its DDM endpoints
+        """
+        for ddm in queue.ddmhandler.getlist():
+            queue.ddmhandler.remove(ddm)
+            if self.registry.unlink_ddm(ddm.endpoint, qname):
+                self.ddm_d.pop(ddm.endpoint, None)
+        if queue.token:
+            self.registry.unlink_token(queue.token, qname)
+
+
+    def _reset_queue_status(self, qname, queue):
+        """
+        sets again the status of a queue to the value in schedconfig
+        """
+        queue.status = self.schedconfig_data[qname]['status']
+
+
+    def _reset_ce_state(self, ce):
+        """
+        sets again the state of a CE to the value in schedconfig
+        """
+        for qname in self.registry.queues_for_ce(ce.endpoint):
+            for q in self.schedconfig_data[qname]['queues']:
+                if q['ce_endpoint'] == ce.endpoint:
+                    ce.state = q['ce_state']
+
+    # -------------------------------------------------------------------------
     
     def _get_cloud(self, cloudname):
         self.log.debug('Starting.')
-        if cloudname not in self.cloud_d.keys():
+        if cloudname not in self.cloud_d:
             self.log.info('Instantiating a new Cloud object for %s' %cloudname)
             self.cloud_d[cloudname] = self._getNextCloud(cloudname)
         self.log.debug('Leaving, returning Cloud object for %s.'%cloudname)
@@ -61,7 +215,7 @@ class AGISTopology(object):
 
     def _get_site(self, sitename):
         self.log.debug('Starting.')
-        if sitename not in self.site_d.keys():
+        if sitename not in self.site_d:
             self.log.info('Instantiating a new Site object for %s' %sitename)
             self.site_d[sitename] = self._getNextSite(sitename)
         self.log.debug('Leaving, returning Site object for %s.'%sitename)
@@ -78,7 +232,7 @@ class AGISTopology(object):
 
     def _get_queue(self, qname, panda_resource, qdata):
         self.log.debug('Starting.')
-        if qname not in self.queue_d.keys():
+        if qname not in self.queue_d:
             self.log.info('Instantiating a new Queue object for %s' %qname)
             self.queue_d[qname] = self._getNextQueue(panda_resource, qdata)
         self.log.debug('Leaving, returning Queue object for %s.'%qname)
@@ -95,7 +249,7 @@ class AGISTopology(object):
 
     def _get_ce(self, ce_endpoint):
         self.log.debug('Starting.')
-        if ce_endpoint not in self.ce_d.keys():
+        if ce_endpoint not in self.ce_d:
             self.log.info('Instantiating a new CE object for %s' %ce_endpoint)
             self.ce_d[ce_endpoint] = self._getNextCE(ce_endpoint)
         self.log.debug('Leaving, returning CE object for %s.'%ce_endpoint)
@@ -112,7 +266,7 @@ class AGISTopology(object):
 
     def _get_ddm(self, endpoint):
         self.log.debug('Starting.')
-        if endpoint not in self.ddm_d.keys():
+        if endpoint not in self.ddm_d:
             self.log.info('Instantiating a new DDM object for %s' %endpoint)
             self.ddm_d[endpoint] = self._getNextDDM(endpoint)
         self.log.debug('Leaving, returning DDM object for %s.'%endpoint)
@@ -127,17 +281,13 @@ class AGISTopology(object):
 
     # -------------------------------------------------------------------------
 
-    def __build_topology_from_schedconfig(self, schedconfig):
+    def __build_topology_from_schedconfig(self, schedconfig_data):
         """
         builds the ATLAS topology from AGIS schedconfig
+        :param dict schedconfig_data: decoded content of AGIS schedconfig
         """
         self.log.debug('Starting.')
-        try:
-            self.schedconfig_data = load_json(schedconfig)
-        except Exception as ex:
-            self.log.critical('Unable to read queues configuration from src. Exception: %s' %ex)
-            raise SwitcherConfigurationFailure(schedconfig, ex)
-               
+        self.schedconfig_data = schedconfig_data
         for qname, qdata in self.schedconfig_data.items():
             self.log.info('Processing queue %s' %qname)
             try:
@@ -165,6 +315,7 @@ class AGISTopology(object):
                 queue = self.__build_queue(qname, qdata)
                 if queue:
                     site.queue_d[qname] = queue
+                    self.registry.link_site(site.name, qname)
 
 
     def __build_cloud(self, qdata):
@@ -218,6 +369,7 @@ class AGISTopology(object):
                 ce_endpoint = q['ce_endpoint']
                 self.log.info('Processing ce %s' %ce_endpoint)
                 ce = self._get_ce(ce_endpoint)
+                self.registry.link_ce(ce_endpoint, qname)
     
                 #queue.ce_d[ce_endpoint] = ce
                 #queue.cehandler.add(ce)
@@ -230,110 +382,79 @@ class AGISTopology(object):
 
 
 
-    def __add_ddm_to_topology(self, ddm_topology):
+    def __add_ddm_to_topology(self, ddm_topology_data):
         """
         Add DDM Endpoints to the topology
         Steps:
-            for each queue:
-                1. find the space token
-                2. check if that token is in DDM Topology
-                3. if token is in DDM Topology:
-                    3.1 check if there is an endpoint in 
-                        write_lan block for that token
-                    3.2 if not, check if there is an endpoint 
-                        in write_wan block for that token
-                4. associate whatever endpoint found
-                   to the queue
+            1. find the preferred endpoint for each token in DDM Topology,
+               in a single pass: 
+               the one in write_lan block for that token or, if there is none,
+               the one in write_wan block
+            2. index the queues by their space token
+            3. for each token, create the DDM object for its endpoint once
+               and associate it to all queues with that token
+        :param dict ddm_topology_data: decoded content of AGIS DDM topology
         """
         self.log.debug('Starting.')
-        try:
-            ddm_topology_data = load_json(ddm_topology)
-        except Exception as ex:
-            self.log.critical('Unable to read ddm configuration from src. Exception: %s' %ex)
-            raise SwitcherConfigurationFailure(ddm_topology, ex)
-        for queue in self.queue_d.values():
-            self.__add_ddm_to_queue(queue, ddm_topology_data)
+        self.ddm_topology_data = ddm_topology_data
+        self.ddm_endpoint_d = get_ddm_endpoints(ddm_topology_data)   # step 1.
+        for qname, queue in self.queue_d.items():                    # step 2.
+            if queue.token:
+                self.registry.link_token(queue.token, qname)
+            else:
+                self.log.info('Queue %s has no token. Skipping.' %qname)
+        for token, qname_s in self.registry.token_queue_d.items():   # step 3.
+            self.__add_ddm_to_queues(token, qname_s)
         self.log.debug('Leaving.')
 
 
-    def __add_ddm_to_queue(self, queue, ddm_topology_data):
+    def __add_ddm_to_queue(self, qname, queue):
         """
         add ddm endpoints to a given queue
         """
-        self.log.debug('Processing queue %s' %queue.name)
-        token = self.__find_token(queue, ddm_topology_data)       # step 1. & 2.
-        if not token:
-            return
-        endpoint = self.__find_endpoint(token, ddm_topology_data) # step 3.
-        if not endpoint:
-            return
-        self.__associate_ddm_to_queue(queue, token, endpoint)     # step 4.
-        self.log.debug('Leaving.')
-
-
-    def __find_token(self, queue, ddm_topology_data):
-        """
-        find if the queue has a spacetoken
-        """
         if not queue.token:
-            self.log.info('Queue %s has no token. Skipping.' %queue.name)
-            return None
-
-        token = queue.token
-        self.log.info('Token for queue %s is %s' %(queue.name, token))
-
-        # step 2.
-        if token not in ddm_topology_data.keys():
-            self.log.info('Token %s is not in DDM endpoints source. Skipping.' %token)
-            return None
-
-        return token
+            self.log.info('Queue %s has no token. Skipping.' %qname)
+            return
+        self.registry.link_token(queue.token, qname)
+        self.__add_ddm_to_queues(queue.token, [qname])
 
 
-    def __find_endpoint(self, token, ddm_topology_data):
+    def __add_ddm_to_queues(self, token, qname_l):
         """
-        find if there is a valid endpoint
+        set the DDM object for the endpoint of a token 
+        to a list of queues with that token.
+        The DDM object is found only once per token.
         """
-
-        data = ddm_topology_data[token]
-        arprotocols = data['arprotocols']
-        if 'write_lan' in arprotocols.keys():
-            endpoint = arprotocols['write_lan'][0]['endpoint']
-            self.log.info('Endpoint from write_lan: %s' %endpoint)
-            return endpoint
-        elif 'write_wan' in arprotocols.keys():
-            endpoint = arprotocols['write_wan'][0]['endpoint']
-            self.log.info('Endpoint from write_wan: %s' %endpoint)
-            return endpoint
-        else:
-            self.log.info('There is neither write_lan nor write_wan section in "arprotocols" for token %s.' %token)
-            return None 
+        endpoint = self.ddm_endpoint_d.get(token, None)
+        if endpoint is None:
+            self.log.info('There is no endpoint for token %s in DDM endpoints source. Skipping.' %token)
+            return
+        ddm = self.registry.ddm_for_token(token)
+        if ddm is None:
+            ddm = self._get_ddm(endpoint)
+            self.registry.set_ddm_for_token(token, ddm)
+        ddm.token = token
+        for qname in qname_l:
+            self.__add_ddm_object_to_queue(qname, self.queue_d[qname], ddm)
 
 
-    def __associate_ddm_to_queue(self, queue, token, endpoint):
+    def __add_ddm_object_to_queue(self, qname, queue, ddm):
         """
-        set the DDM object for queue
+        adds an already existing DDM object to a queue
         """
-        ddm = self._get_ddm(endpoint)
-        ddm.token = token
-        self.ddm_d[endpoint] = ddm
+        self.registry.link_ddm(ddm.endpoint, qname)
         ###queue.ddm = ddm
         queue.add_ddm(ddm)
 
 
     # --------------------------------------------------------------------------
 
-    def add_nucleus(self, sites):
+    def add_nucleus(self, data):
         """
         checks which site is a nucleus and which one is not
+        :param list data: decoded content of AGIS sites
         """
         self.log.debug('Starting.')
-        try:
-            data = load_json(sites)
-        except Exception as ex:
-            self.log.critical('Unable to read sites configuration from src. Exception: %s' %ex)
-            raise SwitcherConfigurationFailure(sites, ex)
-
         for siteinfo in data:
             sitename = siteinfo['name']
             if 'Nucleus' in siteinfo['datapolicies']:
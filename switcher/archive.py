@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+import Queue
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+class RawDocument(object):
+    """
+    class to keep the bytes of an input, as they were read,
+    before being decoded, until they are archived.
+    They are kept in an anonymous temporary file,
+    removed as soon as the document is archived, 
+    or when this object is not used any longer.
+    Once archived, the hash of the document is kept instead,
+    so the same document used in several cycles is archived only once.
+    """
+
+    def __init__(self, tmpdir=None):
+        """
+        :param str tmpdir: directory for the temporary file
+        """
+        self.f = tempfile.TemporaryFile(dir=tmpdir)
+        self.key = None
+
+
+    def write(self, data):
+        self.f.write(data)
+
+
+    def seek(self, offset):
+        self.f.seek(offset)
+
+
+    def truncate(self):
+        self.f.truncate()
+
+
+    def chunks(self, chunk_size=65536):
+        """
+        iterates over the content, from the beginning
+        """
+        self.f.seek(0)
+        while True:
+            chunk = self.f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+class Archive(object):
+    """
+    class implementing a content-addressed archive
+    of the inputs read on each cycle, byte by byte as they were read.
+    Each document is stored once, compressed,
+    under the SHA1 hash of its content:
+
+        <archivedir>/objects/<2 first chars of hash>/<hash>.json.gz
+
+    and each cycle gets a small manifest, with the hash of each input:
+
+        <archivedir>/manifests/<YYYY-MM-DD>/<YYYYMMDDTHHMMSS.ffffff>.json
+
+    so identical documents in different cycles cost no extra disk.
+    The documents are copied to a RawDocument while they are read,
+    see spool(). Hashing and compressing them is done by a background thread,
+    so it adds no latency to the cycle. 
+    Nothing is serialized again from the decoded data.
+    """
+
+    def __init__(self, archivedir, maxsize=4):
+        """
+        :param str archivedir: root directory of the archive
+        :param int maxsize: max number of cycles waiting to be archived.
+                            When the thread can not keep up,
+                            new cycles are not archived.
+        """
+        self.log = logging.getLogger('archive')
+        self.archivedir = os.path.expanduser(archivedir)
+        for subdir in ['objects', 'manifests', 'tmp']:
+            path = os.path.join(self.archivedir, subdir)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        self.queue = Queue.Queue(maxsize)
+        self.thread = threading.Thread(target=self._work, name='archive')
+        self.thread.daemon = True
+        self.thread.start()
+        self.log.debug('Object Archive created for directory %s.' %self.archivedir)
+
+
+    def spool(self):
+        """
+        get an object to copy an input into while it is read.
+        See switcher.utils.load_json()
+        :return RawDocument:
+        """
+        return RawDocument(os.path.join(self.archivedir, 'tmp'))
+
+
+    def submit(self, raw_d, source_d, cycle_t=None):
+        """
+        queues the inputs of a cycle to be archived.
+        It does not block.
+        :param dict raw_d: the RawDocument for each input name
+        :param dict source_d: the path or URL for each input name
+        :param float cycle_t: time of the cycle, in seconds since epoch
+        """
+        if cycle_t is None:
+            cycle_t = time.time()
+        try:
+            self.queue.put_nowait((cycle_t, raw_d, source_d))
+        except Queue.Full:
+            self.log.warning('Archive is busy. Inputs for this cycle are not archived.')
+
+
+    def join(self):
+        """
+        waits until all cycles submitted are archived
+        """
+        self.queue.join()
+
+
+    def _work(self):
+        while True:
+            cycle_t, raw_d, source_d = self.queue.get()
+            try:
+                self._archive(cycle_t, raw_d, source_d)
+            except Exception as ex:
+                self.log.error('Unable to archive inputs: %s' %ex)
+            finally:
+                self.queue.task_done()
+
+    # -------------------------------------------------------------------------
+
+    def _archive(self, cycle_t, raw_d, source_d):
+        """
+        stores the documents of a cycle, and its manifest
+        """
+        self.log.debug('Starting.')
+        manifest_d = {'time': cycle_t,
+                      'inputs': {},
+                     }
+        for name, raw in raw_d.items():
+            if raw is None:
+                self.log.warning('No document to archive for input %s.' %name)
+                continue
+            manifest_d['inputs'][name] = {'source': source_d.get(name),
+                                          'hash': self._store(name, raw),
+                                         }
+        self._write(self.manifest_path(cycle_t), json.dumps(manifest_d, indent=1, sort_keys=True))
+        self.log.info('Inputs archived with manifest %s.' %self.manifest_path(cycle_t))
+
+
+    def manifest_path(self, cycle_t):
+        """
+        :param float cycle_t: time of the cycle, in seconds since epoch
+        :return str: the path to the manifest for that cycle
+        """
+        stamp = time.gmtime(cycle_t)
+        return os.path.join(self.archivedir,
+                            'manifests',
+                            time.strftime('%Y-%m-%d', stamp),
+                            '%s.%06d.json' %(time.strftime('%Y%m%dT%H%M%S', stamp), 
+                                             int(cycle_t % 1 * 1e6)))
+
+
+    def _store(self, name, raw):
+        """
+        stores a single document, unless it is already in the archive
+        :param str name: the name of the input
+        :param RawDocument raw: the document, as it was read
+        :return str: the hash of the document
+        """
+        if raw.key is not None:
+            return raw.key
+        sha1 = hashlib.sha1()
+        for chunk in raw.chunks():
+            sha1.update(chunk)
+        key = sha1.hexdigest()
+        path = self.path(key)
+        if os.path.isfile(path):
+            self.log.debug('Document for %s already in the archive as %s.' %(name, key))
+        else:
+            self._write(path, raw.chunks(), compress=True)
+        raw.key = key
+        raw.close()
+        return key
+
+
+    def path(self, key):
+        """
+        :param str key: the hash of a document
+        :return str: the path to the document in the archive
+        """
+        return os.path.join(self.archivedir, 'objects', key[:2], '%s.json.gz' %key)
+
+
+    def _write(self, path, content, compress=False):
+        """
+        files are written first to a temporary path and renamed,
+        so a partially written file is never used.
+        :param str content: the content, or an iterator over its chunks
+        """
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        tmppath = '%s.tmp' %path
+        if compress:
+            f = gzip.open(tmppath, 'wb')
+        else:
+            f = open(tmppath, 'w')
+        try:
+            if isinstance(content, str):
+                content = [content]
+            for chunk in content:
+                f.write(chunk)
+        finally:
+            f.close()
+        os.rename(tmppath, path)
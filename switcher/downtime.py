@@ -1,17 +1,26 @@
 #!/usr/bin/env python
 
-import copy
 import logging
+from bisect import bisect_left, bisect_right
 
 from switcher.utils import timeconverter2seconds
 from switcher.timeinterval import TimeInterval
 
 
+log = logging.getLogger('downtime')
+
+
 class Downtime(object):
     """
-    class representing an scheduled downtime event 
+    class representing an scheduled downtime event.
+    There is one per endpoint in the calendar, plus the copies made by extend(),
+    so it uses __slots__ and the module logger.
     """
 
+    __slots__ = ('endpoint', 'start_t_str', 'end_t_str', 'timeinterval', 
+                 'description', 'classification', 'type', 'site', 'name', 
+                 'info_url', 'severity')
+
     def __init__(self, endpoint, start_t_str, end_t_str, description, classification, type, site, name, info_url, severity):
         """
         :param str endpoint: the endpoint affected by the downtime
@@ -23,10 +32,6 @@ class Downtime(object):
         :param str info_url: the URL from the EGI portal
         :param str severity: the severity level 
         """
-        self.log = logging.getLogger('downtime')
-        self.log.debug('Downtime event created with inputs %s, %s, %s, %s, %s, %s, %s, %s, %s, %s' 
-                        %(endpoint, start_t_str, end_t_str, description, classification, type, site, name, info_url, severity)
-                      )
         self.endpoint = endpoint
 
         self.start_t_str = start_t_str
@@ -42,7 +47,6 @@ class Downtime(object):
         self.name = name
         self.info_url = info_url
         self.severity = severity
-        self.log.debug('Object Downtime for %s created.' %endpoint)
 
 
    # --------------------------------------------------------------------------
@@ -98,7 +102,9 @@ class Downtime(object):
         returns a copy of this Downtime object
         with an extended TimeInterval
         """
-        newdowntime = copy.copy(self)
+        newdowntime = self.__class__.__new__(self.__class__)
+        for name in Downtime.__slots__:
+            setattr(newdowntime, name, getattr(self, name))
         newdowntime.timeinterval = self.timeinterval.extend(extra)
         return newdowntime
 
@@ -115,14 +121,28 @@ class Downtime(object):
 # =============================================================================
 
 
-class EndpointDowntimes(object):
+class DowntimeCalendar(object):
     """
-    container for a list of Downtime objects.
-    For example, to handle together all Downtimes for a given CE object.
+    container for a list of Downtime objects, indexed by time.
+    The index is built on the first query after Downtimes are added:
+        -- the start times, sorted, 
+           with the latest end time among the Downtimes started so far,
+           and the first Downtime added among them, 
+        -- the end times, sorted.
+    so each query costs log(n), using bisect.
+    Building the index costs n log(n), so it only pays off 
+    when the same Downtimes are queried many times, 
+    like all the Downtimes of a cycle. 
+    A few queries are better answered looking at the list.
+    In the topology, only next_change_time() queries it.
+    The checks of each CE and DDM scan their own short lists.
     """
-    def __init__(self):
-        self.log = logging.getLogger('downtime')
-        self.downtime_l = []
+    def __init__(self, downtime_l=None):
+        """
+        :param list downtime_l: initial list of Downtime objects
+        """
+        self.downtime_l = list(downtime_l or [])
+        self.index = None
 
 
     def add(self, downtime):
@@ -130,16 +150,122 @@ class EndpointDowntimes(object):
         :param Downtime downtime:
         """
         self.downtime_l.append(downtime)
+        self.index = None
 
 
     def getlist(self):
         """
-        return the list of Downtime objects for this Endpoint
+        return the list of Downtime objects, in the order they were added
         :return list of Downtime:
         """
         return self.downtime_l
 
 
+    def __get_index(self):
+        if self.index is None:
+            order_l = sorted(range(len(self.downtime_l)), key=lambda i: self.downtime_l[i].timeinterval.start_t)
+            start_l = []
+            maxend_l = []
+            first_l = []
+            for i in order_l:
+                timeinterval = self.downtime_l[i].timeinterval
+                start_l.append(timeinterval.start_t)
+                if maxend_l:
+                    maxend_l.append(max(maxend_l[-1], timeinterval.end_t))
+                    first_l.append(min(first_l[-1], i))
+                else:
+                    maxend_l.append(timeinterval.end_t)
+                    first_l.append(i)
+            end_l = sorted([downtime.timeinterval.end_t for downtime in self.downtime_l])
+            self.index = (start_l, maxend_l, first_l, end_l)
+        return self.index
+
+
+    def is_active(self, from_t, until_t):
+        """
+        checks if there is any Downtime starting no later than until_t 
+        and ending after from_t.
+        With from_t = until_t, it checks if any Downtime covers that time.
+        :param int from_t: seconds since epoch
+        :param int until_t: seconds since epoch
+        :return bool:
+        """
+        start_l, maxend_l, first_l, end_l = self.__get_index()
+        n = bisect_right(start_l, until_t)
+        return n > 0 and maxend_l[n - 1] > from_t
+
+
+    def first_started(self, t_epoch):
+        """
+        get the first Downtime added among those already started at t_epoch, 
+        either still going on or already finished, 
+        but not finishing exactly at t_epoch.
+        :param int t_epoch: seconds since epoch
+        :return Downtime/None:
+        """
+        start_l, maxend_l, first_l, end_l = self.__get_index()
+        n = bisect_right(start_l, t_epoch)
+        if n == 0:
+            return None
+        downtime = self.downtime_l[first_l[n - 1]]
+        if downtime.timeinterval.end_t != t_epoch:
+            return downtime
+        # unlikely, so it is fine to look at all of them
+        for downtime in self.downtime_l:
+            timeinterval = downtime.timeinterval
+            if timeinterval.start_t <= t_epoch and timeinterval.end_t != t_epoch:
+                return downtime
+        return None
+
+
+    def next_start(self, t_epoch):
+        """
+        get the earliest start time not before t_epoch
+        :param float t_epoch: seconds since epoch
+        :return int/None:
+        """
+        start_l, maxend_l, first_l, end_l = self.__get_index()
+        n = bisect_left(start_l, t_epoch)
+        if n < len(start_l):
+            return start_l[n]
+        return None
+
+
+    def next_end(self, t_epoch):
+        """
+        get the earliest end time not before t_epoch
+        :param float t_epoch: seconds since epoch
+        :return int/None:
+        """
+        start_l, maxend_l, first_l, end_l = self.__get_index()
+        n = bisect_left(end_l, t_epoch)
+        if n < len(end_l):
+            return end_l[n]
+        return None
+
+
+    def get_mask(self, timeline, extend_sec=0):
+        """
+        get the bitmap of the times covered by any Downtime.
+        :param Timeline timeline:
+        :param int extend_sec: number of seconds to advance the start times,
+                               as in extend(), without creating new Downtimes
+        :return int:
+        """
+        mask = 0
+        for downtime in self.downtime_l:
+            timeinterval = downtime.timeinterval
+            mask |= timeline.mask(timeinterval.start_t - extend_sec, timeinterval.end_t)
+        return mask
+
+
+class EndpointDowntimes(DowntimeCalendar):
+    """
+    container for a list of Downtime objects.
+    For example, to handle together all Downtimes for a given CE object.
+    """
+
+
     def extend(self, extend_sec):
         """
         returns a new EndpointDowntimes, where all Downtimes
@@ -147,13 +273,13 @@ class EndpointDowntimes(object):
         :param int extend_sec: number of seconds to advance the start time
         :return EndpointDowntimes:
         """
-        self.log.debug('Starting.')
+        log.debug('Starting.')
         newendpointdowntimes = EndpointDowntimes()
         for downtime in self.getlist():
             newdowntime = downtime.extend(extend_sec)
             newendpointdowntimes.add(newdowntime)
         out = newendpointdowntimes
-        self.log.debug('Leaving, returing %s.' %out)
+        log.debug('Leaving, returing %s.' %out)
         return out
 
 
@@ -187,9 +313,13 @@ class OverlapDowntimes(object):
     container for a list of overlapping Downtime objects.
     For example, to handle together all Downtimes from CE objects with overlapping TimeIntervals.
     """
-    def __init__(self):
-        self.downtime_l = []
-        self.timeinterval = None # overlapping TimeInterval
+    def __init__(self, downtime_l=None, timeinterval=None):
+        """
+        :param list downtime_l: Downtime objects already known to overlap
+        :param TimeInterval timeinterval: their overlapping TimeInterval
+        """
+        self.downtime_l = downtime_l or []
+        self.timeinterval = timeinterval # overlapping TimeInterval
 
 
     def getlist(self):
@@ -276,8 +406,8 @@ class OverlapDowntimesList(object):
         for collection in self.overlapdowntimes_l:
             for downtime in endpointdowntimes.getlist():
                 if collection.overlap(downtime):
-                    #newcollection = copy.deepcopy(collection)
-                    newcollection = copy.copy(collection)
+                    # the list of Downtimes is not shared with the original
+                    newcollection = OverlapDowntimes(list(collection.getlist()), collection.getTimeInterval())
                     newcollection.add(downtime)
                     newcollection_l.append(newcollection)
 
@@ -327,22 +457,71 @@ class EndpointDowntimesSet(object):
     def getOverlapDowntimesList(self):
         """
         calculates all overlappings between all EndpointDowntimes objects, 
-        and returns the list of OverlapDowntimes 
+        and returns the list of OverlapDowntimes:
+        one for each combination of one Downtime per endpoint 
+        with a common TimeInterval, in the same order 
+        as overlapping the endpoints one after the other would give.
+
+        Each combination is found from its Downtime starting the latest,
+        with the Downtimes of the other endpoints in progress at that time,
+        so combinations with no common TimeInterval are never built.
+        The cost grows with the total number of Downtimes, 
+        and with the number of overlappings, 
+        and not with the number of all possible combinations.
         :return OverlapDowntimesList:
         """
-        if len(self.endpointdowntimes_l) == 0:
-            return OverlapDowntimesList()
+        out = OverlapDowntimesList()
+        nendpoints = len(self.endpointdowntimes_l)
+        if nendpoints == 0:
+            return out
 
-        if len(self.endpointdowntimes_l) == 1:
-            out = OverlapDowntimesList()
+        if nendpoints == 1:
             for d in self.endpointdowntimes_l[0].getlist():
                 coll = OverlapDowntimes()
                 coll.add(d)
                 out.add(coll)
             return out
 
-        if len(self.endpointdowntimes_l) >= 2:
-            return reduce(lambda x,y: x.overlap(y), self.endpointdowntimes_l) 
+        # (start time, endpoint, position, Downtime), sorted.
+        # The key also breaks ties between Downtimes starting at the same time
+        start_l = []
+        for index, endpointdowntimes in enumerate(self.endpointdowntimes_l):
+            for position, downtime in enumerate(endpointdowntimes.getlist()):
+                start_l.append((downtime.getTimeInterval().start_t, index, position, downtime))
+        start_l.sort(key=lambda item: item[:3])
+
+        started_l = [[] for index in range(nendpoints)]   # (position, Downtime) started so far
+        combination_l = []                                # (positions, Downtimes)
+        for start_t, index, position, downtime in start_l:
+            if downtime.getTimeInterval().end_t > start_t:
+                # the Downtimes finished already will not overlap with any other
+                for other in range(nendpoints):
+                    if other != index:
+                        started_l[other] = [item for item in started_l[other] if item[1].getTimeInterval().end_t > start_t]
+                choice_l = [started_l[other] if other != index else [(position, downtime)] for other in range(nendpoints)]
+                combination_l.extend(self.__combine(choice_l))
+            started_l[index].append((position, downtime))
+
+        combination_l.sort(key=lambda combination: combination[0])
+        for position_l, downtime_l in combination_l:
+            start_t = max([downtime.getTimeInterval().start_t for downtime in downtime_l])
+            end_t = min([downtime.getTimeInterval().end_t for downtime in downtime_l])
+            out.add(OverlapDowntimes(downtime_l, TimeInterval(start_t, end_t)))
+        return out
+
+
+    def __combine(self, choice_l):
+        """
+        all combinations of one item from each list
+        :param list choice_l: for each endpoint, a list of (position, Downtime)
+        :return list: (tuple of positions, list of Downtimes)
+        """
+        combination_l = [((), [])]
+        for item_l in choice_l:
+            combination_l = [(position_l + (position,), downtime_l + [downtime]) 
+                             for position_l, downtime_l in combination_l
+                             for position, downtime in item_l]
+        return combination_l
 
 
 # =============================================================================
@@ -408,7 +587,6 @@ def get_downtimes(data):
     :param json data: the json dump from the AGIS Downtime Calendar
     :return list:
     """
-    log = logging.getLogger('downtime')
     log.debug('Starting.')
     downtime_l = []
 
@@ -9,8 +9,13 @@ class Event(object):
     Having the need for a status change recorded can server several purposes:
         -- the change can be performed
         -- all changes can be collected and reported (by email, for example)
+    There may be one instance per CE and Queue, so they have no __dict__.
     """
 
+    __slots__ = ('entitytype', 'uid', 'old_status', 'new_status', 
+                 'start', 'end', 'timeinterval', 'downtime', 
+                 'overlap_downtimes', 'message', 'comment', 'done')
+
     def __init__(self, entitytype, 
                        uid, 
                        old_status=None, 
@@ -56,6 +61,8 @@ class Event(object):
 
 class QueueEvent(Event):
 
+    __slots__ = ('queue_final_status',)
+
     def __init__(self, *k, **kw):
         super(QueueEvent, self).__init__(*k, **kw)
         self.queue_final_status = None
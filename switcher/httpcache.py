@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from switcher.services.httpclient import decompress
+from switcher.utils import decode_json, open_url
+
+
+class HTTPCache(object):
+    """
+    class implementing an on-disk cache for JSON documents
+    downloaded over HTTP.
+    For each URL, the body of the last answer is stored on disk,
+    together with the validators (ETag and Last-Modified) sent by the server.
+    Those validators are sent back on the next request
+    (as If-None-Match and If-Modified-Since),
+    so if the document did not change the server answers 304,
+    and the decoded object from the previous download is reused,
+    with no need to download and parse the document again.
+    The body is written to disk while it is being downloaded,
+    and decoded afterwards from the file, 
+    so it is never fully held in memory.
+    The document can also be copied, as it was sent, 
+    for example to be archived. 
+    When it did not change, the copy is made from the cached body.
+    Bodies are kept compressed on disk: as sent by the server
+    when it used gzip or deflate, or compressed with gzip otherwise.
+    """
+
+    def __init__(self, cachedir):
+        """
+        :param str cachedir: directory where to store the documents
+        """
+        self.log = logging.getLogger('httpcache')
+        self.cachedir = os.path.expanduser(cachedir)
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+        # decoded objects, indexed by the key for each URL
+        self.data_d = {}
+        self.lock = threading.Lock()
+        self.log.debug('Object HTTPCache created for directory %s.' %self.cachedir)
+
+
+    def load_json(self, url, projection=None, timeout=None, client=None, copy_to=None):
+        """
+        get the decoded json data for a given URL,
+        using a conditional GET when there is a cached copy
+        :param str url: the URL
+        :param projection: fields to keep from each record, or None
+        :param tuple timeout: (connect, read) timeouts, in seconds, or None
+        :param HTTPClient client: pool of persistent connections
+        :param file copy_to: optional file-like object where 
+                             the decompressed document is copied
+        :return: the decoded json data
+        """
+        self.log.debug('Starting for url %s' %url)
+        key = self._key(url)
+        validators = self._get_validators(key)
+        response = open_url(url, timeout, validators, client, expected=(200, 304), decode=False)
+        if response.status == 304:
+            response.close()
+            data = self._get_data(key, projection)
+            if data is not None and\
+               (copy_to is None or self._copy_body(key, copy_to)):
+                self.log.info('Document from %s did not change. Using cached copy.' %url)
+                return data
+            # the server says nothing changed, but there is no usable copy
+            self.log.warning('Cached copy for %s is not usable. Downloading it again.' %url)
+            self._remove(key)
+            response = open_url(url, timeout, client=client, decode=False)
+
+        meta_d = {'url': url,
+                  'etag': response.getheader('ETag'),
+                  'last_modified': response.getheader('Last-Modified'),
+                  'encoding': response.getheader('Content-Encoding'),
+                 }
+        tmppath = self._spool(key, response, meta_d)
+        try:
+            data = decode_json(decompress(open(tmppath, 'rb'), meta_d['encoding']), projection, copy_to)
+            self._store(key, tmppath, meta_d, data)
+        finally:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+        self.log.debug('Leaving.')
+        return data
+
+    # -------------------------------------------------------------------------
+
+    def _key(self, url):
+        return hashlib.sha1(url).hexdigest()
+
+
+    def _path(self, key, ext):
+        return os.path.join(self.cachedir, '%s.%s' %(key, ext))
+
+
+    def _get_meta(self, key):
+        """
+        get the metadata recorded with a cached body
+        :return dict: the metadata, or None
+        """
+        if not os.path.isfile(self._path(key, 'body')):
+            return None
+        try:
+            return json.load(open(self._path(key, 'meta')))
+        except Exception:
+            return None
+
+
+    def _get_validators(self, key):
+        """
+        get the headers to be sent for a conditional GET.
+        They are only sent if there is a cached body to fall back on.
+        :return dict:
+        """
+        headers = {}
+        meta_d = self._get_meta(key)
+        if meta_d is None:
+            return headers
+        if meta_d.get('etag'):
+            headers['If-None-Match'] = meta_d['etag']
+        if meta_d.get('last_modified'):
+            headers['If-Modified-Since'] = meta_d['last_modified']
+        return headers
+
+
+    def _get_data(self, key, projection=None):
+        """
+        get the decoded object for a given key,
+        from memory or, after a restart, from the cached body on disk
+        :return: decoded json data, or None
+        """
+        with self.lock:
+            data = self.data_d.get(key, None)
+        if data is not None:
+            return data
+        meta_d = self._get_meta(key)
+        if meta_d is None:
+            return None
+        try:
+            body = decompress(open(self._path(key, 'body'), 'rb'), meta_d.get('encoding'))
+            data = decode_json(body, projection)
+        except Exception as ex:
+            self.log.warning('Unable to read cached body for key %s: %s' %(key, ex))
+            return None
+        with self.lock:
+            self.data_d[key] = data
+        return data
+
+
+    def _copy_body(self, key, copy_to, chunk_size=65536):
+        """
+        copies the decompressed cached body for a given key
+        :return bool: True if the copy was done
+        """
+        meta_d = self._get_meta(key)
+        if meta_d is None:
+            return False
+        copy_to.seek(0)
+        copy_to.truncate()
+        try:
+            body = decompress(open(self._path(key, 'body'), 'rb'), meta_d.get('encoding'))
+            try:
+                while True:
+                    chunk = body.read(chunk_size)
+                    if not chunk:
+                        break
+                    copy_to.write(chunk)
+            finally:
+                body.close()
+        except Exception as ex:
+            self.log.warning('Unable to read cached body for key %s: %s' %(key, ex))
+            return False
+        return True
+
+
+    def _spool(self, key, response, meta_d, chunk_size=65536):
+        """
+        writes the body of an HTTP answer to a temporary file, 
+        chunk by chunk.
+        If the server did not compress it, it is compressed with gzip,
+        and the encoding in the metadata is updated accordingly.
+        :return str: the path to the temporary file
+        """
+        tmppath = '%s.tmp' %self._path(key, 'body')
+        if meta_d['encoding'] in [None, 'identity']:
+            meta_d['encoding'] = 'gzip'
+            f = gzip.open(tmppath, 'wb')
+        else:
+            f = open(tmppath, 'wb')
+        try:
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+        finally:
+            f.close()
+            response.close()
+        return tmppath
+
+
+    def _store(self, key, bodypath, meta_d, data):
+        """
+        records a new document, on disk and in memory.
+        Files are written first to a temporary path and renamed,
+        so a partially written file is never used.
+        :param str bodypath: temporary file with the downloaded body
+        """
+        if not meta_d['etag'] and not meta_d['last_modified']:
+            self.log.debug('No validators for %s. Not caching it.' %meta_d['url'])
+            return
+        with self.lock:
+            self.data_d[key] = data
+        try:
+            os.rename(bodypath, self._path(key, 'body'))
+            self._write(self._path(key, 'meta'), json.dumps(meta_d))
+        except Exception as ex:
+            self.log.warning('Unable to cache document from %s: %s' %(meta_d['url'], ex))
+
+
+    def _write(self, path, content):
+        tmppath = '%s.tmp' %path
+        f = open(tmppath, 'w')
+        try:
+            f.write(content)
+        finally:
+            f.close()
+        os.rename(tmppath, path)
+
+
+    def _remove(self, key):
+        with self.lock:
+            self.data_d.pop(key, None)
+        for ext in ['body', 'meta']:
+            try:
+                os.remove(self._path(key, ext))
+            except OSError:
+                pass
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+"""
+streaming ingestion of large json documents.
+
+Instead of decoding the whole document at once,
+the top level container (a dictionary or a list) is read
+one record at a time, and only the fields that are needed
+are kept from each record (a projection).
+That way, peak memory grows with what Switcher really uses,
+and not with the size of the whole AGIS document.
+
+A projection is a nested structure describing the fields to keep:
+    -- None means keep the whole value
+    -- a dictionary {key: projection} means keep only those keys
+    -- a list with a single projection [projection] means
+       apply that projection to each item of a list
+
+The projection for the top level container can also be a Select object,
+to drop whole records as soon as they are decoded,
+before they are projected or stored.
+"""
+
+import json
+
+from json.decoder import WHITESPACE
+
+
+# =============================================================================
+#   projections for the AGIS sources
+# =============================================================================
+
+SCHEDCONFIG = {'vo_name': None,
+               'cloud': None,
+               'atlas_site': None,
+               'panda_resource': None,
+               'probe': None,
+               'status': None,
+               'tier_level': None,
+               'type': None,
+               'astorages': {'write_lan': None},
+               'queues': [{'ce_name': None,
+                           'ce_endpoint': None,
+                           'ce_state': None,
+                          }],
+              }
+
+SCHEDCONFIG_STATUS = {'status': None}
+
+DDMTOPOLOGY = {'arprotocols': {'write_lan': [{'endpoint': None}],
+                               'write_wan': [{'endpoint': None}],
+                              },
+              }
+
+SITES = {'name': None,
+         'datapolicies': None,
+        }
+
+
+# =============================================================================
+
+class Select(object):
+    """
+    projection for the top level container of a document,
+    keeping only the records accepted by a function.
+    """
+
+    def __init__(self, accept, projection=None):
+        """
+        :param accept: function called with (key, value) for each record,
+                       or (index, value) for a list,
+                       returning True if the record is kept
+        :param projection: the projection for each record kept
+        """
+        self.accept = accept
+        self.projection = projection
+
+
+def project(value, projection):
+    """
+    keeps only the fields of a decoded json value
+    described by a projection.
+    Missing keys are just not included in the output.
+    :param value: the decoded json value
+    :param projection: the projection to apply
+    :return: the projected value
+    """
+    if projection is None:
+        return value
+    if isinstance(projection, dict) and isinstance(value, dict):
+        out = {}
+        for key, subprojection in projection.items():
+            if key in value:
+                out[key] = project(value[key], subprojection)
+        return out
+    if isinstance(projection, list) and isinstance(value, list):
+        return [project(item, projection[0]) for item in value]
+    return value
+
+
+def load_projected(f, projection):
+    """
+    decodes a json document, one record at a time,
+    keeping only the fields in the projection
+    :param file f: file-like object with the json document
+    :param projection: the projection for each record, or a Select object
+    :return dict or list: same type that the top level container
+    """
+    accept = None
+    if isinstance(projection, Select):
+        accept = projection.accept
+        projection = projection.projection
+    records = JSONRecords(f)
+    container = records.container
+    if accept is not None:
+        records = ((key, value) for key, value in records if accept(key, value))
+    if container is list:
+        return [project(value, projection) for index, value in records]
+    out = {}
+    for key, value in records:
+        out[key] = project(value, projection)
+    return out
+
+
+class JSONRecords(object):
+    """
+    incremental parser for the top level container of a json document.
+    Iterating over it yields pairs (key, value) for a dictionary,
+    or pairs (index, value) for a list.
+    Only the bytes needed for the current record are kept in memory.
+    """
+
+    def __init__(self, f, chunk_size=65536):
+        """
+        :param file f: file-like object with the json document
+        :param int chunk_size: number of bytes to read at once
+        """
+        self.reader = _ChunkReader(f, chunk_size)
+        opening = self.reader.next_char()
+        if opening == '{':
+            self.container = dict
+            self.closing = '}'
+        elif opening == '[':
+            self.container = list
+            self.closing = ']'
+        else:
+            raise ValueError('Top level json value is neither an object nor an array')
+        self.reader.advance(1)
+
+
+    def __iter__(self):
+        reader = self.reader
+        index = 0
+        first = True
+        while True:
+            c = reader.next_char()
+            if c == self.closing:
+                reader.advance(1)
+                return
+            if not first:
+                if c != ',':
+                    raise ValueError('Expecting , delimiter at byte %s' %reader.offset())
+                reader.advance(1)
+            first = False
+
+            if self.container is dict:
+                reader.next_char()
+                key = reader.decode()
+                if reader.next_char() != ':':
+                    raise ValueError('Expecting : delimiter at byte %s' %reader.offset())
+                reader.advance(1)
+            else:
+                key = index
+                index += 1
+            reader.next_char()
+            value = reader.decode()
+            yield key, value
+
+
+class _ChunkReader(object):
+    """
+    ancillary class to keep a buffer with the pending bytes
+    of a json document being read in chunks
+    """
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.consumed = 0
+        self.eof = False
+
+
+    def offset(self):
+        return self.consumed + self.pos
+
+
+    def _fill(self):
+        """
+        reads more bytes from the file.
+        The amount read grows with the pending data,
+        so records larger than a chunk are still parsed in linear time.
+        :return bool: False if there is nothing more to read
+        """
+        if self.eof:
+            return False
+        if self.pos > 0:
+            self.consumed += self.pos
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.f.read(max(self.chunk_size, len(self.buf)))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+
+    def next_char(self):
+        """
+        skips whitespaces and returns the next character,
+        without consuming it
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of json document')
+
+
+    def advance(self, n):
+        self.pos += n
+
+
+    def decode(self):
+        """
+        decodes the next json value in the buffer.
+        A value ending exactly at the end of the buffer may be truncated
+        (e.g. a number), so it is only accepted at the end of the file.
+        """
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+            if end < len(self.buf) or self.eof:
+                self.pos = end
+                return value
+            self._fill()
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+
+import httplib
+import logging
+import os
+import socket
+import ssl
+import threading
+import urlparse
+import zlib
+
+from switcher.switcherexceptions import SwitcherHTTPFailure
+
+
+class HTTPClient(object):
+    """
+    class implementing a pool of persistent (keep-alive) HTTP and HTTPS
+    connections, shared by all reads and writes to AGIS.
+    Once a request is done, and its answer fully read,
+    the connection is kept open to be reused by the next request
+    to the same host.
+    That way, the TCP connection and the TLS handshake,
+    with the X509 proxy, are done only once,
+    and not again on every request.
+    Redirections are followed, as urllib2 did.
+    """
+
+    # status codes of the answers with a Location to follow
+    redirect_codes = (301, 302, 303, 307, 308)
+
+    def __init__(self, x509_user_proxy=None, x509_cert_dir=None, maxsize=4, max_redirects=5):
+        """
+        :param str x509_user_proxy: path to the X509 proxy,
+                                    used as client certificate for HTTPS
+        :param str x509_cert_dir: path to the directory with CA certificates
+        :param int maxsize: max number of idle connections kept per host
+        :param int max_redirects: max number of redirections for a request
+        """
+        self.log = logging.getLogger('httpclient')
+        self.x509_user_proxy = x509_user_proxy
+        self.x509_cert_dir = x509_cert_dir
+        self.maxsize = maxsize
+        self.max_redirects = max_redirects
+        # the SSL context is created on the first HTTPS connection
+        self.context = None
+        self.context_mtime = None
+        # idle connections, indexed by (scheme, host, port)
+        self.idle_d = {}
+        self.lock = threading.Lock()
+        self.log.debug('Object HTTPClient created.')
+
+
+    @classmethod
+    def from_config(cls, switcherconf):
+        """
+        creates an HTTPClient with the X509 credentials
+        in section [SERVERAPI] of the configuration
+        :param SafeConfigParser switcherconf: primary config object
+        :return HTTPClient:
+        """
+        x509_cert_dir = None
+        x509_user_proxy = None
+        if switcherconf.has_section('SERVERAPI'):
+            if switcherconf.has_option('SERVERAPI', 'x509_cert_dir'):
+                x509_cert_dir = switcherconf.get('SERVERAPI', 'x509_cert_dir')
+            if switcherconf.has_option('SERVERAPI', 'x509_user_proxy'):
+                x509_user_proxy = switcherconf.get('SERVERAPI', 'x509_user_proxy')
+        return cls(x509_user_proxy, x509_cert_dir)
+
+
+    def _get_context(self):
+        """
+        get the SSL context shared by all HTTPS connections.
+        It is created again when the X509 proxy file is renewed,
+        and then the idle connections, using the old one, are dropped.
+        :return SSLContext:
+        """
+        mtime = None
+        if self.x509_user_proxy:
+            mtime = os.path.getmtime(self.x509_user_proxy)
+        with self.lock:
+            if self.context is not None and mtime == self.context_mtime:
+                return self.context
+        context = self._create_context()
+        with self.lock:
+            renewed = self.context is not None
+            self.context = context
+            self.context_mtime = mtime
+        if renewed:
+            self.log.info('X509 proxy %s was renewed. Closing idle connections.' %self.x509_user_proxy)
+            self.close()
+        return context
+
+
+    def _create_context(self):
+        if self.x509_cert_dir:
+            context = ssl.create_default_context(capath=self.x509_cert_dir)
+        else:
+            context = ssl.create_default_context()
+        if self.x509_user_proxy:
+            # the proxy file contains both the certificate and the key
+            context.load_cert_chain(self.x509_user_proxy)
+        return context
+
+    # -------------------------------------------------------------------------
+
+    def get(self, url, headers=None, timeout=None):
+        """
+        performs a GET request
+        :param str url: the URL
+        :param dict headers: extra headers for the request
+        :param tuple timeout: (connect, read) timeouts, in seconds, or None
+        :return PooledResponse:
+        """
+        return self.request('GET', url, headers=headers, timeout=timeout)
+
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        performs a request, on an idle connection if there is one,
+        following the redirections, up to self.max_redirects.
+        As browsers do, after a 303, or a 301 or 302 to a POST, 
+        the new location is requested with GET and no body.
+        :param str method: the HTTP method
+        :param str url: the URL
+        :param str body: the body of the request, or None
+        :param dict headers: extra headers for the request
+        :param tuple timeout: (connect, read) timeouts, in seconds, or None
+        :return PooledResponse: the answer, whatever the status is
+        """
+        for i in range(self.max_redirects + 1):
+            response = self._request(method, url, body, headers, timeout)
+            location = response.getheader('Location')
+            if response.status not in self.redirect_codes or not location:
+                return response
+            # the body is read, so the connection can be reused
+            response.read()
+            response.close()
+            newurl = urlparse.urljoin(url, location)
+            self.log.debug('%s redirected with status %s to %s' %(url, response.status, newurl))
+            url = newurl
+            if response.status == 303 or\
+               (response.status in (301, 302) and method == 'POST'):
+                method = 'GET'
+                body = None
+        raise SwitcherHTTPFailure(url, response.status, 'more than %s redirections' %self.max_redirects)
+
+
+    def _request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        performs a single request, on an idle connection if there is one
+        :return PooledResponse: the answer, whatever the status is
+        """
+        self.log.debug('Starting %s %s' %(method, url))
+        parsed = urlparse.urlsplit(url)
+        key = (parsed.scheme, parsed.hostname, parsed.port)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        if headers is None:
+            headers = {}
+
+        conn, reused = self._get_connection(key, timeout)
+        try:
+            response = self._send(conn, method, path, body, headers)
+        except (httplib.HTTPException, socket.error) as ex:
+            conn.close()
+            if not reused:
+                raise
+            # the server closed the idle connection meanwhile
+            self.log.debug('Idle connection to %s was closed: %s. Opening a new one.' %(parsed.hostname, ex))
+            conn, reused = self._get_connection(key, timeout, reuse=False)
+            try:
+                response = self._send(conn, method, path, body, headers)
+            except Exception:
+                conn.close()
+                raise
+        self.log.debug('Leaving with status %s.' %response.status)
+        return PooledResponse(self, key, conn, response)
+
+
+    def _send(self, conn, method, path, body, headers):
+        conn.request(method, path, body, headers)
+        return conn.getresponse()
+
+
+    def _get_connection(self, key, timeout, reuse=True):
+        """
+        get an idle connection for a given host, or a new one
+        :return tuple: (connection, True if it was idle)
+        """
+        connect_timeout, read_timeout = timeout or (None, None)
+        conn = None
+        if reuse:
+            with self.lock:
+                idle_l = self.idle_d.get(key, [])
+                if idle_l:
+                    conn = idle_l.pop()
+        reused = conn is not None
+        if not reused:
+            conn = self._new_connection(key, connect_timeout)
+            conn.connect()
+        conn.sock.settimeout(read_timeout)
+        return conn, reused
+
+
+    def _new_connection(self, key, connect_timeout):
+        scheme, host, port = key
+        kw = {}
+        if connect_timeout is not None:
+            kw['timeout'] = connect_timeout
+        if scheme == 'https':
+            self.log.debug('Opening new HTTPS connection to %s' %host)
+            return httplib.HTTPSConnection(host, port, context=self._get_context(), **kw)
+        self.log.debug('Opening new HTTP connection to %s' %host)
+        return httplib.HTTPConnection(host, port, **kw)
+
+
+    def _release(self, key, conn):
+        """
+        gives back to the pool a connection which answer was fully read
+        """
+        with self.lock:
+            idle_l = self.idle_d.setdefault(key, [])
+            if len(idle_l) < self.maxsize:
+                idle_l.append(conn)
+                return
+        conn.close()
+
+
+    def close(self):
+        """
+        closes all idle connections
+        """
+        with self.lock:
+            idle_d = self.idle_d
+            self.idle_d = {}
+        for idle_l in idle_d.values():
+            for conn in idle_l:
+                conn.close()
+
+
+# =============================================================================
+
+class PooledResponse(object):
+    """
+    file-like wrapper for the answer to a request.
+    Once the body has been fully read, the connection goes back to the pool.
+    If it is closed before that, the connection is closed too.
+    """
+
+    def __init__(self, client, key, conn, response):
+        self.client = client
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.status = response.status
+        self.reason = response.reason
+
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+
+    def read(self, amt=None):
+        if self.conn is None:
+            return ''
+        if amt is None:
+            data = self.response.read()
+        else:
+            data = self.response.read(amt)
+        if self.response.isclosed():
+            self._release()
+        return data
+
+
+    def close(self):
+        if self.conn is None:
+            return
+        if not self.response.isclosed() and self.response.length == 0:
+            # answers with no body, like 304, still need to be finished
+            self.response.read()
+        if self.response.isclosed():
+            self._release()
+        else:
+            self.conn.close()
+            self.conn = None
+
+
+    def _release(self):
+        conn = self.conn
+        self.conn = None
+        if self.response.will_close:
+            conn.close()
+        else:
+            self.client._release(self.key, conn)
+
+
+# =============================================================================
+
+class DecompressingReader(object):
+    """
+    file-like wrapper decompressing, chunk by chunk,
+    a body sent with Content-Encoding gzip or deflate.
+    The compressed body is never fully held in memory.
+    """
+
+    def __init__(self, f, encoding, chunk_size=65536):
+        """
+        :param file f: file-like object with the compressed body
+        :param str encoding: 'gzip' or 'deflate'
+        :param int chunk_size: number of compressed bytes to read at once
+        """
+        self.f = f
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        # a gzip or a zlib header is detected automatically
+        self.decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        self.first = True
+        self.buf = ''
+        self.eof = False
+
+
+    def _decompress(self, chunk):
+        if not self.first:
+            return self.decompressor.decompress(chunk)
+        self.first = False
+        try:
+            return self.decompressor.decompress(chunk)
+        except zlib.error:
+            if self.encoding != 'deflate':
+                raise
+            # some servers send deflate data with no zlib header
+            self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self.decompressor.decompress(chunk)
+
+
+    def read(self, amt=None):
+        while not self.eof and (amt is None or len(self.buf) < amt):
+            chunk = self.f.read(self.chunk_size)
+            if chunk:
+                self.buf += self._decompress(chunk)
+            else:
+                self.buf += self.decompressor.flush()
+                self.eof = True
+        if amt is None:
+            data, self.buf = self.buf, ''
+        else:
+            data, self.buf = self.buf[:amt], self.buf[amt:]
+        return data
+
+
+    def close(self):
+        self.f.close()
+
+
+def decompress(f, encoding):
+    """
+    get a file-like object with the decompressed content of another one
+    :param file f: file-like object
+    :param str encoding: value of Content-Encoding, or None
+    :return file:
+    """
+    if not encoding or encoding == 'identity':
+        return f
+    if encoding in ['gzip', 'x-gzip', 'deflate']:
+        return DecompressingReader(f, encoding)
+    f.close()
+    raise ValueError('Unsupported Content-Encoding %s' %encoding)
+
+
+# =============================================================================
+
+default_client = HTTPClient()
+
+
+def check_status(response, url, expected=(200,)):
+    """
+    raises SwitcherHTTPFailure if the status of an answer
+    is not one of the expected ones
+    :param PooledResponse response: the answer
+    :param str url: the URL, for the error message
+    :param tuple expected: valid status codes
+    """
+    if response.status not in expected:
+        response.close()
+        raise SwitcherHTTPFailure(url, response.status, response.reason)
@@ -1,21 +1,38 @@
 #!/usr/bin/env python
 
 import logging
-import subprocess
 
 
+from switcher.services.httpclient import HTTPClient
 from switcher.switcherexceptions import SwitcherServiceFailure
 
 class AGIS(object):
 
-    def __init__(self, switcherconf):
+    def __init__(self, switcherconf, client=None):
+        """
+        :param SafeConfigParser switcherconf: primary config object
+        :param HTTPClient client: pool of persistent connections, 
+                                  with the X509 credentials
+        """
         self.log = logging.getLogger('agis')
         self.switcherconf = switcherconf
+        if client is None:
+            client = HTTPClient.from_config(switcherconf)
+        self.client = client
+        self.__readconfig()
 
-        # FIXME
-        # temporary solution
-        self.x509_cert_dir = self.switcherconf.get('SERVERAPI', 'x509_cert_dir')
-        self.x509_user_proxy = self.switcherconf.get('SERVERAPI', 'x509_user_proxy')
+
+    def __readconfig(self):
+        """
+        get the (connect, read) timeouts, in seconds, for the requests
+        """
+        timeout_l = []
+        for key, default in [('connect_timeout', 30), ('read_timeout', 120)]:
+            if self.switcherconf.has_option('SERVERAPI', key):
+                timeout_l.append(self.switcherconf.getfloat('SERVERAPI', key))
+            else:
+                timeout_l.append(default)
+        self.timeout = tuple(timeout_l)
 
 
     def change_queue_status(self, event):
@@ -26,10 +43,8 @@ class AGIS(object):
 
         url = ''
         url = url.format(panda_resource=queue, value=status.upper(), reason=comment)
-        cmd = 'curl --capath {capath} --cacert {cert} --cert {cert} \'{url}\'' 
-        cmd = cmd.format(capath=self.x509_cert_dir, cert=self.x509_user_proxy, url=url)
         
-        return self._run_command(cmd)
+        return self._request(url)
 
 
     def change_ce_status(self, event):
@@ -40,32 +55,36 @@ class AGIS(object):
         comment = event.comment
 
         url = '' %(ce_name, status.upper(), comment)
-        cmd = 'curl --capath {capath} --cacert {cert} --cert {cert} \'{url}\'' 
-        cmd = cmd.format(capath=self.x509_cert_dir, cert=self.x509_user_proxy, url=url)
-        return self._run_command(cmd)
-
+        return self._request(url)
 
 
-    def _run_command(self, cmd):
 
-        self.log.info('Attempt to run command: %s' %cmd)
+    def _request(self, url):
+        """
+        performs the request on a persistent connection from the pool.
+        :return tuple: (body of the answer, reason if failed, HTTP status)
+        """
+        self.log.info('Attempt to request url: %s' %url)
         try:
-            # FIXME: figure out how to do this with a python library (pycurl, urllib, ...)
-            subproc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-            (out, err) = subproc.communicate()
-            st = subproc.returncode
-            return out, err, st
+            response = self.client.get(url, timeout=self.timeout)
+            out = response.read()
+            response.close()
         except Exception as ex:
-            self.log.error('Failure running command "%s": %s' %(cmd, ex))
-            raise SwitcherServiceFailure(cmd, ex)
+            self.log.error('Failure requesting url "%s": %s' %(url, ex))
+            raise SwitcherServiceFailure(url, ex)
+        st = response.status
+        err = None
+        if st != 200:
+            err = response.reason
+        return out, err, st
 
 
 class AGISMock(AGIS):
     """
     mock class for testing
     """
-    def _run_command(self, cmd):
-        self.log.info('Fake call to run command %s' %cmd)
+    def _request(self, url):
+        self.log.info('Fake call to request url %s' %url)
         return None, None, None
 
     
@@ -36,13 +36,12 @@ def ssb(topology):
     output_panda_resource_status_f = open(output_panda_resource_status, 'w')
     
 
-    for queue in topology.queue_d.values():
-        panda_resource = queue.name
-        if queue.event:
-            action = queue.event.new_status 
+    for panda_resource, current_status, sitetype, event in topology.iter_queue_rows():
+        if event:
+            action = event.new_status 
             action_color = action_color_d.get(action, 'grey')
             if action != "online":
-                scheduled = queue.event.overlap_downtimes.downtime_l[0].classification
+                scheduled = event.overlap_downtimes.downtime_l[0].classification
                 scheduled = scheduled.lower()
                 action = '%s_%s' %(action, scheduled)
                 if scheduled == 'unscheduled':
@@ -52,9 +51,7 @@ def ssb(topology):
             action = 'no_action'
             action_color = action_color_d.get(action, 'grey')
 
-        current_status = queue.status
         status_color = status_color_d.get(current_status, 'grey')
-        sitetype = queue.type
 
         output_switcher_actions_f.write('%s %s %s %s http://xxxxxxxxxxxxxxxxxx/agis/calendar/\n' %(timestamp, panda_resource, action, action_color))
         output_panda_resource_status_f.write('%s %s %s %s %s\n' %(timestamp, panda_resource, current_status, status_color, sitetype))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import logging
+
+
+class ShortCircuit(object):
+    """
+    class to decide if a whole cycle can be skipped
+    because its result can not differ from the previous one.
+    That is the case when:
+        -- none of the inputs changed,
+           including the downtimes and notifications config files,
+        -- no downtime threshold has been crossed since the previous cycle,
+        -- and no action failed in the previous cycle.
+    The object lives across cycles, to remember the previous one.
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger('shortcircuit')
+        # fingerprint of the inputs of the last complete cycle
+        self.digest = None
+        # time when the result of the last cycle may change
+        self.next_change_t = None
+        # digest of the last data seen for each input,
+        # so data that is reused from memory is not serialized again
+        self.last_d = {}
+        self.log.debug('Object ShortCircuit created.')
+
+
+    def fingerprint(self, data_d, conffile_l):
+        """
+        calculates the fingerprint of the inputs of a cycle
+        :param dict data_d: the decoded data for each input name
+        :param list conffile_l: ConfigFile objects, already loaded, 
+                                that the result depends on
+        :return str:
+        """
+        h = hashlib.sha1()
+        for name in sorted(data_d.keys()):
+            h.update('%s %s\n' %(name, self._digest(name, data_d[name])))
+        for conffile in conffile_l:
+            h.update('%s %s\n' %(conffile.path, conffile.signature))
+        return h.hexdigest()
+
+
+    def _digest(self, name, data):
+        last = self.last_d.get(name)
+        if last is not None and last[0] is data:
+            return last[1]
+        # keys are sorted, so the same content always has the same digest
+        content = json.dumps(data, sort_keys=True, separators=(',', ':'))
+        digest = hashlib.sha1(content).hexdigest()
+        self.last_d[name] = (data, digest)
+        return digest
+
+
+    def can_skip(self, digest, now):
+        """
+        :param str digest: the fingerprint of the inputs of this cycle
+        :param float now: current time, in seconds since epoch
+        :return bool:
+        """
+        if self.digest is None or digest != self.digest:
+            self.log.debug('Inputs changed since the last cycle.')
+            return False
+        if self.next_change_t is not None and now >= self.next_change_t:
+            self.log.debug('A downtime threshold was crossed at %s.' %self.next_change_t)
+            return False
+        return True
+
+
+    def invalidate(self):
+        """
+        forgets the previous cycle,
+        so nothing is skipped until a new one is complete
+        """
+        self.digest = None
+        self.next_change_t = None
+
+
+    def record(self, digest, next_change_t, pending):
+        """
+        records the outcome of a complete cycle
+        :param str digest: the fingerprint of the inputs of the cycle
+        :param float next_change_t: time when the result may change,
+                                    or None if never
+        :param bool pending: True if some action failed
+        """
+        if pending:
+            self.log.info('Some actions failed. Next cycle will not be skipped.')
+            self.invalidate()
+            return
+        self.digest = digest
+        self.next_change_t = next_change_t
+        self.log.info('Cycle recorded. Result may change at %s.' %next_change_t)
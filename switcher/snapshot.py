@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+import copy_reg
+import gc
+import logging
+import os
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+# -----------------------------------------------------------------------------
+# loggers are saved by name, and looked up again when loading
+def _reduce_logger(logger):
+    return (logging.getLogger, (logger.name,))
+
+copy_reg.pickle(logging.Logger, _reduce_logger)
+copy_reg.pickle(logging.RootLogger, _reduce_logger)
+# -----------------------------------------------------------------------------
+
+
+class TopologySnapshot(object):
+    """
+    class to save the topology to a binary file after each cycle,
+    and load it when the daemon starts,
+    so the first cycle only applies the differences with the new inputs
+    instead of building the whole topology from scratch.
+
+    The snapshot contains the topology as the next cycle starts with it,
+    once cleared what was recorded during the cycle:
+    entities, indexes and CE states,
+    and the content of the config files it was built with.
+    Switcher statuses and downtimes are not saved,
+    as they are read again from their sources in every cycle.
+    It is only used if it was built with the same settings,
+    and the config files did not change since then.
+    """
+
+    # to be increased when the classes change in a way
+    # that makes older snapshots unusable
+    version = 5
+
+    def __init__(self, path):
+        """
+        :param str path: the path to the snapshot file
+        """
+        self.log = logging.getLogger('snapshot')
+        self.path = os.path.expanduser(path)
+        self.log.debug('Object TopologySnapshot created for %s.' %self.path)
+
+
+    def save(self, topology, key, conffile_l):
+        """
+        writes the snapshot.
+        The file is written first to a temporary path and renamed,
+        so a partially written file is never loaded.
+        :param topology: the Topology object
+        :param key: settings the topology was built with
+        :param list conffile_l: the ConfigFile objects the topology was built with
+        """
+        self.log.debug('Starting.')
+        start = time.time()
+        snapshot_d = {'version': self.version,
+                      'key': key,
+                      'time': start,
+                      'conf': [(conffile.path, conffile.signature, conffile.value) for conffile in conffile_l],
+                      'topology': topology,
+                     }
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        tmppath = '%s.tmp' %self.path
+        f = open(tmppath, 'wb')
+        try:
+            pickle.dump(snapshot_d, f, 2)
+        finally:
+            f.close()
+        os.rename(tmppath, self.path)
+        self.log.info('Topology snapshot saved to %s in %.2f seconds.' %(self.path, time.time() - start))
+
+
+    def load(self, key, conffile_l):
+        """
+        reads the snapshot, if there is one and it is usable.
+        The ConfigFile objects get the content saved with it,
+        so the topology keeps being valid for them.
+        :param key: settings the topology must have been built with
+        :param list conffile_l: the ConfigFile objects for the current config files
+        :return: the Topology object, or None
+        """
+        self.log.debug('Starting.')
+        if not os.path.isfile(self.path):
+            self.log.info('There is no topology snapshot at %s.' %self.path)
+            return None
+        start = time.time()
+        try:
+            f = open(self.path, 'rb')
+            # the garbage collector would go through the objects
+            # many times while they are being created, for nothing
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                snapshot_d = pickle.load(f)
+            finally:
+                if gc_enabled:
+                    gc.enable()
+                f.close()
+        except Exception as ex:
+            self.log.warning('Unable to read topology snapshot %s: %s' %(self.path, ex))
+            return None
+
+        if snapshot_d.get('version') != self.version:
+            self.log.info('Topology snapshot %s has an old format. Ignoring it.' %self.path)
+            return None
+        if snapshot_d['key'] != key:
+            self.log.info('Topology snapshot %s was built with different settings. Ignoring it.' %self.path)
+            return None
+        saved_d = dict((path, (signature, value)) for path, signature, value in snapshot_d['conf'])
+        for conffile in conffile_l:
+            if conffile.path not in saved_d or\
+               not conffile.restore(*saved_d[conffile.path]):
+                self.log.info('Config file %s changed since the topology snapshot. Ignoring it.' %conffile.path)
+                return None
+        self.log.info('Topology snapshot from %s loaded in %.2f seconds.' %(time.ctime(snapshot_d['time']), time.time() - start))
+        return snapshot_d['topology']
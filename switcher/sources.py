@@ -0,0 +1,411 @@
+#!/usr/bin/env python
+
+import logging
+import threading
+import time
+
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from switcher import ingest
+from switcher.archive import Archive
+from switcher.httpcache import HTTPCache
+from switcher.switcherexceptions import SwitcherConfigurationFailure
+from switcher.utils import RetryPolicy, load_json
+
+
+def _to_bool(value):
+    return value.strip().lower() in ['1', 'yes', 'true', 'on']
+
+
+class Sources(object):
+    """
+    class to fetch all the inputs listed in section [SOURCE]
+    of the configuration at the beginning of each cycle.
+    All of them are downloaded in parallel, with a bounded pool of threads,
+    so the start-up latency of a cycle is that of the slowest source,
+    and not the sum of all of them.
+    Each source has its own connect and read timeouts, 
+    failed attempts are retried with exponential backoff, 
+    and the whole fetch has a deadline, 
+    so the worst-case latency of this step is bounded.
+    The large AGIS documents can be decoded as a stream, 
+    keeping only the fields Switcher uses from each record.
+    Sources that change rarely can have a refresh interval (TTL). 
+    The decoded data for them is kept in memory, 
+    as long as this object lives, 
+    and only fetched again when the TTL expires.
+    The last good data for each source is also kept, 
+    so when a source can not be read the cycle can go ahead 
+    with that data, if it is not too old, 
+    while the source is fetched again in the background.
+    The threads live as long as this object. 
+    There is never more than one fetch at a time for the same source:
+    if a fetch is still running when the source is needed again, 
+    because it went beyond the deadline, that fetch is waited for
+    instead of starting a new one.
+    The inputs of each cycle can also be archived, 
+    to reproduce afterwards what Switcher saw at that moment.
+    """
+
+    # names of the options in section [SOURCE] with a path or URL to fetch
+    names = ['schedconfig',
+             'ddmtopology',
+             'switcherstatus',
+             'downtimescalendar',
+             'sites',
+             'probestate',
+            ]
+
+    # fields to keep from each record when decoding as a stream
+    projection_d = {'schedconfig': ingest.SCHEDCONFIG,
+                    'ddmtopology': ingest.DDMTOPOLOGY,
+                    'sites': ingest.SITES,
+                   }
+
+    def __init__(self, switcherconf, client=None):
+        """
+        :param SafeConfigParser switcherconf: primary config object
+        :param HTTPClient client: pool of persistent connections for URLs
+        """
+        self.log = logging.getLogger('sources')
+        self.switcherconf = switcherconf
+        self.client = client
+        # last good decoded data for each source, and when it was fetched
+        self.cached_d = {}
+        # functions to select the records to keep from each source
+        self.accept_d = {}
+        # the fetch in progress, or the last one, for each source
+        self.inflight_d = {}
+        # created on the first fetch
+        self.pool = None
+        self.lock = threading.Lock()
+        self.__readconfig()
+        self.log.debug('Object Sources created.')
+
+
+    def __readconfig(self):
+        """
+        get the path or URL for each source,
+        the max number of threads to fetch them, 
+        and how to fetch each one of them
+        """
+        self.source_d = {}
+        self.ttl_d = {}
+        self.timeout_d = {}
+        self.retry_d = {}
+        for name in self.names:
+            self.source_d[name] = self.switcherconf.get('SOURCE', name)
+            self.ttl_d[name] = self.__get_value(name, 'ttl', 0)
+            self.timeout_d[name] = (self.__get_value(name, 'connect_timeout', 30, float),
+                                    self.__get_value(name, 'read_timeout', 120, float))
+            self.retry_d[name] = RetryPolicy(self.__get_value(name, 'max_trials', 3),
+                                             self.__get_value(name, 'backoff', 30, float),
+                                             self.__get_value(name, 'backoff_max', 30, float),
+                                             self.__get_value(name, 'backoff_jitter', False, _to_bool))
+
+        # max age, in seconds, of the last good data for each source
+        # to be used when the source can not be read. 0 means never
+        self.max_staleness_d = {}
+        for name in self.names:
+            self.max_staleness_d[name] = self.__get_value(name, 'max_staleness', 0, float)
+
+        # max number of seconds for the whole fetch step. 0 means no deadline
+        self.fetch_deadline = self.__get_value(None, 'fetch_deadline', 0, float)
+
+        if self.switcherconf.has_option('SOURCE', 'fetch_threads'):
+            self.fetch_threads = self.switcherconf.getint('SOURCE', 'fetch_threads')
+        else:
+            self.fetch_threads = len(self.names)
+
+        if self.switcherconf.has_option('SOURCE', 'streaming'):
+            self.streaming = self.switcherconf.getboolean('SOURCE', 'streaming')
+        else:
+            self.streaming = False
+
+        self.cache = None
+        if self.switcherconf.has_option('SOURCE', 'cachedir'):
+            cachedir = self.switcherconf.get('SOURCE', 'cachedir')
+            if cachedir and cachedir != 'None':
+                self.cache = HTTPCache(cachedir)
+
+        self.archive = None
+        if self.switcherconf.has_option('SOURCE', 'archivedir'):
+            archivedir = self.switcherconf.get('SOURCE', 'archivedir')
+            if archivedir and archivedir != 'None':
+                self.archive = Archive(archivedir)
+
+
+    def set_filter(self, name, accept):
+        """
+        sets which records to keep from a source when decoding as a stream.
+        The rest are dropped as soon as they are decoded.
+        :param str name: the name of the source in section [SOURCE]
+        :param accept: function called with (key, value) for each record,
+                       returning True if the record is kept
+        """
+        self.accept_d[name] = accept
+
+
+    def __get_value(self, name, key, default, conv=int):
+        """
+        get a parameter for a given source from section [SOURCE].
+        The value in <name>_<key> has precedence over the one in <key>,
+        which is shared by all sources.
+        :param str name: the name of the source, or None
+        :param str key: the name of the parameter
+        :param default: value if the parameter is not in the configuration
+        :param conv: function to convert the string value
+        """
+        for option in ['%s_%s' %(name, key), key]:
+            if self.switcherconf.has_option('SOURCE', option):
+                return conv(self.switcherconf.get('SOURCE', option))
+        return default
+
+
+    def fetch(self):
+        """
+        downloads and decodes in parallel all sources 
+        which TTL has expired.
+        If any of them can not be read, and there is no recent enough 
+        good data for it, SwitcherConfigurationFailure is raised.
+        :return dict: the decoded data for each source name
+        """
+        self.log.debug('Starting.')
+        now = time.time()
+        deadline = None
+        if self.fetch_deadline > 0:
+            deadline = now + self.fetch_deadline
+        data_d = {}
+        # the documents, as they were read, to be archived
+        raw_d = {}
+        expired_l = []
+        for name in self.names:
+            if self._is_fresh(name, now):
+                self.log.info('Source %s has not expired yet. Using data in memory.' %name)
+                with self.lock:
+                    fetched_t, data_d[name], raw_d[name] = self.cached_d[name]
+            else:
+                expired_l.append(name)
+
+        if expired_l:
+            result_d = {}
+            for name in expired_l:
+                result_d[name] = self._submit(name, deadline)
+            for name in expired_l:
+                try:
+                    data_d[name], raw_d[name] = self._get_result(name, result_d[name], deadline)
+                except SwitcherConfigurationFailure as ex:
+                    data_d[name], raw_d[name] = self._get_stale(name, ex)
+            self.log.info('Sources %s fetched.' %', '.join(expired_l))
+
+        if self.archive:
+            self.archive.submit(raw_d, self.source_d, now)
+        return data_d
+
+
+    def _submit(self, name, deadline):
+        """
+        starts fetching a source with one of the threads,
+        unless the previous fetch for that source is still running.
+        In that case, the previous one is returned, 
+        so a slow source is never fetched twice at the same time.
+        :param str name: the name of the source in section [SOURCE]
+        :param float deadline: seconds since epoch, or None
+        :return AsyncResult:
+        """
+        with self.lock:
+            result = self.inflight_d.get(name, None)
+            if result is not None and not result.ready():
+                self.log.warning('Source %s is still being fetched. Waiting for it.' %name)
+                return result
+            if self.pool is None:
+                self.pool = ThreadPool(max(1, min(self.fetch_threads, len(self.names))))
+            result = self.pool.apply_async(self._fetch_and_record, (name, deadline))
+            self.inflight_d[name] = result
+        return result
+
+
+    def close(self):
+        """
+        stops the threads, without waiting for fetches still in progress
+        """
+        with self.lock:
+            pool = self.pool
+            self.pool = None
+            self.inflight_d = {}
+        if pool is not None:
+            pool.terminate()
+
+
+    def _is_fresh(self, name, now):
+        """
+        checks if the data in memory for a given source
+        is still within its TTL
+        :param str name: the name of the source in section [SOURCE]
+        :param float now: current time, in seconds since epoch
+        :return bool:
+        """
+        if self.ttl_d[name] <= 0:
+            return False
+        with self.lock:
+            if name not in self.cached_d:
+                return False
+            fetched_t = self.cached_d[name][0]
+        return now - fetched_t < self.ttl_d[name]
+
+
+    def _record(self, name, fetched_t, data, raw=None):
+        """
+        keeps the decoded data for a source that was read successfully,
+        and the document as it was read, if it is to be archived
+        """
+        with self.lock:
+            self.cached_d[name] = (fetched_t, data, raw)
+
+
+    def _get_stale(self, name, ex):
+        """
+        get the last good data for a source that could not be read,
+        if it is not older than the max staleness allowed.
+        In that case, the source is fetched again in the background.
+        Otherwise, the original exception is raised again.
+        :param str name: the name of the source in section [SOURCE]
+        :param SwitcherConfigurationFailure ex: the reason for the failure
+        :return tuple: the decoded data, and the RawDocument or None
+        """
+        with self.lock:
+            cached = self.cached_d.get(name, None)
+        if cached is None:
+            raise ex
+        fetched_t, data, raw = cached
+        age = time.time() - fetched_t
+        if age > self.max_staleness_d[name]:
+            raise ex
+        self.log.warning('Source %s could not be read. Using data from %d seconds ago.' %(name, age))
+        self._revalidate(name)
+        return data, raw
+
+
+    def _revalidate(self, name):
+        """
+        makes sure a given source is being fetched again in the background.
+        If the fetch that failed is still running, it is kept.
+        Otherwise, a new one is started, with its own deadline.
+        Either way, the data is recorded when it arrives.
+        :param str name: the name of the source in section [SOURCE]
+        """
+        self._submit(name, time.time() + self._get_max_fetch_time(name))
+
+
+    def _get_max_fetch_time(self, name):
+        """
+        get the max number of seconds for fetching a given source:
+        the fetch deadline, if any, 
+        or the time all attempts would take if all of them timed out
+        :param str name: the name of the source in section [SOURCE]
+        :return float:
+        """
+        if self.fetch_deadline > 0:
+            return self.fetch_deadline
+        retry = self.retry_d[name]
+        connect_timeout, read_timeout = self.timeout_d[name]
+        return retry.max_trials * (connect_timeout + read_timeout) +\
+               (retry.max_trials - 1) * retry.backoff_max
+
+
+    def _get_result(self, name, result, deadline):
+        """
+        waits for the thread fetching a given source, 
+        but not beyond the deadline
+        :param str name: the name of the source in section [SOURCE]
+        :param AsyncResult result: the output of the thread
+        :param float deadline: seconds since epoch, or None
+        :return tuple: the decoded data, and the RawDocument or None
+        """
+        if deadline is None:
+            return result.get()
+        # a little margin, as the thread stops attempting at the deadline
+        remaining = max(deadline - time.time(), 0) + 1
+        try:
+            return result.get(remaining)
+        except TimeoutError:
+            self.log.critical('Deadline reached while fetching source %s.' %name)
+            raise SwitcherConfigurationFailure(self.source_d[name], 'fetch deadline of %s seconds reached' %self.fetch_deadline)
+
+
+    def _fetch_and_record(self, name, deadline=None):
+        """
+        downloads and decodes a single source, 
+        and keeps it as the last good data for that source.
+        If there is an archive, the document is also copied
+        as it is read.
+        :param str name: the name of the source in section [SOURCE]
+        :param float deadline: seconds since epoch, or None
+        :return tuple: the decoded data, and the RawDocument or None
+        """
+        fetched_t = time.time()
+        raw = None
+        if self.archive:
+            raw = self.archive.spool()
+        data = self._fetch_one(name, deadline, raw)
+        self._record(name, fetched_t, data, raw)
+        return data, raw
+
+
+    def reload(self, name, projection=None):
+        """
+        reads a single source again, out of the fetch step,
+        for example, to check the result of the actions of a cycle.
+        It uses the same connections, timeouts and retries as fetch(),
+        and gives up when all attempts would have timed out, 
+        so a source that hangs can not block the caller.
+        The on-disk cache, the archive and the last good data are not used.
+        :param str name: the name of the source in section [SOURCE]
+        :param projection: fields to keep from each record, or None
+        :return: the decoded data
+        """
+        source = self.source_d[name]
+        deadline = time.time() + self._get_max_fetch_time(name)
+        self.log.debug('Reading source %s again from %s' %(name, source))
+        try:
+            data = load_json(source, 
+                             projection=projection, 
+                             retry=self.retry_d[name], 
+                             timeout=self.timeout_d[name], 
+                             deadline=deadline,
+                             client=self.client)
+        except Exception as ex:
+            self.log.critical('Unable to read %s configuration from src. Exception: %s' %(name, ex))
+            raise SwitcherConfigurationFailure(source, ex)
+        return data
+
+
+    def _fetch_one(self, name, deadline=None, copy_to=None):
+        """
+        downloads and decodes a single source
+        :param str name: the name of the source in section [SOURCE]
+        :param float deadline: seconds since epoch, or None
+        :param file copy_to: where to copy the document, or None
+        :return: the decoded data
+        """
+        source = self.source_d[name]
+        projection = None
+        if self.streaming:
+            projection = self.projection_d.get(name, None)
+            if name in self.accept_d:
+                projection = ingest.Select(self.accept_d[name], projection)
+        self.log.debug('Fetching source %s from %s' %(name, source))
+        try:
+            data = load_json(source, 
+                             self.cache, 
+                             projection, 
+                             self.retry_d[name], 
+                             self.timeout_d[name], 
+                             deadline,
+                             self.client,
+                             copy_to)
+        except Exception as ex:
+            self.log.critical('Unable to read %s configuration from src. Exception: %s' %(name, ex))
+            raise SwitcherConfigurationFailure(source, ex)
+        return data
@@ -17,11 +17,17 @@ import traceback
 from ConfigParser import SafeConfigParser
 from optparse import OptionParser
 
+from switcher.services.httpclient import HTTPClient
 from switcher.services.serverapi import AGIS, AGISMock
 from switcher.services.notify import Email, EmailMock
+from switcher.shortcircuit import ShortCircuit
+from switcher.snapshot import TopologySnapshot
+from switcher.sources import Sources
 from switcher.switcherexceptions import SwitcherConfigurationFailure, SwitcherEmailSendFailure
+from switcher.thresholds import Thresholds
 from switcher.topology.topology import Topology
-from switcher.utils import AllowedEntities, load_json, send_notifications
+from switcher.topology.columnar import ColumnarTopology
+from switcher.utils import AllowedEntities, ConfigFile, send_notifications
 
 
 # =============================================================================
@@ -245,6 +251,9 @@ class SwitcherLoop(object):
         self.switcherconf = switcherconf
         self.shutdown = False
         self.sleep = self.switcherconf.getint('SWITCHER', 'sleep')
+        # the same Switcher is used on every cycle, 
+        # so it keeps what can be reused from the previous ones
+        self.switcher = Switcher(self.switcherconf)
 
 
     def run(self, dryrun, allow_notifications):
@@ -254,8 +263,7 @@ class SwitcherLoop(object):
         try:
             while not self.shutdown:
                 try:
-                    switcher = Switcher(self.switcherconf)
-                    switcher._run(dryrun, allow_notifications)
+                    self.switcher._run(dryrun, allow_notifications)
                 except SwitcherConfigurationFailure as ex:
                     self.log.critical('Exception raised during Switcher main loop run: %s.' % ex)
                 except SwitcherEmailSendFailure as ex:
@@ -276,18 +284,38 @@ class SwitcherLoop(object):
 class Switcher(object):
     """
     class implementing actions to be performed on 
-    each cycle of the loop
+    each cycle of the loop.
+    The same object can be used for many cycles. 
+    In that case, the connections to AGIS, the inputs not expired yet, 
+    the config files, and the Topology are reused from previous cycles.
     """
 
-    def __init__(self, switcherconf):
+    def __init__(self, switcherconf, sources=None, client=None):
         """
         :param SafeConfigParser switcherconf: primary config object
+        :param Sources sources: object to fetch all inputs at once
+        :param HTTPClient client: pool of persistent connections
         """
         self.log = logging.getLogger('switcher')
         self.shutdown = False
         self.switcherconf = switcherconf
+        if client is None:
+            client = HTTPClient.from_config(switcherconf)
+        self.client = client
+        if sources is None:
+            sources = Sources(switcherconf, client)
+        self.sources = sources
+        # from the previous cycle, to be updated instead of built again
+        self.topology = None
+        # if it changed since the last snapshot was saved
+        self.topology_changed = True
 
         self.__readconfig()
+        # excluded queues are dropped while schedconfig is decoded
+        self.sources.set_filter('schedconfig', self.__accept_queue)
+        if self.snapshot:
+            self.topology = self.snapshot.load(self.__get_snapshot_key(), [self.downtimesconf, self.notificationsconf])
+            self.topology_changed = self.topology is None
 
 
     def __readconfig(self):     
@@ -297,26 +325,74 @@ class Switcher(object):
         """
         self.sleep = self.switcherconf.getint('SWITCHER', 'sleep')
 
-        downtimesconf = self.switcherconf.get('SWITCHER', 'downtimesconf')
-        self.downtimesconf = SafeConfigParser()
-        self.downtimesconf.readfp(open(downtimesconf))
-
-        notificationsconf = self.switcherconf.get('SWITCHER', 'notificationsconf')
-        self.notificationsconf = SafeConfigParser()
-        self.notificationsconf.readfp(open(notificationsconf))
+        # parsed again only when they change
+        self.downtimesconf = ConfigFile(self.switcherconf.get('SWITCHER', 'downtimesconf'), Thresholds)
+        self.notificationsconf = ConfigFile(self.switcherconf.get('SWITCHER', 'notificationsconf'))
 
         self.schedconfig = self.switcherconf.get('SOURCE', 'schedconfig')
-        self.ddmtopology = self.switcherconf.get('SOURCE', 'ddmtopology')
-        self.switcherstatus = self.switcherconf.get('SOURCE', 'switcherstatus')
-        self.sites = self.switcherconf.get('SOURCE', 'sites')
-        self.downtimescalendar = self.switcherconf.get('SOURCE', 'downtimescalendar')
-
         self.probe_state_source = self.switcherconf.get('SOURCE', 'probestate')
 
         self.allowed_clouds = self.__get_allowed_entities('clouds')
         self.allowed_sites = self.__get_allowed_entities('sites')
         self.allowed_queues = self.__get_allowed_entities('queues')
 
+        self.shortcircuit = None
+        if self.switcherconf.has_option('SWITCHER', 'skip_unchanged_cycles') and\
+           self.switcherconf.getboolean('SWITCHER', 'skip_unchanged_cycles'):
+            self.shortcircuit = ShortCircuit()
+
+        self.selective_evaluation = False
+        if self.switcherconf.has_option('SWITCHER', 'selective_evaluation'):
+            self.selective_evaluation = self.switcherconf.getboolean('SWITCHER', 'selective_evaluation')
+
+        self.batch_evaluation = False
+        if self.switcherconf.has_option('SWITCHER', 'batch_evaluation'):
+            self.batch_evaluation = self.switcherconf.getboolean('SWITCHER', 'batch_evaluation')
+
+        backend_d = {'objects': Topology,
+                     'columnar': ColumnarTopology,
+                    }
+        backend = 'objects'
+        if self.switcherconf.has_option('SWITCHER', 'topology_backend'):
+            backend = self.switcherconf.get('SWITCHER', 'topology_backend')
+        if backend not in backend_d:
+            raise SwitcherConfigurationFailure('topology_backend', 'unknown value %s' %backend)
+        self.topology_class = backend_d[backend]
+
+        self.snapshot = None
+        if self.switcherconf.has_option('SWITCHER', 'snapshot'):
+            path = self.switcherconf.get('SWITCHER', 'snapshot')
+            if path != 'None':
+                self.snapshot = TopologySnapshot(path)
+
+
+    def __accept_queue(self, qname, qdata):
+        """
+        checks if a record from schedconfig is for a queue 
+        to be considered, with the same rules as the Topology
+        :param str qname: the name of the queue
+        :param dict qdata: the record
+        :return bool:
+        """
+        return isinstance(qdata, dict) and\
+               qdata.get('vo_name') == 'atlas' and\
+               qdata.get('cloud') in self.allowed_clouds and\
+               qdata.get('atlas_site') in self.allowed_sites and\
+               qname in self.allowed_queues
+
+
+    def __get_snapshot_key(self):
+        """
+        get the settings a topology is built with, 
+        besides the config files, 
+        so a snapshot is not used if they changed
+        :return tuple:
+        """
+        key = [self.topology_class.__name__]
+        for allowed in [self.allowed_clouds, self.allowed_sites, self.allowed_queues]:
+            key.append((allowed.allow_only, allowed.excluded))
+        return tuple(key)
+
 
     def __get_allowed_entities(self, name):
         """
@@ -371,22 +447,49 @@ class Switcher(object):
         """
         self.log.info('Starting new loop.')
 
-        # FIXME
-        # passing allow_only and excluded_queues should be done in a better way
-        # this is a temporary solution
-        topology = Topology(self.schedconfig, self.allowed_clouds, self.allowed_sites, self.allowed_queues, self.ddmtopology, self.notificationsconf, self.downtimesconf)
-        topology.add_switcher_status(self.switcherstatus)
-        topology.add_downtimes(self.downtimescalendar)
-        topology.add_nucleus(self.sites)
+        # all inputs are fetched at once, in parallel
+        data_d = self.sources.fetch()
+        now = time.time()
+
+        thresholds = self.downtimesconf.load()
+        notificationsconf = self.notificationsconf.load()
+
+        if self.shortcircuit:
+            digest = self.shortcircuit.fingerprint(data_d, [self.downtimesconf, self.notificationsconf])
+            if self.shortcircuit.can_skip(digest, now):
+                self.log.info('Inputs did not change, and no downtime threshold was crossed. Skipping this loop.')
+                return
+            # in case this cycle does not finish
+            self.shortcircuit.invalidate()
+
+        # the Topology from the previous cycle is reused 
+        # unless the config files its entities were created with changed.
+        # It is only kept if this cycle finishes
+        topology = self.topology
+        self.topology = None
+        if topology is not None and\
+           topology.thresholds is thresholds and\
+           topology.notificationsconf is notificationsconf:
+            if topology.update(data_d['schedconfig'], data_d['ddmtopology']):
+                self.topology_changed = True
+        else:
+            self.topology_changed = True
+            # FIXME
+            # passing allow_only and excluded_queues should be done in a better way
+            # this is a temporary solution
+            topology = self.topology_class(data_d['schedconfig'], self.allowed_clouds, self.allowed_sites, self.allowed_queues, data_d['ddmtopology'], notificationsconf, thresholds)
+        topology.add_switcher_status(data_d['switcherstatus'])
+        topology.add_downtimes(data_d['downtimescalendar'])
+        topology.add_nucleus(data_d['sites'])
         self.log.info('Topology tree generated %s.' %topology)
 
         if dryrun:
-            agis = AGISMock(self.switcherconf)
+            agis = AGISMock(self.switcherconf, self.client)
         else:
-            agis = AGIS(self.switcherconf)
+            agis = AGIS(self.switcherconf, self.client)
 
         try:
-            probe_state = load_json(self.probe_state_source)['switcher']['state'].lower()
+            probe_state = data_d['probestate']['switcher']['state'].lower()
         except Exception as ex:
             self.log.critical('Unable to read probe state configuration from src. Exception: %s' %ex)
             raise SwitcherConfigurationFailure(self.probe_state_source, ex)
@@ -396,9 +499,9 @@ class Switcher(object):
         else:
             email = EmailMock(active)
 
-        topology.evaluate()
+        topology.evaluate(self.selective_evaluation, self.batch_evaluation)
         topology.act(agis)
-        topology.reevaluate(self.schedconfig)
+        topology.reevaluate(self.sources)
         topology.notify(email)
 
         # =====================================================================
@@ -412,6 +515,21 @@ class Switcher(object):
             ssb_fun = ssb
         ssb_fun(topology)
 
+        if self.shortcircuit:
+            self.shortcircuit.record(digest, topology.next_change_time(now), topology.has_pending_actions())
+        self.topology = topology
+
+        if self.snapshot and self.topology_changed:
+            # the next cycle starts by clearing what was recorded in this one,
+            # so it is done now, and the snapshot keeps only what is reused.
+            # If nothing changed, the snapshot saved before is still valid
+            topology.clear()
+            try:
+                self.snapshot.save(topology, self.__get_snapshot_key(), [self.downtimesconf, self.notificationsconf])
+                self.topology_changed = False
+            except Exception as ex:
+                self.log.error('Unable to save the topology snapshot: %s' %ex)
+
         self.log.info('Actions finished.')
 
 
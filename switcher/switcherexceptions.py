@@ -29,6 +29,14 @@ class SwitcherAGISWriteFailure(Exception):
         return repr(self.value)
 
 
+class SwitcherHTTPFailure(Exception):
+    def __init__(self, value, status, reason):
+        self.status = status
+        self.value = 'Failure requesting %s : HTTP %s %s' %(value, status, reason)
+    def __str__(self):
+        return repr(self.value)
+
+
 class SwitcherEmailSendFailure(Exception):
     def __init__(self, value, ex):
         self.value = 'Failure sending email to %s : %s' %(value, ex)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import logging
+
+
+class Thresholds(object):
+    """
+    class with the content of the downtimes config file,
+    converted once to seconds, and arranged by queue type,
+    so it can be shared by reference by all Queue and CE objects.
+
+    For each queue type, the time before a downtime to act on the queue is
+        downtime_length_d[<CE|DDM>][<setbrokeroff|setoffline>][<tooshort|short|long>]
+    in seconds, or None if no action must be done.
+    """
+
+    queue_types = ['analysis', 'production', 'other']
+
+    def __init__(self, downtimesconf):
+        """
+        :param SafeConfigParser downtimesconf: config with data about
+                                               when to change status
+        """
+        self.log = logging.getLogger('thresholds')
+        self.time_to_disable_sec = downtimesconf.getint('CE', 'setdisable') * 3600
+        self.max_duration_tooshort = downtimesconf.getint('QUEUE', 'max_duration_tooshort') * 3600
+        self.max_duration_short = downtimesconf.getint('QUEUE', 'max_duration_short') * 3600
+
+        self.downtime_length_d = {}
+        for queue_type in self.queue_types:
+            self.downtime_length_d[queue_type] = self.__get_downtime_length_d(downtimesconf, queue_type)
+        self.log.debug('Object Thresholds created.')
+
+
+    def __get_downtime_length_d(self, downtimesconf, queue_type):
+        """
+        get the times before a downtime to act on a type of queue
+        :param str queue_type: analysis, production or other
+        :return dict:
+        """
+        # -------------------------------------------------
+        def get_value(key):
+            try:
+                value = downtimesconf.getint('QUEUE', key) * 3600
+            except:
+                value = None
+            return value
+        # -------------------------------------------------
+
+        out = {}
+        # entities are named SRM, instead of DDM, in the config file
+        for entity, confname in [('CE', 'CE'), ('DDM', 'SRM')]:
+            out[entity] = {}
+            for action in ['setbrokeroff', 'setoffline']:
+                out[entity][action] = {}
+                for length in ['tooshort', 'short', 'long']:
+                    key = '%s_%s_%s_%s' %(length, confname, queue_type, action)
+                    out[entity][action][length] = get_value(key)
+        return out
+
+
+    def get_downtime_length_d(self, queue_type):
+        """
+        :param str queue_type: the type of the queue in schedconfig
+        :return dict: the times to act on a queue of that type
+        """
+        if queue_type not in ['analysis', 'production']:
+            queue_type = 'other'
+        return self.downtime_length_d[queue_type]
+
+
+    def get_offsets(self):
+        """
+        get all the different times, in seconds,
+        that an action can be done in advance to a downtime
+        :return set:
+        """
+        out = set([self.time_to_disable_sec])
+        for length_d in self.downtime_length_d.values():
+            for action_d in length_d.values():
+                for seconds_d in action_d.values():
+                    for seconds in seconds_d.values():
+                        if seconds is not None:
+                            out.add(seconds)
+        return out
@@ -1,26 +1,26 @@
 #!/usr/bin/env python
 
-import copy
-import logging
 import time
 
 
 class TimeInterval(object):
     """
-    class to manipulate time intervals
+    class to manipulate time intervals.
+    Lots of them are created while extending and overlapping downtimes,
+    so they use __slots__ and do not log.
     """
+
+    __slots__ = ('start_t', 'end_t', 'original_timeinterval')
+
     def __init__(self, start_t, end_t):
         """
         :param int start_t: starting time in seconds since epoch
         :param int end_t: starting time in seconds since epoch
         """
-        self.log = logging.getLogger('timeinterval')
-        self.log.debug('TimeInterval object with inputs %s, %s.' %(start_t, end_t))
         self.start_t = start_t
         self.end_t = end_t
         self.original_timeinterval = None  # to be filled when 
                                            # method extend() is called
-        self.log.debug('TimeInterval object initialized.')
 
 
     def get_original_start_t(self):
@@ -53,11 +53,9 @@ class TimeInterval(object):
         :param int extend_sec: number of seconds to advance the start time
         :return TimeInterval:
         """
-        self.log.debug('Starting with extend_sec %s.' %extend_sec)
         new_timeinterval = ExtendedTimeInterval(self.start_t - extend_sec, self.end_t)
-        new_timeinterval.original_timeinterval = copy.copy(self)
-        #new_timeinterval.original_timeinterval = TimeInterval(self.start_t, self.end_t)
-        self.log.debug('Leaving, returing %s.' %new_timeinterval)
+        # the original values never change, so no copy is needed
+        new_timeinterval.original_timeinterval = self
         return new_timeinterval 
 
 
@@ -67,16 +65,12 @@ class TimeInterval(object):
         :param TimeInterval other: another TimeInterval object
         :return TimeInterval or None:
         """
-        self.log.debug('Starting with other %s.' %other)
         max_start_t = max(self.start_t, other.start_t)
         min_end_t = min(self.end_t, other.end_t)
         if max_start_t >= min_end_t:
-            self.log.info('Original itervals do not overlap.')
             return None
         else:
-            out = TimeInterval(max_start_t, min_end_t)
-            self.log.info('Leaving, returning %s.' %out)
-            return out
+            return TimeInterval(max_start_t, min_end_t)
 
 
     def expired(self):
@@ -85,11 +79,8 @@ class TimeInterval(object):
         is already in the past
         :return bool:
         """
-        self.log.debug('Starting.')
         now = int(time.time())
-        out = now > self.end_t
-        self.log.debug('Leaving, returning %s.' %out)
-        return out
+        return now > self.end_t
 
 
     def __contains__(self, t_epoch):
@@ -105,11 +96,8 @@ class TimeInterval(object):
         :param int t_epoch: time in seconds since epoch.
         :return boolean:
         """
-        self.log.debug('Starting for time %s.' %t_epoch)
-        out = t_epoch >= self.start_t and\
-              t_epoch < self.end_t
-        self.log.debug('Leaving, returning %s.' %out)
-        return out
+        return t_epoch >= self.start_t and\
+               t_epoch < self.end_t
 
 
     # FIXME: maybe this is not a good idea
@@ -122,10 +110,7 @@ class TimeInterval(object):
         :param int t_epoch: time in seconds since epoch
         :return boolean:
         """
-        self.log.debug('Starting for time %s.' %t_epoch)
-        out = t_epoch > self.end_t
-        self.log.debug('Leaving, returning %s.' %out)
-        return out
+        return t_epoch > self.end_t
 
 
     def shorter_than(self, seconds):
@@ -135,10 +120,7 @@ class TimeInterval(object):
         :param int seconds: numbrer of seconds to compare with
         :return bool:
         """
-        self.log.debug('Starting.')
-        out = (self.end_t - self.start_t) < seconds
-        self.log.debug('Leaving, returning %s.' %out)
-        return out
+        return (self.end_t - self.start_t) < seconds
 
 
 class ExtendedTimeInterval(TimeInterval):
@@ -149,6 +131,8 @@ class ExtendedTimeInterval(TimeInterval):
     so it is possible to retrieve the original times later on. 
     """
 
+    __slots__ = ()
+
     def get_original_start_t(self):
         """
         returns the original value of start time.
@@ -167,6 +151,49 @@ class ExtendedTimeInterval(TimeInterval):
         return self.original_timeinterval.get_original_end_t()
 
 
+class Timeline(object):
+    """
+    class to rasterize time intervals onto a fixed resolution bitmap,
+    from start_t to end_t, in slots of slot_sec seconds.
+    The bitmap is a python int: bit i is set when the interval
+    touches the slot i.
+    Intervals already finished at start_t are placed in the first slot,
+    and the ones starting after end_t are left out.
+    Therefore, if several intervals overlap at any time
+    between start_t and end_t, the AND of their bitmaps is not zero.
+    The opposite is not true, as resolution is limited.
+    """
+
+    __slots__ = ('start_t', 'end_t', 'slot_sec', 'full')
+
+    def __init__(self, start_t, end_t, slot_sec=300):
+        """
+        :param int start_t: first time in the bitmap, in seconds since epoch
+        :param int end_t: last time in the bitmap, in seconds since epoch
+        :param int slot_sec: resolution of the bitmap, in seconds
+        """
+        self.start_t = start_t
+        self.end_t = end_t
+        self.slot_sec = slot_sec
+        nslots = (end_t - start_t) // slot_sec + 1
+        self.full = (1 << nslots) - 1
+
+
+    def mask(self, start_t, end_t):
+        """
+        get the bitmap for the interval [start_t, end_t)
+        :param int start_t: seconds since epoch
+        :param int end_t: seconds since epoch
+        :return int:
+        """
+        if start_t >= end_t or start_t > self.end_t:
+            return 0
+        first = max(0, (start_t - self.start_t) // self.slot_sec)
+        last = max(0, (end_t - 1 - self.start_t) // self.slot_sec)
+        bits = ((1 << (last - first + 1)) - 1) << first
+        return bits & self.full
+
+
 
 
 
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+import logging
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class CEBatchEvaluator(object):
+    """
+    class to evaluate many CEs at once.
+    The start and end times of the Downtimes of all CEs 
+    are packed in NumPy arrays, CE by CE, 
+    and the Downtime setting each CE INACTIVE is found for all of them 
+    in a single vectorized pass, with the same criteria 
+    as CE.check_if_future_downtime().
+    Then each CE records its Event, like when evaluated one by one.
+    NumPy is optional: without it, this class is not available.
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger('topology')
+
+
+    @staticmethod
+    def available():
+        """
+        :return bool: True if NumPy can be imported
+        """
+        return numpy is not None
+
+
+    def evaluate(self, ce_l):
+        """
+        evaluates a list of CEs.
+        CEs already evaluated, or in a state excluded 
+        for Switcher purposes, are left as they are.
+        :param list ce_l: CE objects
+        """
+        self.log.debug('Starting.')
+        ce_l = [ce for ce in ce_l if not ce.event and ce.state in ['ACTIVE', 'INACTIVE']]
+        culprit_l = self.__find_downtimes(ce_l)
+        for ce, culprit in zip(ce_l, culprit_l):
+            ce.evaluate(lambda culprit=culprit: culprit)
+        self.log.debug('Leaving, %s CEs evaluated.' %len(ce_l))
+
+
+    def __find_downtimes(self, ce_l):
+        """
+        finds, for each CE, the first Downtime added among those 
+        in progress at now + time to disable the CE, 
+        or finished before then
+        :param list ce_l: CE objects
+        :return list: a Downtime, or None, for each CE
+        """
+        now = time.time()
+        t_l = []
+        start_l = []
+        end_l = []
+        owner_l = []
+        downtime_l = []
+        for index, ce in enumerate(ce_l):
+            t_l.append(int(now + ce.time_to_disable_sec))
+            for downtime in ce.getEndpointDowntimes().getlist():
+                start_l.append(downtime.timeinterval.start_t)
+                end_l.append(downtime.timeinterval.end_t)
+                owner_l.append(index)
+                downtime_l.append(downtime)
+
+        culprit_l = [None] * len(ce_l)
+        if not downtime_l:
+            return culprit_l
+        owner = numpy.array(owner_l, dtype=numpy.intp)
+        start = numpy.array(start_l, dtype=numpy.int64)
+        end = numpy.array(end_l, dtype=numpy.int64)
+        t = numpy.array(t_l, dtype=numpy.int64)[owner]
+        # t in the Downtime, or the Downtime is before t
+        hit = numpy.flatnonzero(((start <= t) & (t < end)) | (end < t))
+        # Downtimes are packed CE by CE, in the order they were added,
+        # so the first hit for each CE is the culprit
+        owner_hit, first = numpy.unique(owner[hit], return_index=True)
+        for index, position in zip(owner_hit.tolist(), hit[first].tolist()):
+            culprit_l[index] = downtime_l[position]
+        return culprit_l
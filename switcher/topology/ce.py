@@ -11,16 +11,26 @@ from switcher.downtime import EndpointDowntimes, EndpointDowntimesSet, OverlapDo
 
 class CE(AGISCE):
 
-    def __init__(self, endpoint, downtimesconf):
+    __slots__ = ('thresholds', 'endpointdowntimes', 'event', 
+                 'time_to_disable_sec', 'extendedendpointdowntimes')
+
+    # shared by all CEs, there can be many thousands of them
+    log = logging.getLogger('topology')
+
+    def __init__(self, endpoint, thresholds):
         """
         :param str endpoint: the CE endpoint
-        :param SafeConfigParser downtimesconf: config with data about 
-                                               when to change status
+        :param Thresholds thresholds: data about when to change status, 
+                                      from the downtimes config file
         """
         super(CE, self).__init__(endpoint)
-        self.log = logging.getLogger('topology')
-        self.downtimesconf = downtimesconf
-        self.endpointdowntimes = EndpointDowntimes()
+        self.thresholds = thresholds
+        # only created when a downtime is added, 
+        # as most CEs have none
+        self.endpointdowntimes = None
+        # calculated once per cycle, and shared by all queues using this CE.
+        # See getExtendedEndpointDowntimes()
+        self.extendedendpointdowntimes = None
         self.event = None
         self._read_config_parameters()
         self.log.debug('Object CESwitcher %s created.' %self.endpoint)
@@ -28,16 +38,21 @@ class CE(AGISCE):
 
     def _read_config_parameters(self):
         """
-        reads configuration from config file
+        get the time before a downtime to set the CE INACTIVE
         """
-        self.time_to_disable_sec = self.downtimesconf.getint('CE', 'setdisable') * 3600
+        self.time_to_disable_sec = self.thresholds.time_to_disable_sec
 
 
     def add_downtime(self, downtime):
+        if self.endpointdowntimes is None:
+            self.endpointdowntimes = EndpointDowntimes()
         self.endpointdowntimes.add(downtime)
+        self.extendedendpointdowntimes = None
 
 
     def getEndpointDowntimes(self):
+        if self.endpointdowntimes is None:
+            return EndpointDowntimes()
         return self.endpointdowntimes
 
 
@@ -49,18 +64,26 @@ class CE(AGISCE):
         time interval the CE will be INACTIVE, 
         while the original ones contained the time interval
         the CE is in scheduled downtime.
+        It is calculated only once, until a new Downtime is added, 
+        so the returned object must not be modified.
         :return EndpointDowntimes:
         """
         self.log.debug('Starting.')
-        out = self.endpointdowntimes.extend(self.time_to_disable_sec)
+        if self.extendedendpointdowntimes is None:
+            self.extendedendpointdowntimes = self.getEndpointDowntimes().extend(self.time_to_disable_sec)
+        out = self.extendedendpointdowntimes
         self.log.debug('Leaving, returning %s.' %out)
         return out
 
     # --------------------------------------------------------------------------
 
-    def evaluate(self):
+    def evaluate(self, find_downtime=None):
         """
         evaluates if this CE should change status ACTIVE/INACTIVE
+        :param find_downtime: function returning the Downtime 
+                              that sets this CE INACTIVE, or None.
+                              By default, check_if_future_downtime().
+                              Used to pass the result of a batch evaluation.
         """
         self.log.info('Evaluating CE %s' %self.endpoint)
 
@@ -72,7 +95,7 @@ class CE(AGISCE):
             self.log.debug('CE %s is in a state excluded for Switcher purposes. Doing nothing.' %self.endpoint)
         else:
             self.event = None
-            event = self._get_new_status() 
+            event = self._get_new_status(find_downtime)
             self.log.info('New status is %s' %event.new_status)
             if self.state == event.new_status:
                 self.log.info('New status is the same that current one. Nothing to do.')
@@ -84,15 +107,18 @@ class CE(AGISCE):
             self.log.debug('Leaving.')
 
     
-    def _get_new_status(self):
+    def _get_new_status(self, find_downtime=None):
         """
         finds out in which status this CE should be.
         An Event object is created with relevant info, and returned.
+        :param find_downtime: see evaluate()
         :return Event:
         """
         self.log.debug('Starting.')
         event = Event(entitytype='CE', uid=self.name)
-        downtime = self.check_if_future_downtime()
+        if find_downtime is None:
+            find_downtime = self.check_if_future_downtime
+        downtime = find_downtime()
         if downtime :
             event.new_status = 'INACTIVE'
             event.downtime = downtime
@@ -128,7 +154,7 @@ class CE(AGISCE):
         self.log.info('Checking if CE %s is affected by downtime.' %self.endpoint)
         t_epoch = int( time.time() + self.time_to_disable_sec) 
         # FIXME: what happens if there are more than one Downtime that can set the CE disabled???
-        for downtime in self.endpointdowntimes.getlist():
+        for downtime in self.getEndpointDowntimes().getlist():
             if t_epoch in downtime or downtime < t_epoch:
                 self.log.info('CE %s affected by downtime. Returning the culprit downtime.' %self.endpoint)
                 return downtime
@@ -181,9 +207,17 @@ class CE(AGISCE):
 
 class CEHandler(AGISCEHandler):
 
+    # shared by all handlers, there is one per Queue
+    log = logging.getLogger('switcher')
+
     def __init__(self):
         super(CEHandler, self).__init__()
-        self.log = logging.getLogger('switcher')
+        # the OverlapDowntimesList calculated during a cycle, 
+        # set by the Topology to a dictionary shared by all its handlers,
+        # as many Queues use the same CEs:
+        #   frozenset of CE endpoints -> (extended EndpointDowntimes, OverlapDowntimesList)
+        # None means nothing is cached
+        self.overlap_cache = None
 
 
     def evaluate(self):
@@ -191,22 +225,64 @@ class CEHandler(AGISCEHandler):
             ce.evaluate()
 
 
-    def getOverlapDowntimesList(self):
+    def getOverlapDowntimesList(self, timeline=None):
         """
         to get if all CEs will be INACTIVE at the same time.
+        If a Timeline is passed, the bitmaps of the extended downtimes 
+        of all CEs are AND'ed first. When the result is zero, 
+        there is no time within the Timeline with all CEs INACTIVE,
+        and the exact intervals are not calculated.
+        :param Timeline timeline: the times that matter to the Queue
         :return OverlapDowntimesList:
         """
         self.log.debug('Starting.')
-        endpointdowntimesset = EndpointDowntimesSet()
+        if timeline is not None and not self.__all_inactive(timeline):
+            self.log.debug('Not all CEs INACTIVE at the same time. Returning empty list.')
+            return OverlapDowntimesList()
+        endpointdowntimes_l = []
         for ce in self.getlist():
             self.log.debug('Processing CE %s' %ce.endpoint)
             endpointdowntimes = ce.getExtendedEndpointDowntimes()        
             self.log.debug('Got EndpointDowntimes %s' %endpointdowntimes)
+            endpointdowntimes_l.append(endpointdowntimes)
+
+        # the result is reused while the CEs do not get new Downtimes, 
+        # which would give them a new extended EndpointDowntimes
+        key = frozenset(self.getlistendpoints())
+        cached = None
+        if self.overlap_cache is not None:
+            cached = self.overlap_cache.get(key, None)
+        if cached is not None and\
+           len(cached[0]) == len(endpointdowntimes_l) and\
+           all(x is y for x, y in zip(cached[0], endpointdowntimes_l)):
+            out = cached[1]
+            self.log.debug('Leaving. Returning cached %s' %out)
+            return out
+
+        endpointdowntimesset = EndpointDowntimesSet()
+        for endpointdowntimes in endpointdowntimes_l:
             endpointdowntimesset.add(endpointdowntimes)
         out = endpointdowntimesset.getOverlapDowntimesList()
+        if self.overlap_cache is not None:
+            self.overlap_cache[key] = (endpointdowntimes_l, out)
         self.log.debug('Leaving. Returning %s' %out)
         return out
 
+
+    def __all_inactive(self, timeline):
+        """
+        checks, with the resolution of the Timeline, 
+        if all CEs may be INACTIVE at the same time
+        :param Timeline timeline:
+        :return bool:
+        """
+        mask = timeline.full
+        for ce in self.getlist():
+            mask &= ce.getEndpointDowntimes().get_mask(timeline, ce.time_to_disable_sec)
+            if not mask:
+                return False
+        return True
+
     
     def _collect_events(self):
         """
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+
+import logging
+from array import array
+
+from switcher.agistopology.columnar import AGISColumnarTopology
+from switcher.downtime import DowntimeCalendar, get_downtimes
+from switcher.topology.topology import TopologyMixin
+from switcher.topology.cloud import Cloud
+from switcher.topology.site import Site
+from switcher.topology.queue import Queue
+from switcher.topology.ce import CE
+from switcher.topology.ddm import DDM
+
+
+# codes for the status of the queues in Switcher
+SWITCHER_STATUS = [None, 'online', 'offline', 'brokeroff', 'unrecognized']
+
+
+class ColumnarTopology(AGISColumnarTopology, TopologyMixin):
+    """
+    implementation of the Switcher topology on top of AGISColumnarTopology.
+    The status in Switcher of each queue is one more column,
+    and downtimes are kept per CE and DDM row.
+    Queue, CE and DDM objects are only created, from the columns,
+    for the queues that may need an action (see get_dirty_queues()),
+    to be evaluated, acted on, and notified like in Topology.
+    Any other queue is online in Switcher, and would be evaluated
+    as online again, so it is reported with that Event, with no change.
+    """
+
+    def __init__(self, schedconfig_data, allowed_clouds, allowed_sites, allowed_queues, ddmtopology_data, notificationsconf, thresholds):
+        """
+        :param SafeConfigParser notificationsconf: config with the email addresses
+        :param Thresholds thresholds: data about when to change status,
+                                      from the downtimes config file
+        """
+        self.notificationsconf = notificationsconf
+        self.thresholds = thresholds
+        super(ColumnarTopology, self).__init__(schedconfig_data, allowed_clouds, allowed_sites, allowed_queues, ddmtopology_data)
+        self.log = logging.getLogger('topology')
+        self.clear()
+        self.log.debug('Object ColumnarTopology created.')
+
+
+    def clear(self):
+        """
+        clears everything recorded during a cycle
+        """
+        self.queue_switcher_status = array('b', [0]) * len(self.queue_names)
+        self.site_nucleus = array('b', [0]) * len(self.site_names)
+        self.ce_downtime_d = {}
+        self.ddm_downtime_d = {}
+        self.downtime_l = []
+        self.downtime_s = set()
+        self.calendar = DowntimeCalendar()
+        # objects created for the queues being evaluated
+        self.queue_d = {}
+        self.ce_d = {}
+        self.ddm_d = {}
+        # shared by the CEHandler of the Queues created in this cycle
+        self.overlap_cache = {}
+
+
+    def update(self, schedconfig_data, ddmtopology_data):
+        """
+        prepares this Topology for a new cycle
+        :param dict schedconfig_data: decoded content of AGIS schedconfig
+        :param dict ddmtopology_data: decoded content of AGIS DDM topology
+        :return bool: True if something changed in the topology
+        """
+        self.log.debug('Starting.')
+        changed = super(ColumnarTopology, self).update(schedconfig_data, ddmtopology_data)
+        self.clear()
+        self.log.debug('Leaving with output %s.' %changed)
+        return changed
+
+    # --------------------------------------------------------------------------
+
+    def add_switcher_status(self, data):
+        """
+        adds the status in Switcher to the queues
+        :param dict data: decoded content of the switcher status source.
+                          See Topology.add_switcher_status()
+        """
+        self.log.debug('Starting.')
+        for qname, info_d in data.items():
+            index = self.queue_index_d.get(qname, None)
+            if index is None:
+                self.log.warning('Queue %s is not in the Topology. Skipping it.' %qname)
+                continue
+            for mode, probes_d in info_d['a']['mode'].items():
+                if 'switcher' in probes_d:
+                    switcher_status = probes_d['switcher']['value'].lower()
+                    if switcher_status not in ['online', 'offline', 'brokeroff']:
+                        # we check for weird unexpected values set manually in AGIS
+                        switcher_status = 'unrecognized'
+                    self.queue_switcher_status[index] = SWITCHER_STATUS.index(switcher_status)
+        self.log.debug('Leaving.')
+
+    # --------------------------------------------------------------------------
+
+    def add_downtimes(self, data):
+        """
+        adds downtimes items to the CE and DDM rows
+        :param dict data: decoded content of the downtimes calendar
+        """
+        self.log.debug('Starting.')
+        for downtime in get_downtimes(data):
+            self.__add_a_downtime(downtime)
+        self.log.debug('Leaving.')
+
+
+    def __add_a_downtime(self, downtime):
+        """
+        stores a single Downtime instance
+        """
+        endpoint = downtime.endpoint
+        if downtime.severity == 'WARNING':
+            self.log.warning('Severity level for this downtime is WARNING. Ignoring it.')
+        elif downtime.expired():
+            self.log.warning('Downtime finished already. Ignoring it.')
+        elif downtime not in self.downtime_s:
+            if downtime.type == 'CE':
+                index = self.ce_index_d.get(endpoint, None)
+                if index is not None:
+                    self.log.info('Adding downtime to CE %s' %endpoint)
+                    self.ce_downtime_d.setdefault(index, []).append(downtime)
+                else:
+                    self.log.warning('The CE %s is not in the Topology. Skipping it.' %endpoint)
+            if downtime.type == 'SRM':
+                index = self.ddm_index_d.get(endpoint, None)
+                if index is not None:
+                    self.log.info('Adding downtime to DDM %s' %endpoint)
+                    self.ddm_downtime_d.setdefault(index, []).append(downtime)
+                else:
+                    self.log.warning('The DDM %s is not in the Topology. Skipping it.' %endpoint)
+            self.downtime_l.append(downtime)
+            self.downtime_s.add(downtime)
+            self.calendar.add(downtime)
+
+
+    def get_queues_for_downtime(self, downtime):
+        """
+        get the queues using the endpoint affected by a downtime
+        :param Downtime downtime:
+        :return list: names of the queues
+        """
+        if downtime.type == 'CE':
+            return self.queues_for_ce(downtime.endpoint)
+        if downtime.type == 'SRM':
+            return self.queues_for_ddm(downtime.endpoint)
+        return []
+
+    # --------------------------------------------------------------------------
+
+    def get_dirty_queues(self):
+        """
+        get the queues which evaluation may end in an action.
+        Same criteria as Topology.get_dirty_queues()
+        :return set: names of the queues
+        """
+        self.log.debug('Starting.')
+        index_s = set()
+        for index in self.ce_downtime_d:
+            index_s.update(self.ce_queue[self.ce_queue_start[index]:self.ce_queue_start[index + 1]])
+        for index in self.ddm_downtime_d:
+            index_s.update(self.ddm_queue[self.ddm_queue_start[index]:self.ddm_queue_start[index + 1]])
+        inactive = self.state_index_d.get('INACTIVE', None)
+        if inactive is not None:
+            for index, state in enumerate(self.ce_state):
+                if state == inactive:
+                    index_s.update(self.ce_queue[self.ce_queue_start[index]:self.ce_queue_start[index + 1]])
+        online = SWITCHER_STATUS.index('online')
+        for index, switcher_status in enumerate(self.queue_switcher_status):
+            if switcher_status != online:
+                index_s.add(index)
+        out = set([self.queue_names[index] for index in index_s])
+        self.log.debug('Leaving with %s queues.' %len(out))
+        return out
+
+
+    def evaluate(self, selective=True, batch=False):
+        """
+        evaluates the queues that may need an action.
+        Only those are evaluated, whatever the value of selective.
+        :param bool selective: ignored
+        :param bool batch: if True, the CEs are evaluated all at once, 
+                           with NumPy, before the queues
+        """
+        qname_s = self.get_dirty_queues()
+        self.log.info('Evaluating %s out of %s queues.' %(len(qname_s), len(self.queue_names)))
+        queue_l = [self.__get_queue_object(qname) for qname in qname_s]
+        if batch:
+            self._evaluate_ces_in_batch(self.ce_d.values())
+        for queue in queue_l:
+            queue.evaluate()
+        self.log.info('Leaving.')
+
+
+    def __get_queue_object(self, qname):
+        """
+        creates the Queue object for a row, with its CE and DDM objects
+        """
+        queue = self.queue_d.get(qname, None)
+        if queue is not None:
+            return queue
+        view = self.get_queue(qname)
+        qdata = view.data()
+        queue = Queue(view.name, qdata, self.thresholds)
+        queue.status = view.status
+        queue.probe = qdata['probe']
+        queue.switcher_status = SWITCHER_STATUS[self.queue_switcher_status[view.index]]
+        queue.cehandler.overlap_cache = self.overlap_cache
+        for ce_index in self.get_ce_indexes(view.index):
+            queue.add_ce(self.__get_ce_object(ce_index))
+        ddm_index = self.queue_ddm[view.index]
+        if ddm_index >= 0:
+            queue.add_ddm(self.__get_ddm_object(ddm_index))
+        self.queue_d[qname] = queue
+        return queue
+
+
+    def __get_ce_object(self, index):
+        endpoint = self.ce_endpoints[index]
+        ce = self.ce_d.get(endpoint, None)
+        if ce is None:
+            ce = CE(endpoint, self.thresholds)
+            ce.name = self.ce_names[index]
+            ce.state = self.state_names[self.ce_state[index]]
+            for downtime in self.ce_downtime_d.get(index, ()):
+                ce.add_downtime(downtime)
+            self.ce_d[endpoint] = ce
+        return ce
+
+
+    def __get_ddm_object(self, index):
+        endpoint = self.ddm_endpoints[index]
+        ddm = self.ddm_d.get(endpoint, None)
+        if ddm is None:
+            ddm = DDM(endpoint)
+            ddm.token = self.ddm_tokens[index]
+            for downtime in self.ddm_downtime_d.get(index, ()):
+                ddm.add_downtime(downtime)
+            self.ddm_d[endpoint] = ddm
+        return ddm
+
+    # --------------------------------------------------------------------------
+
+    def act(self, agisapi):
+        """
+        acts to change status of the queues and CEs evaluated,
+        and records their new status in the columns
+        :param serverapi agisapi: interface to change entities status in AGIS
+        """
+        self.log.info('Acting over all entities.')
+        for qname, queue in self.queue_d.items():
+            queue.act(agisapi)
+            self.get_queue(qname).status = queue.status
+        for endpoint, ce in self.ce_d.items():
+            self.get_ce(endpoint).state = ce.state
+        self.log.info('Leaving.')
+
+
+    def notify(self, email):
+        """
+        notify the clouds in case of changes.
+        Cloud and Site objects are created only for the queues evaluated,
+        as no other queue has changes to notify.
+        """
+        self.log.info('Notifying all clouds.')
+        cloud_d = {}
+        for qname, queue in self.queue_d.items():
+            view = self.get_queue(qname)
+            cloud = cloud_d.get(view.cloud, None)
+            if cloud is None:
+                cloud = Cloud(view.cloud, self.notificationsconf)
+                cloud_d[view.cloud] = cloud
+            site = cloud.site_d.get(view.site, None)
+            if site is None:
+                site = Site(view.site)
+                site.nucleus = bool(self.site_nucleus[self.queue_site[view.index]])
+                cloud.site_d[view.site] = site
+            site.queue_d[qname] = queue
+        for cloudname, cloud in cloud_d.items():
+            self.log.info('Notifying cloud %s.' %cloudname)
+            cloud.notify(email)
+        self.log.info('Leaving.')
+
+
+    def iter_queue_rows(self):
+        """
+        iterates over all queues, for reports like the SSB,
+        with the values (name, status, type, Event or None).
+        The queues not evaluated get the Event 
+        Topology.evaluate() would record for them.
+        """
+        online = SWITCHER_STATUS.index('online')
+        for index, qname in enumerate(self.queue_names):
+            queue = self.queue_d.get(qname, None)
+            if queue is not None:
+                event = queue.event
+            elif self.queue_switcher_status[index] == online:
+                event = Queue.get_online_event(qname, 'online')
+            else:
+                event = None
+            yield (self.queue_resources[index],
+                   self.status_names[self.queue_status[index]],
+                   self.type_names[self.queue_type[index]],
+                   event)
@@ -10,19 +10,29 @@ from switcher.downtime import EndpointDowntimes, OverlapDowntimes, OverlapDownti
 
 class DDM(AGISDDM):
 
+    __slots__ = ('endpointdowntimes',)
+
+    # shared by all DDMs
+    log = logging.getLogger('topology')
+
     def __init__(self, endpoint):
         super(DDM, self).__init__(endpoint)
-        self.log = logging.getLogger('topology')
         ###self.downtime_l = []
-        self.endpointdowntimes = EndpointDowntimes()
+        # only created when a downtime is added, 
+        # as most DDMs have none
+        self.endpointdowntimes = None
         self.log.debug('Object DDMSwitcher created.')
 
 
     def add_downtime(self, downtime):
+        if self.endpointdowntimes is None:
+            self.endpointdowntimes = EndpointDowntimes()
         self.endpointdowntimes.add(downtime)
 
 
     def getEndpointDowntimes(self):
+        if self.endpointdowntimes is None:
+            return EndpointDowntimes()
         return self.endpointdowntimes
 
 
@@ -32,23 +42,21 @@ class DDM(AGISDDM):
         """
         checks if there at least one downtime event 
         for this DDM a given number of seconds in the future.
-        We do it by checking if we are alrady affected by an
-        extended TimeInterval for any of the Downtime events registered.
+        We do it by checking if we are alrady affected by any
+        of the Downtime events registered, with its start time
+        moved that number of seconds earlier.
         :param int seconds: how many seconds to look into the future
         :return bool:
         """
         self.log.info('Checking if DDM %s is affected by downtime.' %self.endpoint)
-        for downtime in self.endpointdowntimes.getlist():
+        now = int(time.time())
+        for downtime in self.getEndpointDowntimes().getlist():
             timeinterval = downtime.timeinterval
-            extended_timeinterval = timeinterval.extend(seconds)
-            #if extended_timeinterval.belongs():
-            #    return True
-            if int(time.time()) in extended_timeinterval:
+            if timeinterval.start_t - seconds <= now < timeinterval.end_t:
                 return True
 
-        else:
-            self.log.info('DDM %s is not affected by downtime. Returning False.' %self.endpoint)
-            return False
+        self.log.info('DDM %s is not affected by downtime. Returning False.' %self.endpoint)
+        return False
 
 
 # =============================================================================
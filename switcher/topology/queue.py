@@ -8,22 +8,33 @@ from switcher.agistopology.queue import AGISQueue
 from switcher.topology.ce import CEHandler
 from switcher.topology.ddm import DDMHandler
 from switcher.event import QueueEvent, QueueEventList
+from switcher.timeinterval import Timeline
 
 
 
 class Queue(AGISQueue):
+
+    __slots__ = ('thresholds', 'switcher_status', 'event', 
+                 'max_duration_tooshort', 'max_duration_short', 
+                 'downtime_length_d')
+
+    # shared by all Queues
+    log = logging.getLogger('topology')
+
+    cehandler_class = CEHandler
+    ddmhandler_class = DDMHandler
+
+    # resolution of the Timeline for CE downtimes, in seconds
+    timeline_slot_sec = 300
     
-    def __init__(self, name, qdata, downtimesconf):
+    def __init__(self, name, qdata, thresholds):
         """
         :param str name: the queue name
-        :param SafeConfigParser downtimesconf: config with data about 
-                                               when to change status
+        :param Thresholds thresholds: data about when to change status, 
+                                      from the downtimes config file
         """
         super(Queue, self).__init__(name, qdata)
-        self.log = logging.getLogger('topology')
-        self.cehandler = CEHandler()
-        self.ddmhandler = DDMHandler()
-        self.downtimesconf = downtimesconf
+        self.thresholds = thresholds
         self.switcher_status = None
         self.event = None
         #self.reason_change = None
@@ -33,69 +44,12 @@ class Queue(AGISQueue):
 
     def _read_config_parameters(self):
         """
-        reads configuration from config file
+        get the thresholds for this type of queue.
+        They are shared with the rest of queues of the same type.
         """
-
-        self.max_duration_tooshort = self.downtimesconf.getint('QUEUE', 'max_duration_tooshort') * 3600
-        self.max_duration_short = self.downtimesconf.getint('QUEUE', 'max_duration_short') * 3600
-
-        self.downtime_length_d = {}
-        self.downtime_length_d['CE'] = {}
-        self.downtime_length_d['CE']['setbrokeroff'] = {}
-        self.downtime_length_d['CE']['setoffline'] = {}
-        self.downtime_length_d['DDM'] = {}
-        self.downtime_length_d['DDM']['setbrokeroff'] = {}
-        self.downtime_length_d['DDM']['setoffline'] = {}
-
-        if self.type in ['analysis', 'production']:
-            queue_type = self.type
-        else:
-            queue_type = 'other'
-
-        # -------------------------------------------------
-        def get_value(key):
-            try:
-                value = self.downtimesconf.getint('QUEUE', key) * 3600
-            except:
-                value = None
-            return value
-        # -------------------------------------------------
-
-        key = 'tooshort_CE_%s_setbrokeroff' %queue_type
-        self.downtime_length_d['CE']['setbrokeroff']['tooshort'] = get_value(key)
-
-        key = 'tooshort_CE_%s_setoffline' %queue_type
-        self.downtime_length_d['CE']['setoffline']['tooshort'] = get_value(key)
-
-        key = 'tooshort_SRM_%s_setbrokeroff' %queue_type
-        self.downtime_length_d['DDM']['setbrokeroff']['tooshort'] = get_value(key)
-
-        key = 'tooshort_SRM_%s_setoffline' %queue_type
-        self.downtime_length_d['DDM']['setoffline']['tooshort'] = get_value(key)
-
-        key = 'short_CE_%s_setbrokeroff' %queue_type
-        self.downtime_length_d['CE']['setbrokeroff']['short'] = get_value(key)
-
-        key = 'short_CE_%s_setoffline' %queue_type
-        self.downtime_length_d['CE']['setoffline']['short'] = get_value(key)
-
-        key = 'short_SRM_%s_setbrokeroff' %queue_type
-        self.downtime_length_d['DDM']['setbrokeroff']['short'] = get_value(key)
-
-        key = 'short_SRM_%s_setoffline' %queue_type
-        self.downtime_length_d['DDM']['setoffline']['short'] = get_value(key)
-
-        key = 'long_CE_%s_setbrokeroff' %queue_type
-        self.downtime_length_d['CE']['setbrokeroff']['long'] = get_value(key)
-
-        key = 'long_CE_%s_setoffline' %queue_type
-        self.downtime_length_d['CE']['setoffline']['long'] = get_value(key)
-
-        key = 'long_SRM_%s_setbrokeroff' %queue_type
-        self.downtime_length_d['DDM']['setbrokeroff']['long'] = get_value(key)
-
-        key = 'long_SRM_%s_setoffline' %queue_type
-        self.downtime_length_d['DDM']['setoffline']['long'] = get_value(key)
+        self.max_duration_tooshort = self.thresholds.max_duration_tooshort
+        self.max_duration_short = self.thresholds.max_duration_short
+        self.downtime_length_d = self.thresholds.get_downtime_length_d(self.type)
 
 
     # --------------------------------------------------------------------------
@@ -165,7 +119,7 @@ class Queue(AGISQueue):
         self.log.debug('Starting.')
 
         # first, collect all downtimes for entities belonging to this Queue
-        ce_downtime_collection_list = self.cehandler.getOverlapDowntimesList()
+        ce_downtime_collection_list = self.cehandler.getOverlapDowntimesList(self._get_ce_timeline())
         ddm_downtime_collection_list = self.ddmhandler.getOverlapDowntimesList()
 
         # First, we check if Queue should be OFFLINE becuase CE 
@@ -189,15 +143,59 @@ class Queue(AGISQueue):
             return event
 
         # If neither OFFLINE nor BROKEROFF, then the Queue should be ONLINE
+        event = self.get_online_event(self.name)
+
+        self.log.debug('Leaving with value %s.' %event)
+        return event
+
+
+    @staticmethod
+    def get_online_event(qname, old_status=None):
+        """
+        builds the Event for a queue that should be ONLINE
+        :param str qname: name of the queue
+        :param str old_status: current status of the queue in Switcher
+        :return QueueEvent:
+        """
         event = QueueEvent(entitytype='Queue',
-                      uid=self.name,
+                      uid=qname,
                       new_status = 'online')
         event.comment = 'set.online.by.Switcher'
-
-        self.log.debug('Leaving with value %s.' %event)
+        event.old_status = old_status
         return event
 
 
+    def skip_evaluation(self):
+        """
+        records, without evaluating anything, the Event that evaluate()
+        would record for a queue online in Switcher, 
+        with no downtimes and all its CEs ACTIVE: 
+        online again, so no change.
+        See Topology.get_dirty_queues()
+        """
+        self.event = self.get_online_event(self.name, self.switcher_status)
+
+
+    def _get_ce_timeline(self):
+        """
+        get the Timeline with the times when all CEs being INACTIVE 
+        can change the status of this Queue: 
+        from now to the longest time to act in advance to a downtime.
+        One extra slot is added, as _check_status() reads the clock again.
+        :return Timeline/None: None if there is no action for CEs
+        """
+        seconds_l = []
+        for length_d in self.downtime_length_d['CE'].values():
+            for length in ['short', 'long']:
+                if length_d[length] is not None:
+                    seconds_l.append(length_d[length])
+        if not seconds_l:
+            return None
+        now = int(time.time())
+        slot_sec = self.timeline_slot_sec
+        return Timeline(now, now + max(seconds_l) + slot_sec, slot_sec)
+
+
     # FIXME
     # too much duplicated code between this method and should_be_brokeroff
     def should_be_offline(self, downtime_collection_list, downtime_length_d):
@@ -4,30 +4,151 @@ import logging
 import time
 
 from switcher.agistopology.topology import AGISTopology
-from switcher.switcherexceptions import SwitcherConfigurationFailure
-from switcher.downtime import Downtime, get_downtimes
+from switcher.ingest import SCHEDCONFIG_STATUS
+from switcher.downtime import Downtime, DowntimeCalendar, get_downtimes
 from switcher.topology.cloud import Cloud
 from switcher.topology.site import Site
 from switcher.topology.queue import Queue
+from switcher.topology.batch import CEBatchEvaluator
 from switcher.topology.ce import CE, CEHandler
 from switcher.topology.ddm import DDM
-from switcher.utils import load_json
 
 
 
-class Topology(AGISTopology):
+class TopologyMixin(object):
+    """
+    methods common to all implementations of the Switcher topology.
+    They only look at the downtimes recorded in the cycle,
+    in self.downtime_l and self.calendar, and at the Queue and CE objects evaluated,
+    in self.queue_d and self.ce_d.
+    """
+
+    def next_change_time(self, now):
+        """
+        calculates the earliest time, from now on, 
+        when the result of evaluate() may be different, 
+        with the same inputs.
+        Evaluation only depends on time by comparing 
+        now + <a threshold from the config> 
+        with the start or end of a downtime, 
+        or of a downtime extended to the time to disable the CE, 
+        so the result can not change before the first 
+        of those points in time is reached.
+        The output may be earlier than the actual change, never later.
+        :param float now: seconds since epoch
+        :return float: seconds since epoch, or None if it never changes
+        """
+        self.log.debug('Starting.')
+        offset_s = set([0]) | self.thresholds.get_offsets()
+        disable = self.thresholds.time_to_disable_sec
+
+        # some comparisons are strict, or done on times truncated to seconds,
+        # so the change may happen up to 1 second after a crossing point.
+        # Points that recent are still returned
+        since = now - 1
+        out = None
+        for offset in offset_s:
+            # the first start, end, or start of the extended downtime,
+            # not before since + offset
+            for t in [self.calendar.next_start(since + offset), 
+                      self.calendar.next_end(since + offset)]:
+                if t is not None and (out is None or t - offset < out):
+                    out = t - offset
+            t = self.calendar.next_start(since + offset + disable)
+            if t is not None and (out is None or t - disable - offset < out):
+                out = t - disable - offset
+        self.log.debug('Leaving with output %s.' %out)
+        return out
+
+
+    def _evaluate_ces_in_batch(self, ce_l):
+        """
+        evaluates a list of CEs at once, before their queues, 
+        if NumPy is available. 
+        Otherwise, they are evaluated one by one with their queues.
+        :param list ce_l: CE objects
+        """
+        if not CEBatchEvaluator.available():
+            self.log.warning('NumPy is not available. CEs are evaluated one by one.')
+            return
+        CEBatchEvaluator().evaluate(ce_l)
+
+
+    def has_pending_actions(self):
+        """
+        checks if some status change could not be done in act()
+        :return bool:
+        """
+        for entity in self.queue_d.values() + self.ce_d.values():
+            if entity.event and entity.event.status_changed and not entity.event.done:
+                return True
+        return False
+
+    # --------------------------------------------------------------------------
+
+    def reevaluate(self, sources):
+        """
+        check the actual final status of the panda queues.
+        If a queue still have a value different that the new Switcher value, 
+        a WARNING message will be added to the email notifications
+        :param Sources sources: object to read the sched config data again,
+                                with its timeouts and retries
+
+        FIXME ?
+        Maybe the right way of doing this is to create a second whole Topology tree, 
+        and merge it against the current one.
+        For example, Topology.reevaluate() calls Topology.update(newtopology)
+                     -> Cloud.update(newtopology) 
+                     -> Site.update(newtopology) 
+                     -> Queue.update(newtopology) 
+        and the value of queue_final_status is assigned 
+        to self.event in Queue.update()
+        """
+        self.log.info('Starting.')
+        new_schedconfig_data = sources.reload('schedconfig', SCHEDCONFIG_STATUS)
+
+        for qname, queue in self.queue_d.items():
+            self.log.debug('considering queue %s for reevaluation' %qname)
+            if queue.event:
+                self.log.debug('queue %s is candidate for reevaluation' %qname)
+                final_status = new_schedconfig_data[qname]['status']
+                self.log.debug('final status for queue %s is %s' %(qname, final_status))
+                queue.event.queue_final_status = final_status
+
+        self.log.info('Leaving.')
+
+
+    def iter_queue_rows(self):
+        """
+        iterates over all queues, for reports like the SSB,
+        with the values (name, status, type, Event or None)
+        """
+        for queue in self.queue_d.values():
+            yield queue.name, queue.status, queue.type, queue.event
+
+
+
+class Topology(AGISTopology, TopologyMixin):
 
     # FIXME
     # passing allow_only and excluded_queues should be done in a better way
     # this is a temporary solution
-    def __init__(self, schedconfig, allowed_clouds, allowed_sites, allowed_queues, ddmtopology, notificationsconf, downtimesconf):
+    def __init__(self, schedconfig_data, allowed_clouds, allowed_sites, allowed_queues, ddmtopology_data, notificationsconf, thresholds):
         """
+        :param SafeConfigParser notificationsconf: config with the email addresses
+        :param Thresholds thresholds: data about when to change status, 
+                                      from the downtimes config file
         """
         self.notificationsconf = notificationsconf
-        self.downtimesconf = downtimesconf 
-        super(Topology, self).__init__(schedconfig, allowed_clouds, allowed_sites, allowed_queues, ddmtopology)
+        self.thresholds = thresholds
+        # overlappings of CE downtimes, shared by the CEHandler of all Queues
+        # during a cycle. See CEHandler.getOverlapDowntimesList()
+        self.overlap_cache = {}
+        super(Topology, self).__init__(schedconfig_data, allowed_clouds, allowed_sites, allowed_queues, ddmtopology_data)
         self.log = logging.getLogger('topology')
         self.downtime_l = []
+        self.downtime_s = set()
+        self.calendar = DowntimeCalendar()
         self.log.debug('Object TopologySwitcher created.')
 
     # -------------------------------------------------------------------------
@@ -40,10 +161,12 @@ class Topology(AGISTopology):
         return Site(sitename)
  
     def _getNextQueue(self, panda_resource, qdata):
-        return Queue(panda_resource, qdata, self.downtimesconf)
+        queue = Queue(panda_resource, qdata, self.thresholds)
+        queue.cehandler.overlap_cache = self.overlap_cache
+        return queue
  
     def _getNextCE(self, ce_endpoint):
-        return CE(ce_endpoint, self.downtimesconf)
+        return CE(ce_endpoint, self.thresholds)
  
     def _getNextDDM(self, endpoint):
         return DDM(endpoint)
@@ -51,12 +174,63 @@ class Topology(AGISTopology):
     def _get_cehandler(self):
         return CEHandler()
 
+    # --------------------------------------------------------------------------
+
+    def update(self, schedconfig_data, ddmtopology_data):
+        """
+        prepares this Topology for a new cycle:
+        applies the differences in schedconfig and DDM topology, 
+        and clears everything recorded during the previous cycle 
+        (switcher status, downtimes, nucleus, events, 
+        and the status changes done in AGIS), 
+        to be added again from the new inputs.
+        :param dict schedconfig_data: decoded content of AGIS schedconfig
+        :param dict ddmtopology_data: decoded content of AGIS DDM topology
+        :return bool: True if something changed in the topology
+        """
+        self.log.debug('Starting.')
+        changed = super(Topology, self).update(schedconfig_data, ddmtopology_data)
+        self.clear()
+        self.log.debug('Leaving with output %s.' %changed)
+        return changed
+
+
+    def clear(self):
+        """
+        clears everything recorded during a cycle.
+        The status changes done in AGIS are undone here too,
+        as the next schedconfig already contains them.
+        """
+        self.log.debug('Starting.')
+        self.downtime_l = []
+        self.downtime_s = set()
+        self.calendar = DowntimeCalendar()
+        for site in self.site_d.values():
+            site.nucleus = False
+        for qname, queue in self.queue_d.items():
+            if queue.event and queue.event.done:
+                self._reset_queue_status(qname, queue)
+            queue.event = None
+            queue.switcher_status = None
+        for ce in self.ce_d.values():
+            if ce.event and ce.event.done:
+                self._reset_ce_state(ce)
+            ce.event = None
+            ce.endpointdowntimes = None
+            ce.extendedendpointdowntimes = None
+        # the handlers keep a reference to it
+        self.overlap_cache.clear()
+        for ddm in self.ddm_d.values():
+            ddm.endpointdowntimes = None
+        self.log.debug('Leaving.')
+
 
     # --------------------------------------------------------------------------
 
-    def add_switcher_status(self, source):
+    def add_switcher_status(self, data):
         """
         adds the status in Switcher to the queues
+        :param dict data: decoded content of the switcher status source
 
         the content of the source data looks like this:
 
@@ -86,17 +260,12 @@ class Topology(AGISTopology):
                         (those which latest probe was switcher)
         """
         self.log.debug('Starting.')
-        try:
-            data = load_json(source)
-        except Exception as ex:
-            self.log.critical('Unable to read switcher status configuration from src. Exception: %s' %ex)
-            raise SwitcherConfigurationFailure(source, ex)
         for qname, info_d in data.items():
             self.log.debug('Processing queue %s' %qname)
             queue = self.queue_d.get(qname, None)
             if queue:
                 for mode, probes_d in info_d['a']['mode'].items():
-                    if 'switcher' in probes_d.keys():
+                    if 'switcher' in probes_d:
                         switcher_status = probes_d['switcher']['value']
                         switcher_status = switcher_status.lower()
                         if switcher_status not in ['online', 'offline', 'brokeroff']:
@@ -110,16 +279,12 @@ class Topology(AGISTopology):
 
     # --------------------------------------------------------------------------
 
-    def add_downtimes(self, source):
+    def add_downtimes(self, data):
         """
         adds downtimes items to CEs and DDMs entities
+        :param dict data: decoded content of the downtimes calendar
         """
         self.log.debug('Starting.')
-        try:
-            data = load_json(source)
-        except Exception as ex:
-            self.log.critical('Unable to read donwtimes configuration from src. Exception: %s' %ex)
-            raise SwitcherConfigurationFailure(source, ex)
         downtime_l = get_downtimes(data)
         self.log.debug('Downtimes: %s' %downtime_l)
         for downtime in downtime_l:
@@ -141,12 +306,12 @@ class Topology(AGISTopology):
         elif downtime.expired():
             self.log.warning('Downtime finished already. Ignoring it.')
         else:
-            if downtime not in self.downtime_l:
+            if downtime not in self.downtime_s:
 
                 if downtime.type == 'CE':
                     ce = self.ce_d.get(endpoint, None)
                     if ce:
-                        self.log.info('Adding downtime to CE %s' %endpoint)
+                        self.log.info('Adding downtime to CE %s, used by queues %s' %(endpoint, list(self.get_queues_for_downtime(downtime))))
                         ###ce.downtime_l.append(downtime)
                         ce.add_downtime(downtime)
                     else:
@@ -156,29 +321,102 @@ class Topology(AGISTopology):
                 if downtime.type == 'SRM':  # FIXME, only SRM ????
                     ddm = self.ddm_d.get(endpoint, None)
                     if ddm:
-                        self.log.info('Adding downtime to DDM %s' %endpoint)
+                        self.log.info('Adding downtime to DDM %s, used by queues %s' %(endpoint, list(self.get_queues_for_downtime(downtime))))
                         ###ddm.downtime_l.append(downtime)
                         ddm.add_downtime(downtime)
                     else:
                         self.log.warning('The DDM %s is not in the Topology. Skipping it.' %endpoint)
 
                 self.downtime_l.append(downtime)
+                self.downtime_s.add(downtime)
+                self.calendar.add(downtime)
+
+
+    def get_queues_for_downtime(self, downtime):
+        """
+        get the queues using the endpoint affected by a downtime
+        :param Downtime downtime:
+        :return set: names of the queues
+        """
+        if downtime.type == 'CE':
+            return self.registry.queues_for_ce(downtime.endpoint)
+        if downtime.type == 'SRM':
+            return self.registry.queues_for_ddm(downtime.endpoint)
+        return frozenset()
 
     # --------------------------------------------------------------------------
 
-    def evaluate(self):
+    def evaluate(self, selective=False, batch=False):
         """
         triggers the evaluation of all registered downtimes
         for all entitites in the Topology, 
         to check with ones need to change status
+        :param bool selective: if True, only the queues that may need 
+                               an action are evaluated. See get_dirty_queues()
+        :param bool batch: if True, the CEs are evaluated all at once, 
+                           with NumPy, before the queues
         """
+        if selective:
+            self.__evaluate_dirty_queues(batch)
+            return
         self.log.info('Evaluating all entities.')
+        if batch:
+            self._evaluate_ces_in_batch(self.ce_d.values())
         for cloudname, cloud in self.cloud_d.items():
             self.log.info('Evaluating cloud %s.' %cloudname)
             cloud.evaluate()
         self.log.info('Leaving.')
 
 
+    def __evaluate_dirty_queues(self, batch=False):
+        """
+        evaluates only the queues returned by get_dirty_queues().
+        The rest of queues get the Event a full evaluation would record,
+        online with no change, so reports like the SSB do not depend on it.
+        """
+        qname_s = self.get_dirty_queues()
+        self.log.info('Evaluating %s out of %s queues.' %(len(qname_s), len(self.queue_d)))
+        if batch:
+            ce_d = {}
+            for qname in qname_s:
+                for ce in self.queue_d[qname].cehandler.getlist():
+                    ce_d[ce.endpoint] = ce
+            self._evaluate_ces_in_batch(ce_d.values())
+        for qname, queue in self.queue_d.items():
+            if qname in qname_s:
+                queue.evaluate()
+            else:
+                queue.skip_evaluation()
+        self.log.info('Leaving.')
+
+
+    def get_dirty_queues(self):
+        """
+        get the queues which evaluation may end in an action:
+            -- queues using a CE or DDM with downtimes,
+            -- queues using a CE currently INACTIVE, 
+               as it may need to be set ACTIVE again,
+            -- queues which status in Switcher is not online.
+        Any other queue would be evaluated as online, 
+        with all its CEs ACTIVE, which is what they are already.
+        :return set: names of the queues
+        """
+        self.log.debug('Starting.')
+        out = set()
+        for downtime in self.downtime_l:
+            out.update(self.get_queues_for_downtime(downtime))
+        for endpoint, ce in self.ce_d.items():
+            if ce.state == 'INACTIVE':
+                out.update(self.registry.queues_for_ce(endpoint))
+        for qname, queue in self.queue_d.items():
+            if queue.switcher_status != 'online':
+                out.add(qname)
+        # the indexes only refer to queues in the topology, but just in case
+        out.intersection_update(self.queue_d)
+        self.log.debug('Leaving with %s queues.' %len(out))
+        return out
+
+
     def act(self, agisapi):
         """
         acts to change status of entities, based on the result
@@ -192,39 +430,6 @@ class Topology(AGISTopology):
         self.log.info('Leaving.')
 
 
-    # --------------------------------------------------------------------------
-
-    def reevaluate(self, schedconfig):
-        """
-        check the actual final status of the panda queues.
-        If a queue still have a value different that the new Switcher value, 
-        a WARNING message will be added to the email notifications
-        :param schedconfig: url or path to the sched config data
-
-        FIXME ?
-        Maybe the right way of doing this is to create a second whole Topology tree, 
-        and merge it against the current one.
-        For example, Topology.reevaluate() calls Topology.update(newtopology)
-                     -> Cloud.update(newtopology) 
-                     -> Site.update(newtopology) 
-                     -> Queue.update(newtopology) 
-        and the value of queue_final_status is assigned 
-        to self.event in Queue.update()
-        """
-        self.log.info('Starting.')
-        new_schedconfig_data = load_json(schedconfig)
-
-        for qname, queue in self.queue_d.items():
-            self.log.debug('considering queue %s for reevaluation' %qname)
-            if queue.event:
-                self.log.debug('queue %s is candidate for reevaluation' %qname)
-                final_status = new_schedconfig_data[qname]['status']
-                self.log.debug('final status for queue %s is %s' %(qname, final_status))
-                queue.event.queue_final_status = final_status
-
-        self.log.info('Leaving.')
-
-
     def notify(self, email):
         """
         notify the clouds in case of changes
@@ -1,15 +1,24 @@
 #!/usr/bin/env python
 
 import calendar
+import fnmatch
+import gzip
 import json
 import logging
+import os
+import random
+import re
 import smtplib
 import time
-import urllib2
 
+from ConfigParser import SafeConfigParser
 from datetime import timedelta, datetime
 from time import strptime, mktime
 
+from switcher.ingest import load_projected
+from switcher.services import httpclient
+from switcher.switcherexceptions import SwitcherConfigurationFailure
+
 try:
     from email.mime.text import MIMEText
 except:
@@ -84,40 +93,63 @@ def send_notifications(subject, body, sender, to, cc=''):
 #    return data
 
 
-def load_json(source):
+def load_json(source, cache=None, projection=None, retry=None, timeout=None, deadline=None, client=None, copy_to=None):
     """
     get the json data either from URL or from file
+    :param str source: path or URL
+    :param HTTPCache cache: optional on-disk cache for documents from URLs
+    :param projection: optional fields to keep from each record, 
+                       see switcher.ingest. 
+                       When given, the document is decoded as a stream.
+    :param RetryPolicy retry: how many attempts, and how often. 
+                              By default, 3 attempts every 30 seconds.
+    :param tuple timeout: (connect, read) timeouts, in seconds, for URLs
+    :param float deadline: time, in seconds since epoch, after which 
+                           no more attempts are made
+    :param HTTPClient client: pool of persistent connections for URLs
+    :param file copy_to: optional file-like object where the document 
+                         is copied, as it is read, before being decoded
     """
     log.debug('Starting with source %s' %source)
-    max_trials = 3
+    if retry is None:
+        retry = RetryPolicy()
     trial = 0
-    while trial < max_trials:
+    while True:
         try:
-            data = _attemp_load_json(source)
+            if copy_to is not None:
+                # nothing from a previous attempt is kept
+                copy_to.seek(0)
+                copy_to.truncate()
+            data = _attemp_load_json(source, cache, projection, _clip_timeout(timeout, deadline), client, copy_to)
             break
         except Exception as ex:
             trial += 1
-            if trial < max_trials:
-                time.sleep(30)
-    else:
-        # while loop got to the end without breaking
-        # which means it did not work
-        # we re-raise the last Exception
-        raise ex
+            if trial >= retry.max_trials:
+                raise
+            delay = retry.delay(trial)
+            if deadline is not None and time.time() + delay >= deadline:
+                log.error('No time left before deadline for a new attempt to load data from %s' %source)
+                raise
+            log.warning('Attempt %s to load data from %s failed. Trying again in %.1f seconds' %(trial, source, delay))
+            time.sleep(delay)
 
     log.debug('Leaving with output %s.' %data)
     return data
 
-def _attemp_load_json(source):
+
+def _attemp_load_json(source, cache=None, projection=None, timeout=None, client=None, copy_to=None):
     """
     attempt to get the json data either from URL or from file
     """
     log.debug('Starting with source %s' %source)
     try:
         if source.startswith('http'):
-            data = json.load(urllib2.urlopen(source))
+            if cache:
+                data = cache.load_json(source, projection, timeout, client, copy_to)
+            else:
+                data = decode_json(open_url(source, timeout, client=client), projection, copy_to)
         else:
-            data = json.load(open(source))
+            data = decode_json(open_file(source), projection, copy_to)
     except Exception as ex:
         log.error('unabled to load data from %s' %source)
         raise ex
@@ -125,31 +157,293 @@ def _attemp_load_json(source):
     return data
 
 
+def _clip_timeout(timeout, deadline):
+    """
+    makes sure a (connect, read) timeout does not go beyond a deadline
+    :param tuple timeout: (connect, read) timeouts, in seconds, or None
+    :param float deadline: time, in seconds since epoch, or None
+    :return tuple or None:
+    """
+    if deadline is None:
+        return timeout
+    remaining = max(deadline - time.time(), 1)
+    if timeout is None:
+        return (remaining, remaining)
+    connect_timeout, read_timeout = timeout
+    return (min(connect_timeout, remaining), min(read_timeout, remaining))
+
+
+def open_url(url, timeout=None, headers=None, client=None, expected=(200,), decode=True):
+    """
+    performs a GET request on a persistent connection from the pool, 
+    with separate timeouts to establish the connection
+    and to wait for data once it is established.
+    The body is asked to be sent compressed (gzip or deflate).
+    :param str url: the URL
+    :param tuple timeout: (connect, read) timeouts, in seconds, or None
+    :param dict headers: extra headers for the request
+    :param HTTPClient client: the connection pool. 
+                              By default, one without X509 credentials.
+    :param tuple expected: valid status codes for the answer
+    :param bool decode: if True, the body is decompressed while being read.
+                        Otherwise, it is returned as sent by the server.
+    :return file: file-like object with the answer
+    """
+    if client is None:
+        client = httpclient.default_client
+    headers = dict(headers or {})
+    headers.setdefault('Accept-Encoding', 'gzip, deflate')
+    response = client.get(url, headers=headers, timeout=timeout)
+    httpclient.check_status(response, url, expected)
+    if not decode:
+        return response
+    return httpclient.decompress(response, response.getheader('Content-Encoding'))
+
+
+def open_file(path):
+    """
+    opens a local file, decompressing it if the name ends with .gz
+    :param str path: the path to the file
+    :return file:
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path)
+
+
+def file_signature(path):
+    """
+    get what identifies the current content of a file, 
+    without reading it
+    :param str path: the path to the file
+    :return tuple: (inode, size, modification time)
+    """
+    st = os.stat(path)
+    return (st.st_ino, st.st_size, st.st_mtime)
+
+
+class ConfigFile(object):
+    """
+    class to parse a config file only once per version of the file.
+    The file is parsed again only when its signature 
+    (inode, size, modification time) changes, 
+    so in-place edits and replacements are both noticed.
+    Optionally, the parsed content is converted with a given function, 
+    also once per version.
+    """
+
+    def __init__(self, path, compile=None):
+        """
+        :param str path: the path to the config file
+        :param compile: function to convert the SafeConfigParser object,
+                        or None to keep it as it is
+        """
+        self.path = path
+        self.compile = compile
+        self.signature = None
+        self.value = None
+
+
+    def load(self):
+        """
+        get the content of the file, parsing it again if it changed
+        :return: the SafeConfigParser object, or the output of compile
+        """
+        try:
+            signature = file_signature(self.path)
+            if signature != self.signature:
+                log.info('Reading config file %s' %self.path)
+                conf = SafeConfigParser()
+                conf.readfp(open(self.path))
+                if self.compile:
+                    conf = self.compile(conf)
+                self.value = conf
+                self.signature = signature
+        except Exception as ex:
+            log.critical('Unable to read config file %s: %s' %(self.path, ex))
+            raise SwitcherConfigurationFailure(self.path, ex)
+        return self.value
+
+
+    def restore(self, signature, value):
+        """
+        reuses a content parsed before, for example by a previous process,
+        if the file did not change since then
+        :param tuple signature: the signature of the file when it was parsed
+        :param value: what load() returned then
+        :return bool: True if the content is reused
+        """
+        try:
+            if file_signature(self.path) != signature:
+                return False
+        except OSError:
+            return False
+        self.signature = signature
+        self.value = value
+        return True
+
+
+class RetryPolicy(object):
+    """
+    class to decide how many times, and how often, 
+    attempting to load data from a source.
+    The delay between attempts grows exponentially, 
+    with an optional random jitter, 
+    so failing sources are not hammered by all clients at once.
+    """
+
+    def __init__(self, max_trials=3, backoff=30, backoff_max=30, jitter=False):
+        """
+        :param int max_trials: max number of attempts
+        :param float backoff: delay, in seconds, after the first failure
+        :param float backoff_max: upper limit for the delay
+        :param bool jitter: if True, the delay is randomized 
+                            between half and the whole value
+        """
+        self.max_trials = max_trials
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+
+
+    def delay(self, trial):
+        """
+        seconds to wait after a given failed attempt
+        :param int trial: number of attempts already failed
+        :return float:
+        """
+        delay = min(self.backoff_max, self.backoff * 2 ** (trial - 1))
+        if self.jitter:
+            delay = delay / 2.0 + random.uniform(0, delay / 2.0)
+        return delay
+
+
+def decode_json(f, projection=None, copy_to=None):
+    """
+    decodes the json document in a file-like object.
+    If a projection is given, the document is read as a stream, 
+    one record at a time, keeping only the fields in the projection.
+    :param file f: file-like object
+    :param projection: fields to keep from each record, or None
+    :param file copy_to: optional file-like object where all the bytes
+                         read from f are copied
+    """
+    if copy_to is not None:
+        f = TeeReader(f, copy_to)
+    try:
+        if projection is None:
+            data = json.load(f)
+        else:
+            data = load_projected(f, projection)
+        if copy_to is not None:
+            # the streaming decoder stops at the end of the document
+            f.drain()
+        return data
+    finally:
+        f.close()
+
+
+class TeeReader(object):
+    """
+    file-like wrapper copying to another file-like object
+    all the bytes being read
+    """
+
+    def __init__(self, f, copy_to):
+        """
+        :param file f: file-like object to read from
+        :param file copy_to: file-like object to write to
+        """
+        self.f = f
+        self.copy_to = copy_to
+
+
+    def read(self, amt=None):
+        if amt is None:
+            data = self.f.read()
+        else:
+            data = self.f.read(amt)
+        self.copy_to.write(data)
+        return data
+
+
+    def drain(self, chunk_size=65536):
+        """
+        reads, and copies, whatever is left
+        """
+        while self.read(chunk_size):
+            pass
+
+
+    def close(self):
+        self.f.close()
+
+
 # =============================================================================
 
 class AllowedEntities(object):
     """
     class to facilitate the decision making 
     about when to take into account 
-    an entity (Cloud, Site, Queue) from SchedConfig or not
+    an entity (Cloud, Site, Queue) from SchedConfig or not.
+    The names can also be glob patterns, like "CERN-*".
+    Both lists are compiled into a set of names 
+    and a list of regular expressions, 
+    so most lookups do not depend on the length of the lists.
     """
     def __init__(self, allow_only=None, excluded=None):
         self.allow_only = allow_only
         self.excluded = excluded
+        self._allow_only = _compile_names(allow_only)
+        self._excluded = _compile_names(excluded)
+
 
     def __contains__(self, entity):
 
-        if self.excluded:
-            if entity in self.excluded:
+        if self._excluded:
+            if _match_names(self._excluded, entity):
                 return False
 
-        if self.allow_only:
-            if entity not in self.allow_only:
+        if self._allow_only:
+            if not _match_names(self._allow_only, entity):
                 return False
 
         # default
         return True
 
 
+def _compile_names(name_l):
+    """
+    splits a list of names into the exact names 
+    and the glob patterns (with *, ? or [...])
+    :param list name_l: the names, or None
+    :return tuple: (set of names, list of compiled regular expressions), 
+                   or None if there are no names
+    """
+    if not name_l:
+        return None
+    name_s = set()
+    pattern_l = []
+    for name in name_l:
+        if '*' in name or '?' in name or '[' in name:
+            pattern_l.append(re.compile(fnmatch.translate(name)))
+        else:
+            name_s.add(name)
+    return (name_s, pattern_l)
 
 
+def _match_names(compiled, entity):
+    """
+    checks if a name is one of the compiled names or patterns
+    :param tuple compiled: output of _compile_names()
+    :param str entity: the name
+    :return bool:
+    """
+    name_s, pattern_l = compiled
+    if entity in name_s:
+        return True
+    if pattern_l and isinstance(entity, basestring):
+        for pattern in pattern_l:
+            if pattern.match(entity):
+                return True
+    return False
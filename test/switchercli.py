@@ -7,8 +7,10 @@ from ConfigParser import SafeConfigParser
 
 from switcher.agistopology.topology import AGISTopology
 from switcher.topology.topology import Topology
+from switcher.thresholds import Thresholds
 from switcher.services.serverapi import AGIS, AGISMock
 from switcher.services.notify import Email, EmailMock
+from switcher.utils import AllowedEntities, load_json
 
 
 # -----------------------------------------------------------------------------
@@ -51,16 +53,20 @@ notificationsconf.readfp(open('../etc/notifications.conf'))
 downtimesconf = SafeConfigParser()
 downtimesconf.readfp(open('../etc/downtimes.conf'))
 
+schedconfig_data = load_json(schedconfig)
+ddm_topology_data = load_json(ddm_topology)
+allowed = AllowedEntities()
+
 # -----------------------------------------------------------------------------
 # verify that the AGIS Topology works stand-alone
-agistopology = AGISTopology(schedconfig, ddm_topology)
+agistopology = AGISTopology(schedconfig_data, allowed, allowed, allowed, ddm_topology_data)
 log.debug(agistopology)
 
 # -----------------------------------------------------------------------------
-topology = Topology(schedconfig, ddm_topology, notificationsconf, downtimesconf)
-topology.add_switcher_status(switcher_status)
-topology.add_downtimes(downtimes_calendar)
-topology.add_nucleus(sites)
+topology = Topology(schedconfig_data, allowed, allowed, allowed, ddm_topology_data, notificationsconf, Thresholds(downtimesconf))
+topology.add_switcher_status(load_json(switcher_status))
+topology.add_downtimes(load_json(downtimes_calendar))
+topology.add_nucleus(load_json(sites))
 
 topology.evaluate()
 topology.act(AGISMock())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# tests for the archive of the inputs read on each cycle
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import glob
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from ConfigParser import SafeConfigParser
+
+from switcher.archive import Archive
+from switcher.sources import Sources
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.archivedir = os.path.join(self.tmpdir, 'archive')
+        self.conf = SafeConfigParser()
+        self.conf.add_section('SOURCE')
+        self.conf.set('SOURCE', 'archivedir', self.archivedir)
+        self.content_d = {}
+        for name in Sources.names:
+            # spaces and key order, as sent, are kept in the archive
+            content = '{"b": 1,  "a": ["%s"]}\n' %name
+            path = os.path.join(self.tmpdir, '%s.json' %name)
+            if name == 'sites':
+                path += '.gz'
+                f = gzip.open(path, 'wb')
+            else:
+                f = open(path, 'w')
+            f.write(content)
+            f.close()
+            self.conf.set('SOURCE', name, path)
+            self.content_d[name] = content
+        self.sources = Sources(self.conf)
+
+    def tearDown(self):
+        self.sources.close()
+        shutil.rmtree(self.tmpdir)
+
+    def get_manifests(self):
+        self.sources.archive.join()
+        path_l = sorted(glob.glob(os.path.join(self.archivedir, 'manifests', '*', '*.json')))
+        return [json.load(open(path)) for path in path_l]
+
+    def read(self, key):
+        return gzip.open(self.sources.archive.path(key)).read()
+
+    def test_raw_documents(self):
+        data_d = self.sources.fetch()
+        self.assertEqual(data_d['sites'], {'b': 1, 'a': ['sites']})
+        manifest_l = self.get_manifests()
+        self.assertEqual(len(manifest_l), 1)
+        input_d = manifest_l[0]['inputs']
+        self.assertEqual(sorted(input_d.keys()), sorted(Sources.names))
+        for name, content in self.content_d.items():
+            self.assertEqual(self.read(input_d[name]['hash']), content)
+            self.assertEqual(input_d[name]['source'], self.conf.get('SOURCE', name))
+
+    def test_identical_documents_stored_once(self):
+        self.sources.fetch()
+        self.sources.fetch()
+        manifest_l = self.get_manifests()
+        # two cycles in the same second have their own manifest
+        self.assertEqual(len(manifest_l), 2)
+        self.assertEqual(manifest_l[0]['inputs'], manifest_l[1]['inputs'])
+        object_l = glob.glob(os.path.join(self.archivedir, 'objects', '*', '*.json.gz'))
+        self.assertEqual(len(object_l), len(Sources.names))
+        # nothing is left behind once archived
+        self.assertEqual(os.listdir(os.path.join(self.archivedir, 'tmp')), [])
+
+    def test_data_from_memory(self):
+        self.conf.set('SOURCE', 'sites_ttl', '3600')
+        self.sources.close()
+        self.sources = Sources(self.conf)
+        self.sources.fetch()
+        self.sources.fetch()
+        manifest_l = self.get_manifests()
+        self.assertEqual(manifest_l[1]['inputs']['sites'], manifest_l[0]['inputs']['sites'])
+        self.assertEqual(self.read(manifest_l[1]['inputs']['sites']['hash']), self.content_d['sites'])
+
+    def test_manifest_path(self):
+        archive = Archive(os.path.join(self.tmpdir, 'other'))
+        path1 = archive.manifest_path(1500000000.25)
+        path2 = archive.manifest_path(1500000000.5)
+        self.assertNotEqual(path1, path2)
+        self.assertTrue(path1.endswith('20170714T024000.250000.json'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# tests for the evaluation of many CEs at once, with NumPy,
+# against the evaluation of the CEs one by one
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import random
+import unittest
+
+import switcher.topology.batch
+import switcher.topology.ce
+from switcher.topology.batch import CEBatchEvaluator
+from switcher.topology.ce import CE
+from switcher.topology.columnar import ColumnarTopology
+from switcher.topology.topology import Topology
+
+from test_downtime import NOW, get_downtime
+from test_topology import get_inputs, get_thresholds, get_topology
+
+
+class FrozenTime(object):
+    """
+    replaces the module time, so the CEs evaluated
+    one by one and all at once see the same time
+    """
+    def time(self):
+        return NOW + 0.5
+
+
+def get_events(ce_l):
+    return [ce.event and (ce.event.old_status, ce.event.new_status, ce.event.comment, ce.event.downtime)
+            for ce in ce_l]
+
+
+@unittest.skipIf(not CEBatchEvaluator.available(), 'NumPy is not available')
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.time_d = {}
+        for module in [switcher.topology.batch, switcher.topology.ce]:
+            self.time_d[module] = module.time
+            module.time = FrozenTime()
+        self.thresholds = get_thresholds()
+
+    def tearDown(self):
+        for module, time in self.time_d.items():
+            module.time = time
+
+    def get_ces(self, ce_data_l):
+        ce_l = []
+        for endpoint, state, downtime_l in ce_data_l:
+            ce = CE(endpoint, self.thresholds)
+            ce.name = endpoint
+            ce.state = state
+            for downtime in downtime_l:
+                ce.add_downtime(downtime)
+            ce_l.append(ce)
+        return ce_l
+
+    def test_random(self):
+        disable = self.thresholds.time_to_disable_sec
+        # times around now + the time to disable a CE, 
+        # including downtimes finishing exactly then, 
+        # with no length, or finishing before they start
+        t_l = [NOW + disable + delta for delta in [-7200, -1, 0, 1, 3600]]
+        rnd = random.Random(3)
+        ce_data_l = []
+        for i in range(500):
+            downtime_l = []
+            for j in range(rnd.randint(0, 3)):
+                downtime_l.append(get_downtime('ce%s' %i, rnd.choice(t_l), rnd.choice(t_l)))
+            state = rnd.choice(['ACTIVE', 'ACTIVE', 'INACTIVE', 'DISABLED'])
+            ce_data_l.append(('ce%s' %i, state, downtime_l))
+
+        sequential_l = self.get_ces(ce_data_l)
+        for ce in sequential_l:
+            ce.evaluate()
+        batch_l = self.get_ces(ce_data_l)
+        CEBatchEvaluator().evaluate(batch_l)
+        self.assertEqual(get_events(batch_l), get_events(sequential_l))
+        self.assertTrue(len([ce for ce in batch_l if ce.event and ce.event.status_changed]) > 0)
+
+    def test_topology(self):
+        data_d = get_inputs(NOW)
+        for topology_class in [Topology, ColumnarTopology]:
+            out_l = []
+            for batch in [False, True]:
+                topology = get_topology(topology_class, data_d, self.thresholds)
+                topology.evaluate(selective=True, batch=batch)
+                ce_l = sorted(topology.ce_d.values(), key=lambda ce: ce.endpoint)
+                queue_l = sorted(topology.queue_d.values(), key=lambda queue: queue.name)
+                out_l.append((get_events(ce_l), [(queue.name, queue.event.new_status) for queue in queue_l]))
+            self.assertEqual(out_l[0], out_l[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# tests for the downtimes of the CEs,
+# calculated once per cycle and shared by the queues using them
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import time
+import unittest
+
+from switcher.downtime import Downtime
+from switcher.topology.columnar import ColumnarTopology
+from switcher.topology.topology import Topology
+
+from test_topology import get_inputs, get_topology, timestamp
+
+
+def get_downtime(endpoint, start_t, end_t):
+    return Downtime(endpoint, timestamp(start_t), timestamp(end_t),
+                    'maintenance', 'SCHEDULED', 'CE', 'SITE', endpoint,
+                    'http://localhost/%s' %endpoint, 'OUTAGE')
+
+
+def get_intervals(overlapdowntimeslist):
+    return [(c.getTimeInterval().start_t, c.getTimeInterval().end_t, c.getlist())
+            for c in overlapdowntimeslist.getlist()]
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = int(time.time())
+        self.data_d = get_inputs(self.now)
+        # Q8 uses the same CEs as Q2
+        qdata = dict(self.data_d['schedconfig']['Q2'])
+        qdata['panda_resource'] = 'Q8'
+        self.data_d['schedconfig']['Q8'] = qdata
+
+    def test_extended_downtimes(self):
+        topology = get_topology(Topology, self.data_d)
+        ce = topology.ce_d['ce0.site2.org:9619']
+        extended = ce.getExtendedEndpointDowntimes()
+        self.assertTrue(ce.getExtendedEndpointDowntimes() is extended)
+        self.assertEqual(extended.getlist()[0].getTimeInterval().start_t,
+                         self.now + 3600 - ce.time_to_disable_sec)
+        ce.add_downtime(get_downtime(ce.endpoint, self.now + 20*3600, self.now + 30*3600))
+        self.assertFalse(ce.getExtendedEndpointDowntimes() is extended)
+        self.assertEqual(len(ce.getExtendedEndpointDowntimes().getlist()), 2)
+        topology.clear()
+        self.assertEqual(ce.getExtendedEndpointDowntimes().getlist(), [])
+
+    def test_shared_between_queues(self):
+        for topology_class in [Topology, ColumnarTopology]:
+            topology = get_topology(topology_class, self.data_d)
+            topology.evaluate()
+            out = topology.queue_d['Q2'].cehandler.getOverlapDowntimesList()
+            self.assertEqual(len(out.getlist()), 1)
+            self.assertTrue(topology.queue_d['Q8'].cehandler.getOverlapDowntimesList() is out)
+            # one for Q2 and Q8, and one for Q6
+            self.assertEqual(len(topology.overlap_cache), 2)
+
+    def test_new_downtime(self):
+        topology = get_topology(Topology, self.data_d)
+        cehandler = topology.queue_d['Q2'].cehandler
+        out = cehandler.getOverlapDowntimesList()
+        for ce in cehandler.getlist():
+            ce.add_downtime(get_downtime(ce.endpoint, self.now + 20*3600, self.now + 30*3600))
+        new_out = topology.queue_d['Q8'].cehandler.getOverlapDowntimesList()
+        self.assertFalse(new_out is out)
+        self.assertEqual(len(new_out.getlist()), 2)
+        self.assertEqual(get_intervals(cehandler.getOverlapDowntimesList()), get_intervals(new_out))
+
+    def test_per_topology(self):
+        topology = get_topology(Topology, self.data_d)
+        other = get_topology(Topology, self.data_d)
+        out = topology.queue_d['Q2'].cehandler.getOverlapDowntimesList()
+        self.assertEqual(len(other.overlap_cache), 0)
+        self.assertFalse(other.queue_d['Q2'].cehandler.getOverlapDowntimesList() is out)
+        # a new cycle starts with nothing cached
+        topology.update(self.data_d['schedconfig'], self.data_d['ddmtopology'])
+        self.assertEqual(len(topology.overlap_cache), 0)
+        self.assertEqual(topology.queue_d['Q2'].cehandler.getOverlapDowntimesList().getlist(), [])
+        self.assertEqual(len(topology.overlap_cache), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
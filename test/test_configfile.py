@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#
+# tests for the config files parsed only once per version of the file
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from switcher.switcherexceptions import SwitcherConfigurationFailure
+from switcher.thresholds import Thresholds
+from switcher.utils import ConfigFile
+
+from test_topology import ETC
+
+logging.disable(logging.CRITICAL)
+
+
+class TestConfigFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'switcher.conf')
+        self.write('[SECTION]\nkey = 1\n', 1000)
+        self.ncalls = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, content, mtime, path=None):
+        path = path or self.path
+        open(path, 'w').write(content)
+        os.utime(path, (mtime, mtime))
+
+    def compile(self, conf):
+        self.ncalls += 1
+        return conf.get('SECTION', 'key')
+
+    def test_parsed_once(self):
+        conffile = ConfigFile(self.path, self.compile)
+        self.assertEqual(conffile.load(), '1')
+        self.assertEqual(conffile.load(), '1')
+        self.assertEqual(self.ncalls, 1)
+
+    def test_edited(self):
+        conffile = ConfigFile(self.path, self.compile)
+        conffile.load()
+        # same size, new modification time
+        self.write('[SECTION]\nkey = 2\n', 2000)
+        self.assertEqual(conffile.load(), '2')
+        self.assertEqual(self.ncalls, 2)
+
+    def test_replaced(self):
+        conffile = ConfigFile(self.path, self.compile)
+        conffile.load()
+        # same size and modification time, but a new inode
+        newpath = os.path.join(self.tmpdir, 'new.conf')
+        self.write('[SECTION]\nkey = 3\n', 1000, newpath)
+        os.rename(newpath, self.path)
+        self.assertEqual(conffile.load(), '3')
+
+    def test_restore(self):
+        conffile = ConfigFile(self.path, self.compile)
+        conffile.load()
+        other = ConfigFile(self.path, self.compile)
+        self.assertTrue(other.restore(conffile.signature, 'restored'))
+        self.assertEqual(other.load(), 'restored')
+        self.assertEqual(self.ncalls, 1)
+        self.write('[SECTION]\nkey = 4\n', 3000)
+        self.assertFalse(ConfigFile(self.path).restore(conffile.signature, 'restored'))
+        self.assertFalse(ConfigFile(self.path + '.missing').restore(conffile.signature, 'restored'))
+
+    def test_failure(self):
+        self.assertRaises(SwitcherConfigurationFailure, ConfigFile(self.path + '.missing').load)
+        self.write('not a config file', 4000)
+        self.assertRaises(SwitcherConfigurationFailure, ConfigFile(self.path).load)
+
+    def test_thresholds(self):
+        conffile = ConfigFile(os.path.join(ETC, 'downtimes-example.conf'), Thresholds)
+        thresholds = conffile.load()
+        self.assertTrue(isinstance(thresholds, Thresholds))
+        self.assertTrue(conffile.load() is thresholds)
+
+
+if __name__ == '__main__':
+    unittest.main()
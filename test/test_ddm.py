@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#
+# tests for the DDM endpoint found for each token,
+# for the DDM objects joined to the queues by token,
+# and for the check of a DDM in downtime
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import copy
+import time
+import unittest
+
+import switcher.topology.ddm
+from switcher.agistopology.ddm import get_ddm_endpoints
+from switcher.topology.ddm import DDM
+from switcher.topology.columnar import ColumnarTopology
+from switcher.topology.topology import Topology
+
+from test_downtime import HOUR, NOW, get_downtime
+from test_shortcircuit import Clock
+from test_topology import get_inputs, get_topology
+
+
+class TestEndpoints(unittest.TestCase):
+
+    ddmtopology = {'LAN': {'arprotocols': {'write_lan': [{'endpoint': 'srm://lan'}, {'endpoint': 'srm://lan2'}],
+                                           'write_wan': [{'endpoint': 'srm://wan'}]}},
+                   'WAN': {'arprotocols': {'write_wan': [{'endpoint': 'srm://wan'}]}},
+                   'READONLY': {'arprotocols': {'read_lan': [{'endpoint': 'srm://read'}]}},
+                   'MALFORMED': {'arprotocols': {'write_lan': []}},
+                   'NOPROTOCOLS': {},
+                  }
+
+    def test_preferred(self):
+        self.assertEqual(get_ddm_endpoints(self.ddmtopology),
+                         {'LAN': 'srm://lan', 'WAN': 'srm://wan'})
+
+    def test_tokens(self):
+        self.assertEqual(get_ddm_endpoints(self.ddmtopology, ['WAN', 'READONLY', 'MISSING']),
+                         {'WAN': 'srm://wan'})
+        self.assertEqual(get_ddm_endpoints(self.ddmtopology, []), {})
+
+
+class TestJoin(unittest.TestCase):
+
+    def setUp(self):
+        self.data_d = get_inputs(int(time.time()))
+        # Q1 uses the same token as Q0, and Q3 a token not in DDM topology
+        self.data_d['schedconfig']['Q1']['astorages'] = {'write_lan': ['SITE0_DATADISK']}
+        self.data_d['schedconfig']['Q3']['astorages'] = {'write_lan': ['MISSING']}
+
+    def get_endpoints(self, topology):
+        return dict([(qname, [ddm.endpoint for ddm in queue.ddmhandler.getlist()])
+                     for qname, queue in topology.queue_d.items()])
+
+    def test_shared(self):
+        topology = get_topology(Topology, self.data_d)
+        ddm_l = topology.queue_d['Q0'].ddmhandler.getlist()
+        self.assertEqual(len(ddm_l), 1)
+        self.assertTrue(topology.queue_d['Q1'].ddmhandler.getlist()[0] is ddm_l[0])
+        self.assertEqual(topology.queue_d['Q3'].ddmhandler.getlist(), [])
+        self.assertEqual(self.get_endpoints(topology)['Q2'], ['srm://SITE2_DATADISK.org'])
+
+    def test_ddmtopology_changed(self):
+        topology = get_topology(Topology, self.data_d)
+        ddmtopology = copy.deepcopy(self.data_d['ddmtopology'])
+        ddmtopology['SITE0_DATADISK'] = {'arprotocols': {'write_wan': [{'endpoint': 'srm://moved.org'}]}}
+        ddmtopology['MISSING'] = {'arprotocols': {'write_lan': [{'endpoint': 'srm://found.org'}]}}
+        del ddmtopology['SITE2_DATADISK']
+        self.assertEqual(topology.update(self.data_d['schedconfig'], ddmtopology), True)
+        endpoint_d = self.get_endpoints(topology)
+        self.assertEqual(endpoint_d['Q0'], ['srm://moved.org'])
+        self.assertEqual(endpoint_d['Q1'], ['srm://moved.org'])
+        self.assertEqual(endpoint_d['Q2'], [])
+        self.assertEqual(endpoint_d['Q3'], ['srm://found.org'])
+        self.assertEqual(endpoint_d['Q4'], ['srm://SITE4_DATADISK.org'])
+        self.assertFalse('srm://SITE0_DATADISK.org' in topology.ddm_d)
+        # the same as a topology built from scratch
+        data_d = dict(self.data_d, ddmtopology=ddmtopology)
+        self.assertEqual(endpoint_d, self.get_endpoints(get_topology(Topology, data_d)))
+
+    def test_columnar(self):
+        topology = get_topology(Topology, self.data_d)
+        columnar = get_topology(ColumnarTopology, self.data_d)
+        columnar.evaluate()
+        endpoint_d = self.get_endpoints(topology)
+        columnar_d = self.get_endpoints(columnar)
+        # the queue with its storage in downtime is created
+        self.assertEqual(columnar_d['Q7'], ['srm://SITE7_DATADISK.org'])
+        for qname, endpoint_l in columnar_d.items():
+            self.assertEqual(endpoint_l, endpoint_d[qname])
+
+
+class TestInDowntime(unittest.TestCase):
+
+    def setUp(self):
+        self.time = switcher.topology.ddm.time
+        self.clock = Clock(NOW)
+        switcher.topology.ddm.time = self.clock
+
+    def tearDown(self):
+        switcher.topology.ddm.time = self.time
+
+    def test_edges(self):
+        ddm = DDM('srm://site.org')
+        self.assertFalse(ddm.is_in_downtime(HOUR))
+        ddm.add_downtime(get_downtime('srm://site.org', NOW + 2*HOUR, NOW + 3*HOUR))
+        ddm.add_downtime(get_downtime('srm://site.org', NOW + 5*HOUR, NOW + 5*HOUR))
+        # the same as with the extended TimeInterval of each downtime
+        for t in [NOW, NOW + HOUR - 1, NOW + HOUR, NOW + 3*HOUR - 1, NOW + 3*HOUR,
+                  NOW + 4*HOUR, NOW + 5*HOUR - 1, NOW + 5*HOUR]:
+            self.clock.t = t
+            expected = any([t in downtime.timeinterval.extend(HOUR)
+                            for downtime in ddm.getEndpointDowntimes().getlist()])
+            self.assertEqual(ddm.is_in_downtime(HOUR), expected)
+        self.clock.t = NOW + HOUR
+        self.assertTrue(ddm.is_in_downtime(HOUR))
+        self.clock.t = NOW + 3*HOUR
+        self.assertFalse(ddm.is_in_downtime(HOUR))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+#
+# tests for the overlapping of downtimes between endpoints,
+# and for the calendar of downtimes indexed by time
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import random
+import unittest
+
+from datetime import datetime
+
+from switcher.downtime import Downtime, DowntimeCalendar, EndpointDowntimes, EndpointDowntimesSet
+
+HOUR = 3600
+SETDISABLE = 2*HOUR
+NOW = 1600000000
+
+
+def get_downtime(endpoint, start_t, end_t):
+    timestamp = lambda t: datetime.utcfromtimestamp(t).strftime('%Y-%m-%dT%H:%M:%S')
+    return Downtime(endpoint, timestamp(start_t), timestamp(end_t),
+                    'maintenance', 'SCHEDULED', 'CE', 'SITE', endpoint,
+                    'http://localhost/%s/%s' %(endpoint, start_t), 'OUTAGE')
+
+
+def get_endpointdowntimes(endpoint, interval_l):
+    endpointdowntimes = EndpointDowntimes()
+    for start_t, end_t in interval_l:
+        endpointdowntimes.add(get_downtime(endpoint, start_t, end_t))
+    return endpointdowntimes
+
+
+def reduce_pairwise(endpointdowntimes_l):
+    """
+    the overlappings, calculated by overlapping the endpoints one after the other
+    """
+    if len(endpointdowntimes_l) == 1:
+        return [(d.getTimeInterval().start_t, d.getTimeInterval().end_t, [d])
+                for d in endpointdowntimes_l[0].getlist()]
+    overlapdowntimeslist = reduce(lambda x, y: x.overlap(y), endpointdowntimes_l)
+    return as_list(overlapdowntimeslist)
+
+
+def sweep(endpointdowntimes_l):
+    endpointdowntimesset = EndpointDowntimesSet()
+    for endpointdowntimes in endpointdowntimes_l:
+        endpointdowntimesset.add(endpointdowntimes)
+    return as_list(endpointdowntimesset.getOverlapDowntimesList())
+
+
+def as_list(overlapdowntimeslist):
+    return [(c.getTimeInterval().start_t, c.getTimeInterval().end_t, c.getlist())
+            for c in overlapdowntimeslist.getlist()]
+
+
+class TestOverlap(unittest.TestCase):
+
+    def check(self, endpointdowntimes_l):
+        self.assertEqual(sweep(endpointdowntimes_l), reduce_pairwise(endpointdowntimes_l))
+
+    def test_no_endpoints(self):
+        self.assertEqual(sweep([]), [])
+
+    def test_close_downtimes(self):
+        # the downtimes of ce0 are closer than the time to disable a CE,
+        # so they overlap once extended, but they are still two overlappings
+        ce0 = get_endpointdowntimes('ce0', [(NOW + 5*HOUR, NOW + 6*HOUR), (NOW + 7*HOUR, NOW + 8*HOUR)])
+        ce1 = get_endpointdowntimes('ce1', [(NOW, NOW + 10*HOUR)])
+        out = sweep([ce0.extend(SETDISABLE), ce1.extend(SETDISABLE)])
+        self.assertEqual([(start_t - NOW, end_t - NOW) for start_t, end_t, downtime_l in out],
+                         [(3*HOUR, 6*HOUR), (5*HOUR, 8*HOUR)])
+        self.check([ce0.extend(SETDISABLE), ce1.extend(SETDISABLE)])
+
+    def test_touching_downtimes(self):
+        ce0 = get_endpointdowntimes('ce0', [(NOW, NOW + HOUR), (NOW + HOUR, NOW + 2*HOUR)])
+        ce1 = get_endpointdowntimes('ce1', [(NOW + HOUR, NOW + 3*HOUR), (NOW, NOW)])
+        self.check([ce0, ce1])
+        self.check([ce1, ce0])
+
+    def test_random(self):
+        rnd = random.Random(1)
+        for trial in range(1000):
+            endpointdowntimes_l = []
+            for index in range(rnd.randint(1, 4)):
+                interval_l = []
+                t = NOW + rnd.randint(0, 5)*HOUR
+                for i in range(rnd.randint(0, 4)):
+                    if rnd.random() < 0.5:
+                        # consecutive downtimes, some closer than SETDISABLE
+                        start_t = t + rnd.randint(0, 3)*HOUR
+                        t = start_t + rnd.randint(0, 6)*HOUR
+                        interval_l.append((start_t, t))
+                    else:
+                        start_t = NOW + rnd.randint(0, 30)*HOUR
+                        interval_l.append((start_t, start_t + rnd.randint(0, 10)*HOUR))
+                endpointdowntimes_l.append(get_endpointdowntimes('ce%s' %index, interval_l))
+            self.check(endpointdowntimes_l)
+            self.check([endpointdowntimes.extend(SETDISABLE) for endpointdowntimes in endpointdowntimes_l])
+
+
+class TestCalendar(unittest.TestCase):
+
+    # equal start and end times, zero-length and overlapping downtimes
+    interval_l = [(10, 20), (5, 5), (20, 30), (15, 15), (12, 25), (30, 30)]
+
+    def get_calendar(self, interval_l):
+        calendar = DowntimeCalendar()
+        for start_t, end_t in interval_l:
+            calendar.add(get_downtime('ce0', NOW + start_t, NOW + end_t))
+        return calendar
+
+    def check(self, interval_l):
+        # against a look at every Downtime
+        calendar = self.get_calendar(interval_l)
+        for t in range(NOW - 2, NOW + 35):
+            started_l = [d for d in calendar.getlist() if d.timeinterval.start_t <= t and d.timeinterval.end_t != t]
+            self.assertTrue(calendar.first_started(t) is (started_l or [None])[0])
+            start_l = [d.timeinterval.start_t for d in calendar.getlist() if d.timeinterval.start_t >= t]
+            self.assertEqual(calendar.next_start(t), min(start_l or [None]))
+            end_l = [d.timeinterval.end_t for d in calendar.getlist() if d.timeinterval.end_t >= t]
+            self.assertEqual(calendar.next_end(t), min(end_l or [None]))
+            for until_t in [t, t + 1, t + 5]:
+                active = any([d.timeinterval.start_t <= until_t and d.timeinterval.end_t > t for d in calendar.getlist()])
+                self.assertEqual(calendar.is_active(t, until_t), active)
+
+    def test_edges(self):
+        calendar = self.get_calendar(self.interval_l)
+        # a zero-length downtime is never in progress
+        self.assertFalse(calendar.is_active(NOW + 5, NOW + 5))
+        self.assertTrue(calendar.first_started(NOW + 5) is None)
+        self.assertTrue(calendar.first_started(NOW + 6) is calendar.getlist()[1])
+        # a downtime ending at t is not in progress, but one starting at t is
+        self.assertFalse(calendar.is_active(NOW + 30, NOW + 30))
+        self.assertTrue(calendar.is_active(NOW + 29, NOW + 29))
+        self.assertTrue(calendar.first_started(NOW + 20) is calendar.getlist()[1])
+        # times equal to a start or an end are found
+        self.assertEqual(calendar.next_start(NOW + 20), NOW + 20)
+        self.assertEqual(calendar.next_end(NOW + 15), NOW + 15)
+        self.assertEqual(calendar.next_start(NOW + 31), None)
+        self.assertEqual(calendar.next_end(NOW + 31), None)
+
+    def test_empty(self):
+        calendar = DowntimeCalendar()
+        self.assertFalse(calendar.is_active(NOW, NOW))
+        self.assertEqual(calendar.first_started(NOW), None)
+        self.assertEqual(calendar.next_start(NOW), None)
+        self.assertEqual(calendar.next_end(NOW), None)
+
+    def test_against_list(self):
+        self.check(self.interval_l)
+        self.check([(5, 5)])
+        self.check([(5, 5), (5, 5), (3, 8)])
+        rnd = random.Random(2)
+        for trial in range(50):
+            interval_l = []
+            for i in range(rnd.randint(1, 6)):
+                start_t = rnd.randint(0, 30)
+                interval_l.append((start_t, start_t + rnd.randint(0, 5)))
+            self.check(interval_l)
+
+    def test_add_after_query(self):
+        calendar = self.get_calendar([(10, 20)])
+        self.assertEqual(calendar.next_start(NOW), NOW + 10)
+        calendar.add(get_downtime('ce0', NOW + 5, NOW + 6))
+        self.assertEqual(calendar.next_start(NOW), NOW + 5)
+        self.assertTrue(calendar.is_active(NOW + 5, NOW + 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# tests for the selection of the clouds, sites and queues to consider,
+# and for the queues dropped while schedconfig is decoded
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from ConfigParser import SafeConfigParser
+
+from switcher.sources import Sources
+from switcher.topology.topology import Topology
+from switcher.utils import AllowedEntities
+
+from test_topology import get_conf, get_inputs, get_thresholds
+
+
+class TestAllowedEntities(unittest.TestCase):
+
+    def test_names(self):
+        allowed = AllowedEntities(['CERN-PROD', 'BNL'], None)
+        self.assertTrue('BNL' in allowed)
+        self.assertFalse('BNL2' in allowed)
+        self.assertFalse(None in allowed)
+        self.assertTrue('anything' in AllowedEntities())
+        self.assertTrue('anything' in AllowedEntities([], []))
+
+    def test_globs(self):
+        allowed = AllowedEntities(['CERN-*', 'Q?', 'SITE[0-2]'], ['CERN-TEST*'])
+        for name in ['CERN-PROD', 'Q1', 'SITE2']:
+            self.assertTrue(name in allowed, name)
+        for name in ['CERN', 'Q10', 'SITE3', 'CERN-TEST', 'CERN-TEST-2', 'xCERN-PROD', None]:
+            self.assertFalse(name in allowed, name)
+
+    def test_excluded(self):
+        # excluded has precedence
+        allowed = AllowedEntities(['Q1'], ['Q*'])
+        self.assertFalse('Q1' in allowed)
+        allowed = AllowedEntities(None, ['Q1', 'SITE*'])
+        self.assertFalse('Q1' in allowed)
+        self.assertFalse('SITE5' in allowed)
+        self.assertTrue('Q2' in allowed)
+        self.assertTrue(None in allowed)
+
+
+class TestFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.data_d = get_inputs(int(time.time()))
+        self.schedconfig = dict(self.data_d['schedconfig'])
+        self.schedconfig['CMS0'] = dict(self.schedconfig['Q0'], vo_name='cms')
+        self.schedconfig['Q3'] = dict(self.schedconfig['Q3'], maxtime=3600)
+        self.schedconfig['not a queue'] = 'some string'
+        self.allowed_queues = AllowedEntities(None, ['Q[0-2]'])
+        self.allowed_sites = AllowedEntities(None, ['SITE7'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_sources(self):
+        conf = SafeConfigParser()
+        conf.add_section('SOURCE')
+        for name in Sources.names:
+            path = os.path.join(self.tmpdir, '%s.json' %name)
+            json.dump(self.schedconfig if name == 'schedconfig' else {}, open(path, 'w'))
+            conf.set('SOURCE', name, path)
+        conf.set('SOURCE', 'streaming', 'True')
+        return Sources(conf)
+
+    def accept(self, qname, qdata):
+        # the same rules that Switcher sets with Sources.set_filter()
+        return isinstance(qdata, dict) and\
+               qdata.get('vo_name') == 'atlas' and\
+               qdata.get('atlas_site') in self.allowed_sites and\
+               qname in self.allowed_queues
+
+    def get_topology(self, schedconfig):
+        return Topology(schedconfig, AllowedEntities(), self.allowed_sites, self.allowed_queues,
+                        self.data_d['ddmtopology'], get_conf('notifications-example.conf'), get_thresholds())
+
+    def test_dropped_while_decoding(self):
+        sources = self.get_sources()
+        sources.set_filter('schedconfig', self.accept)
+        schedconfig = sources._fetch_one('schedconfig')
+        self.assertEqual(sorted(schedconfig), ['Q3', 'Q4', 'Q5', 'Q6'])
+        # only the fields in the projection are kept
+        self.assertEqual(schedconfig['Q3']['queues'], self.schedconfig['Q3']['queues'])
+        self.assertFalse('maxtime' in schedconfig['Q3'])
+        # the same topology as with the whole document
+        self.assertEqual(sorted(self.get_topology(schedconfig).queue_d),
+                         sorted(self.get_topology(self.schedconfig).queue_d))
+
+    def test_no_filter(self):
+        schedconfig = self.get_sources()._fetch_one('schedconfig')
+        self.assertEqual(sorted(schedconfig), sorted(self.schedconfig))
+
+
+if __name__ == '__main__':
+    unittest.main()
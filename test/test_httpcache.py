@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#
+# tests for the on-disk cache of documents downloaded over HTTP,
+# against a local HTTP server
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import json
+import logging
+import shutil
+import tempfile
+import threading
+import unittest
+
+from BaseHTTPServer import BaseHTTPRequestHandler
+from StringIO import StringIO
+
+from switcher.httpcache import HTTPCache
+from switcher.services.httpclient import HTTPClient
+
+from test_httpclient import Server
+
+logging.disable(logging.CRITICAL)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    serves the document in server.doc, with validators,
+    answering 304 when the ones sent back by the client still match
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        etag = '"%s"' %server.version
+        last_modified = 'Mon, 0%s Jan 2024 00:00:00 GMT' %server.version
+        if server.validators and\
+           (self.headers.get('If-None-Match') == etag or\
+            self.headers.get('If-Modified-Since') == last_modified):
+            server.status_l.append(304)
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        server.status_l.append(200)
+        body = json.dumps(server.doc)
+        self.send_response(200)
+        if server.validators:
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestHTTPCache(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.doc = {'Q0': {'status': 'online', 'type': 'analysis'}}
+        self.server.version = 1
+        self.server.validators = True
+        self.server.status_l = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%s/doc' %self.server.server_address[1]
+        self.client = HTTPClient()
+        self.cachedir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cachedir)
+
+    def load(self, cache, projection=None, copy_to=None):
+        return cache.load_json(self.url, projection, (5, 5), self.client, copy_to)
+
+    def test_not_modified(self):
+        cache = HTTPCache(self.cachedir)
+        data = self.load(cache)
+        self.assertEqual(data, self.server.doc)
+        # the decoded object is reused
+        self.assertTrue(self.load(cache) is data)
+        self.assertEqual(self.server.status_l, [200, 304])
+
+    def test_modified(self):
+        cache = HTTPCache(self.cachedir)
+        self.load(cache)
+        self.server.doc = {'Q1': {'status': 'offline'}}
+        self.server.version = 2
+        self.assertEqual(self.load(cache), self.server.doc)
+        self.assertEqual(self.load(cache), self.server.doc)
+        self.assertEqual(self.server.status_l, [200, 200, 304])
+
+    def test_restart(self):
+        # the body on disk is used by a new cache on the same directory
+        self.load(HTTPCache(self.cachedir))
+        cache = HTTPCache(self.cachedir)
+        self.assertEqual(self.load(cache), self.server.doc)
+        self.assertEqual(self.server.status_l, [200, 304])
+
+    def test_projection(self):
+        cache = HTTPCache(self.cachedir)
+        projection = {'status': None}
+        self.assertEqual(self.load(cache, projection), {'Q0': {'status': 'online'}})
+        self.assertEqual(self.load(HTTPCache(self.cachedir), projection), {'Q0': {'status': 'online'}})
+
+    def test_copy_to(self):
+        cache = HTTPCache(self.cachedir)
+        for i in range(2):
+            copy_to = StringIO()
+            self.load(cache, copy_to=copy_to)
+            self.assertEqual(json.loads(copy_to.getvalue()), self.server.doc)
+        self.assertEqual(self.server.status_l, [200, 304])
+
+    def test_no_validators(self):
+        self.server.validators = False
+        cache = HTTPCache(self.cachedir)
+        self.assertEqual(self.load(cache), self.server.doc)
+        self.assertEqual(self.load(cache), self.server.doc)
+        self.assertEqual(self.server.status_l, [200, 200])
+
+    def test_missing_body(self):
+        # the server says nothing changed, but the cached body is not usable
+        cache = HTTPCache(self.cachedir)
+        self.load(cache)
+        key = cache._key(self.url)
+        cache.data_d.clear()
+        open(cache._path(key, 'body'), 'wb').write('not gzip')
+        self.assertEqual(self.load(cache), self.server.doc)
+        self.assertEqual(self.server.status_l, [200, 304, 200])
+
+
+if __name__ == '__main__':
+    unittest.main()
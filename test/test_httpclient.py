@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+#
+# tests for the pool of persistent HTTP connections,
+# and for the compression of the bodies,
+# against a local HTTP server
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import zlib
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from ConfigParser import SafeConfigParser
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+
+from switcher.services.httpclient import HTTPClient, decompress
+from switcher.services.serverapi import AGIS
+from switcher.switcherexceptions import SwitcherHTTPFailure
+from switcher.utils import load_json, open_url
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        f = StringIO()
+        gz = gzip.GzipFile(fileobj=f, mode='wb')
+        gz.write(body)
+        gz.close()
+        return f.getvalue()
+    # raw deflate, with no zlib header
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    # path -> (status, Location)
+    redirect_d = {'/old': (301, '/new'),
+                  '/found': (302, 'http://%(host)s/new'),
+                  '/relative/': (307, '../new'),
+                  '/seeother': (303, '/new'),
+                  '/loop': (302, '/loop'),
+                 }
+
+    # path -> Content-Encoding
+    encoded_d = {'/gzip': 'gzip',
+                 '/deflate': 'deflate',
+                }
+
+    def log_message(self, *args):
+        pass
+
+    def answer(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self):
+        self.server.request_l.append((self.command, self.path, self.client_address[1]))
+        length = int(self.headers.get('Content-Length', 0))
+        if length:
+            self.rfile.read(length)
+        if self.path in self.redirect_d:
+            status, location = self.redirect_d[self.path]
+            location = location %{'host': self.headers['Host']}
+            self.answer(status, 'moved', {'Location': location})
+        elif self.path == '/new':
+            self.answer(200, '%s new' %self.command)
+        elif self.path in self.encoded_d:
+            body = json.dumps({'path': self.path})
+            encoding = self.encoded_d[self.path]
+            if encoding not in self.headers.get('Accept-Encoding', ''):
+                self.answer(200, body)
+            else:
+                self.answer(200, compress(body, encoding), {'Content-Encoding': encoding})
+        else:
+            self.answer(404, 'not found')
+
+    do_GET = handle_request
+    do_POST = handle_request
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ServerTestCase(unittest.TestCase):
+    """
+    starts the local server, and a client, for each test
+    """
+
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.request_l = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base = 'http://127.0.0.1:%s' %self.server.server_address[1]
+        self.client = HTTPClient()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestHTTPClient(ServerTestCase):
+
+    def get(self, path, method='GET'):
+        response = self.client.request(method, self.base + path, timeout=(5, 5))
+        body = response.read()
+        response.close()
+        return response.status, body
+
+    def test_get(self):
+        self.assertEqual(self.get('/new'), (200, 'GET new'))
+        self.assertEqual(self.get('/missing')[0], 404)
+
+    def test_connection_reused(self):
+        self.get('/new')
+        self.get('/new')
+        port_l = [port for method, path, port in self.server.request_l]
+        self.assertEqual(port_l[0], port_l[1])
+
+    def test_redirects(self):
+        for path in ['/old', '/found', '/relative/', '/seeother']:
+            self.assertEqual(self.get(path), (200, 'GET new'))
+
+    def test_redirect_method(self):
+        # POST is kept on 307, but not on 303
+        self.assertEqual(self.get('/seeother', 'POST'), (200, 'GET new'))
+        Handler.redirect_d['/temporary'] = (307, '/new')
+        try:
+            self.assertEqual(self.get('/temporary', 'POST'), (200, 'POST new'))
+        finally:
+            del Handler.redirect_d['/temporary']
+
+    def test_redirect_loop(self):
+        self.assertRaises(SwitcherHTTPFailure, self.get, '/loop')
+        self.assertEqual(len(self.server.request_l), self.client.max_redirects + 1)
+
+
+class TestCompression(ServerTestCase):
+
+    def test_negotiated(self):
+        for path in ['/gzip', '/deflate']:
+            self.assertEqual(load_json(self.base + path, client=self.client), {'path': path})
+            response = open_url(self.base + path, (5, 5), client=self.client, decode=False)
+            self.assertEqual(response.getheader('Content-Encoding'), path[1:])
+            response.close()
+
+    def test_not_negotiated(self):
+        headers = {'Accept-Encoding': 'identity'}
+        response = open_url(self.base + '/gzip', (5, 5), headers, self.client)
+        self.assertEqual(json.loads(response.read()), {'path': '/gzip'})
+
+    def test_chunks(self):
+        body = ''.join(['%s,' %i for i in range(100000)])
+        for encoding in ['gzip', 'deflate']:
+            reader = decompress(StringIO(compress(body, encoding)), encoding)
+            reader.chunk_size = 100
+            chunk_l = []
+            while True:
+                chunk = reader.read(1000)
+                if not chunk:
+                    break
+                chunk_l.append(chunk)
+            self.assertEqual(''.join(chunk_l), body)
+        self.assertRaises(ValueError, decompress, StringIO(body), 'br')
+
+    def test_gz_file(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'schedconfig.json.gz')
+            open(path, 'wb').write(compress(json.dumps({'Q0': {}}), 'gzip'))
+            self.assertEqual(load_json(path), {'Q0': {}})
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class TestAGIS(unittest.TestCase):
+
+    class Client(object):
+        def get(self, url, headers=None, timeout=None):
+            self.timeout = timeout
+            raise IOError('no connection')
+
+    def test_timeout(self):
+        conf = SafeConfigParser()
+        conf.add_section('SERVERAPI')
+        conf.set('SERVERAPI', 'read_timeout', '10')
+        client = self.Client()
+        agis = AGIS(conf, client)
+        self.assertRaises(Exception, agis._request, 'http://localhost/')
+        self.assertEqual(client.timeout, (30, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#
+# tests for the streaming ingestion of json documents,
+# against the decoding of the whole document at once
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import json
+import random
+import unittest
+
+from StringIO import StringIO
+
+from switcher.ingest import JSONRecords, SCHEDCONFIG, Select, load_projected, project
+
+
+def get_schedconfig(nqueues, rnd):
+    schedconfig = {}
+    for i in range(nqueues):
+        qname = u'Q\xe9%s' %i
+        schedconfig[qname] = {'vo_name': 'atlas',
+                              'cloud': 'CERN',
+                              'atlas_site': 'SITE%s' %i,
+                              'panda_resource': qname,
+                              'probe': None,
+                              'status': rnd.choice(['online', 'offline', 'test']),
+                              'tier_level': rnd.randint(0, 3),
+                              'type': 'analysis',
+                              'maxtime': rnd.random() * 1e6,
+                              'comment': 'a long comment with "quotes", {braces} and [brackets] ' * rnd.randint(0, 50),
+                              'astorages': {'write_lan': ['TOKEN%s' %i], 'read_lan': ['TOKEN%s' %i]},
+                              'queues': [{'ce_name': 'ce%s' %j,
+                                          'ce_endpoint': 'ce%s:9619' %j,
+                                          'ce_state': 'ACTIVE',
+                                          'ce_flavour': 'HTCONDOR-CE'} for j in range(rnd.randint(0, 3))],
+                             }
+    return schedconfig
+
+
+class FileLike(object):
+    """
+    file-like object returning no more than a few bytes on each read
+    """
+
+    def __init__(self, content, max_size):
+        self.f = StringIO(content)
+        self.max_size = max_size
+
+    def read(self, amt=-1):
+        if amt is None or amt < 0:
+            amt = self.max_size
+        return self.f.read(min(amt, self.max_size))
+
+
+class TestIngest(unittest.TestCase):
+
+    def test_project(self):
+        value = {'a': 1, 'b': {'c': 2, 'd': 3}, 'e': [{'f': 4, 'g': 5}], 'h': 6}
+        projection = {'b': {'c': None}, 'e': [{'f': None}], 'missing': None, 'h': {'x': None}}
+        self.assertEqual(project(value, projection),
+                         {'b': {'c': 2}, 'e': [{'f': 4}], 'h': 6})
+        self.assertTrue(project(value, None) is value)
+
+    def test_same_as_whole_document(self):
+        rnd = random.Random(3)
+        schedconfig = get_schedconfig(50, rnd)
+        content = json.dumps(schedconfig, indent=rnd.choice([None, 2]))
+        expected = dict([(key, project(value, SCHEDCONFIG)) for key, value in json.loads(content).items()])
+        # records, and numbers, split between chunks
+        for chunk_size in [1, 7, 100, 65536]:
+            self.assertEqual(load_projected(FileLike(content, chunk_size), SCHEDCONFIG), expected)
+
+    def test_list(self):
+        content = ' [ {"a": 1, "b": 2}, 12345, [1, 2] , "x" ] '
+        self.assertEqual(load_projected(FileLike(content, 3), {'a': None}),
+                         [{'a': 1}, 12345, [1, 2], 'x'])
+        self.assertEqual(load_projected(StringIO('[]'), None), [])
+        self.assertEqual(load_projected(StringIO('{}'), None), {})
+        # a number split between chunks
+        self.assertEqual(list(JSONRecords(FileLike('[1, 23456]', 3))), [(0, 1), (1, 23456)])
+
+    def test_select(self):
+        content = json.dumps(get_schedconfig(20, random.Random(4)))
+        accept = lambda key, value: value['status'] == 'online'
+        out = load_projected(StringIO(content), Select(accept, {'status': None}))
+        expected = dict([(key, {'status': value['status']})
+                         for key, value in json.loads(content).items() if accept(key, value)])
+        self.assertEqual(out, expected)
+        self.assertTrue(0 < len(out) < 20)
+
+    def test_invalid(self):
+        for content in ['', '1', '{"a": 1', '{"a" 1}', '{"a": 1 "b": 2}', '[1, 2', '{"a": tru}']:
+            self.assertRaises(ValueError, load_projected, FileLike(content, 2), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
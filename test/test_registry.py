@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+#
+# tests for the reverse indexes of the topology,
+# against a walk of the whole tree
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import copy
+import random
+import time
+import unittest
+
+from switcher.topology.topology import Topology
+
+from test_topology import change_inputs, get_inputs, get_topology
+
+
+def walk(topology):
+    """
+    the reverse indexes, found by walking the whole tree
+    :return dict:
+    """
+    index_d = {'ce': {}, 'ddm': {}, 'site': {}, 'token': {}}
+    for sitename, site in topology.site_d.items():
+        for qname, queue in site.queue_d.items():
+            index_d['site'].setdefault(sitename, set()).add(qname)
+            for ce in queue.cehandler.getlist():
+                index_d['ce'].setdefault(ce.endpoint, set()).add(qname)
+            for ddm in queue.ddmhandler.getlist():
+                index_d['ddm'].setdefault(ddm.endpoint, set()).add(qname)
+            if queue.token:
+                index_d['token'].setdefault(queue.token, set()).add(qname)
+    return index_d
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.data_d = get_inputs(int(time.time()))
+
+    def check(self, topology):
+        registry = topology.registry
+        index_d = walk(topology)
+        self.assertEqual(registry.ce_queue_d, index_d['ce'])
+        self.assertEqual(registry.ddm_queue_d, index_d['ddm'])
+        self.assertEqual(registry.site_queue_d, index_d['site'])
+        self.assertEqual(registry.token_queue_d, index_d['token'])
+        for endpoint, qname_s in index_d['ce'].items():
+            self.assertEqual(registry.queues_for_ce(endpoint), qname_s)
+        # the same DDM object for all the queues with a token
+        for token, qname_s in index_d['token'].items():
+            ddm = registry.ddm_for_token(token)
+            for qname in qname_s:
+                self.assertEqual(topology.queue_d[qname].ddmhandler.getlist(), ddm and [ddm] or [])
+
+    def test_build(self):
+        topology = get_topology(Topology, self.data_d)
+        self.check(topology)
+        self.assertEqual(topology.registry.queues_for_ce('ce0.site2.org:9619'), set(['Q2']))
+        self.assertEqual(topology.registry.queues_for_ddm('srm://SITE7_DATADISK.org'), set(['Q7']))
+        self.assertEqual(topology.registry.queues_for_site('SITE3'), set(['Q3']))
+        self.assertEqual(topology.registry.queues_for_token('SITE4_DATADISK'), set(['Q4']))
+        self.assertEqual(topology.registry.queues_for_ce('unknown'), set())
+
+    def test_queues_for_downtime(self):
+        topology = get_topology(Topology, self.data_d)
+        downtime_l = [downtime for downtime in topology.downtime_l if downtime.type == 'SRM']
+        self.assertEqual(len(downtime_l), 1)
+        self.assertEqual(set(topology.get_queues_for_downtime(downtime_l[0])), set(['Q7']))
+
+    def test_update(self):
+        rnd = random.Random(7)
+        data_d = self.data_d
+        topology = get_topology(Topology, data_d)
+        for step in range(30):
+            data_d = dict(data_d)
+            data_d['schedconfig'] = copy.deepcopy(data_d['schedconfig'])
+            data_d['ddmtopology'] = copy.deepcopy(data_d['ddmtopology'])
+            change_inputs(data_d['schedconfig'], data_d['ddmtopology'], rnd, step)
+            topology.update(data_d['schedconfig'], data_d['ddmtopology'])
+            self.check(topology)
+            # nothing is kept for what is not used anymore
+            self.assertEqual(sorted(topology.ce_d), sorted(topology.registry.ce_queue_d))
+            self.assertEqual(sorted(topology.ddm_d), sorted(topology.registry.ddm_queue_d))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# tests for the decision to skip a whole cycle,
+# and for the time when the result of a cycle may change
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import copy
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import switcher.topology.ce
+import switcher.topology.ddm
+import switcher.topology.queue
+from switcher.shortcircuit import ShortCircuit
+from switcher.topology.topology import Topology
+from switcher.utils import ConfigFile
+
+from test_downtime import NOW
+from test_topology import get_actions, get_inputs, get_topology
+
+
+class Clock(object):
+    """
+    replaces the module time, with a time that can be set
+    """
+    def __init__(self, t):
+        self.t = t
+
+    def time(self):
+        return self.t
+
+
+class TestShortCircuit(unittest.TestCase):
+
+    def setUp(self):
+        self.data_d = get_inputs(NOW)
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, 'downtimes.conf')
+        open(path, 'w').write('[CE]\n')
+        self.conffile = ConfigFile(path)
+        self.conffile.load()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_fingerprint(self):
+        shortcircuit = ShortCircuit()
+        digest = shortcircuit.fingerprint(self.data_d, [self.conffile])
+        # the same content, in new objects
+        self.assertEqual(ShortCircuit().fingerprint(copy.deepcopy(self.data_d), [self.conffile]), digest)
+        data_d = copy.deepcopy(self.data_d)
+        data_d['switcherstatus']['Q0']['a']['mode']['AUTO']['switcher']['value'] = 'OFFLINE'
+        self.assertNotEqual(shortcircuit.fingerprint(data_d, [self.conffile]), digest)
+        # a config file that changed
+        self.conffile.signature = ('another', 'signature')
+        self.assertNotEqual(shortcircuit.fingerprint(self.data_d, [self.conffile]), digest)
+
+    def test_can_skip(self):
+        shortcircuit = ShortCircuit()
+        digest = shortcircuit.fingerprint(self.data_d, [self.conffile])
+        self.assertFalse(shortcircuit.can_skip(digest, NOW))
+        shortcircuit.record(digest, NOW + 100, False)
+        self.assertTrue(shortcircuit.can_skip(digest, NOW + 99))
+        self.assertFalse(shortcircuit.can_skip(digest, NOW + 100))
+        self.assertFalse(shortcircuit.can_skip('other', NOW))
+        # no change ever
+        shortcircuit.record(digest, None, False)
+        self.assertTrue(shortcircuit.can_skip(digest, NOW + 1e9))
+        shortcircuit.invalidate()
+        self.assertFalse(shortcircuit.can_skip(digest, NOW))
+
+    def test_pending_actions(self):
+        shortcircuit = ShortCircuit()
+        shortcircuit.record('digest', None, False)
+        shortcircuit.record('digest', None, True)
+        self.assertFalse(shortcircuit.can_skip('digest', NOW))
+
+
+class TestNextChange(unittest.TestCase):
+
+    def setUp(self):
+        # downtimes already finished are not added to the topology
+        self.now = int(time.time())
+        self.clock = Clock(self.now)
+        self.module_d = {}
+        for module in [switcher.topology.ce, switcher.topology.ddm, switcher.topology.queue]:
+            self.module_d[module] = module.time
+            module.time = self.clock
+        self.data_d = get_inputs(self.now)
+
+    def tearDown(self):
+        for module, module_time in self.module_d.items():
+            module.time = module_time
+
+    def get_actions(self, t):
+        self.clock.t = t
+        topology = get_topology(Topology, self.data_d)
+        topology.evaluate()
+        return get_actions(topology)
+
+    def test_no_change_before(self):
+        t = self.now
+        change_l = []
+        # until all the downtimes are over
+        while True:
+            topology = get_topology(Topology, self.data_d)
+            next_t = topology.next_change_time(t)
+            if next_t is None:
+                break
+            self.assertTrue(next_t >= t - 1)
+            actions = self.get_actions(t)
+            for later_t in [t + 1, (t + next_t)//2, next_t - 2]:
+                if later_t > t:
+                    self.assertEqual(self.get_actions(later_t), actions)
+            if self.get_actions(next_t + 2) != actions:
+                change_l.append(next_t)
+            t = max(next_t + 2, t + 1)
+        # some of the points found are actual changes
+        self.assertTrue(len(change_l) > 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+#
+# tests for the entities created in large numbers,
+# which use __slots__ instead of a __dict__ per object
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import cPickle
+import time
+import unittest
+
+from switcher.topology.topology import Topology
+
+from test_downtime import HOUR, NOW, get_downtime
+from test_topology import get_inputs, get_topology
+
+
+class TestSlots(unittest.TestCase):
+
+    def setUp(self):
+        self.topology = get_topology(Topology, get_inputs(int(time.time())))
+        self.topology.evaluate()
+
+    def get_entities(self):
+        queue = self.topology.queue_d['Q2']
+        ce = queue.cehandler.getlist()[0]
+        ddm = self.topology.queue_d['Q7'].ddmhandler.getlist()[0]
+        downtime = ce.getEndpointDowntimes().getlist()[0]
+        return [queue, ce, ddm, downtime, downtime.timeinterval,
+                downtime.extend(HOUR).timeinterval, queue.event, ce.event]
+
+    def test_no_dict(self):
+        for entity in self.get_entities():
+            self.assertFalse(hasattr(entity, '__dict__'), entity.__class__.__name__)
+            self.assertRaises(AttributeError, setattr, entity, 'not_a_slot', None)
+
+    def test_pickle(self):
+        for entity in self.get_entities():
+            copy = cPickle.loads(cPickle.dumps(entity, cPickle.HIGHEST_PROTOCOL))
+            for cls in entity.__class__.__mro__:
+                for name in getattr(cls, '__slots__', ()):
+                    if not hasattr(entity, name):
+                        continue
+                    value = getattr(entity, name)
+                    if value is None or isinstance(value, (basestring, int, long, float, bool)):
+                        self.assertEqual(getattr(copy, name), value)
+                    else:
+                        self.assertEqual(type(getattr(copy, name)), type(value))
+
+    def test_extend(self):
+        downtime = get_downtime('ce0', NOW, NOW + HOUR)
+        extended = downtime.extend(HOUR)
+        self.assertEqual(extended.timeinterval.start_t, NOW - HOUR)
+        self.assertEqual(extended.timeinterval.end_t, NOW + HOUR)
+        for name in downtime.__slots__:
+            if name != 'timeinterval':
+                self.assertTrue(getattr(extended, name) is getattr(downtime, name))
+        self.assertEqual(downtime.timeinterval.start_t, NOW)
+
+
+if __name__ == '__main__':
+    unittest.main()
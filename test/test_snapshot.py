@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# tests for the topology snapshot, and the update of a topology loaded from it
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import copy
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from switcher.snapshot import TopologySnapshot
+from switcher.topology.columnar import ColumnarTopology
+from switcher.topology.topology import Topology
+
+from test_topology import get_inputs, get_topology
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.snapshot = TopologySnapshot(os.path.join(self.tmpdir, 'topology.snapshot'))
+        self.data_d = get_inputs(int(time.time()))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def reload(self, topology_class):
+        topology = get_topology(topology_class, self.data_d)
+        topology.clear()
+        self.snapshot.save(topology, 'key', [])
+        return self.snapshot.load('key', [])
+
+    def check_update(self, topology_class):
+        # the same content, in new objects, is not a change
+        topology = self.reload(topology_class)
+        changed = topology.update(copy.deepcopy(self.data_d['schedconfig']),
+                                  copy.deepcopy(self.data_d['ddmtopology']))
+        self.assertEqual(changed, False)
+        schedconfig = copy.deepcopy(self.data_d['schedconfig'])
+        schedconfig['Q0']['type'] = 'production'
+        self.assertEqual(topology.update(schedconfig, self.data_d['ddmtopology']), True)
+        ddmtopology = copy.deepcopy(self.data_d['ddmtopology'])
+        del ddmtopology['SITE0_DATADISK']
+        self.assertEqual(topology.update(schedconfig, ddmtopology), True)
+        self.assertEqual(topology.update(schedconfig, ddmtopology), False)
+
+    def test_update(self):
+        self.check_update(Topology)
+
+    def test_update_columnar(self):
+        self.check_update(ColumnarTopology)
+
+    def test_key(self):
+        self.reload(Topology)
+        self.assertTrue(self.snapshot.load('other key', []) is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
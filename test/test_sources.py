@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+#
+# tests for the fetch step: concurrency, deadline, last good data, and background fetches,
+# and for sources read again out of the fetch step
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from ConfigParser import SafeConfigParser
+
+from switcher.ingest import SCHEDCONFIG_STATUS
+from switcher.sources import Sources
+from switcher.switcherexceptions import SwitcherConfigurationFailure
+from switcher.topology.topology import Topology
+from switcher.utils import RetryPolicy
+
+from test_topology import get_inputs, get_topology
+
+
+def get_conf(**options):
+    conf = SafeConfigParser()
+    conf.add_section('SOURCE')
+    for name in Sources.names:
+        conf.set('SOURCE', name, '/dev/null/%s' %name)
+    for key, value in options.items():
+        conf.set('SOURCE', key, str(value))
+    return conf
+
+
+class FakeSources(Sources):
+    """
+    Sources where each source returns its name,
+    unless it is told to fail, or to wait until released
+    """
+
+    def __init__(self, conf):
+        super(FakeSources, self).__init__(conf)
+        self.calls_d = dict([(name, 0) for name in self.names])
+        self.failing = set()
+        self.release_d = {}
+
+    def _fetch_one(self, name, deadline=None, copy_to=None):
+        self.calls_d[name] += 1
+        if name in self.release_d:
+            self.release_d[name].wait()
+        if name in self.failing:
+            raise SwitcherConfigurationFailure(name, 'failing')
+        return name
+
+
+class TestFetch(unittest.TestCase):
+
+    def tearDown(self):
+        for sources in getattr(self, 'sources_l', []):
+            for event in sources.release_d.values():
+                event.set()
+            sources.close()
+
+    def get_sources(self, **options):
+        sources = FakeSources(get_conf(**options))
+        self.sources_l = getattr(self, 'sources_l', []) + [sources]
+        return sources
+
+    def test_all_sources(self):
+        sources = self.get_sources()
+        data_d = sources.fetch()
+        self.assertEqual(sorted(data_d.keys()), sorted(Sources.names))
+        for name, data in data_d.items():
+            self.assertEqual(data, name)
+
+    def test_concurrent(self):
+        # every source waits until all of them have started
+        sources = self.get_sources()
+        release = threading.Event()
+        for name in sources.names:
+            sources.release_d[name] = release
+        def watch():
+            for i in range(50):
+                if min(sources.calls_d.values()) > 0:
+                    release.set()
+                    return
+                time.sleep(0.1)
+        watcher = threading.Thread(target=watch)
+        watcher.start()
+        data_d = sources.fetch()
+        watcher.join()
+        self.assertTrue(release.is_set())
+        self.assertEqual(sorted(data_d.keys()), sorted(Sources.names))
+
+    def test_fetch_threads(self):
+        sources = self.get_sources(fetch_threads=1, fetch_deadline=1)
+        release = threading.Event()
+        for name in sources.names:
+            sources.release_d[name] = release
+        self.assertRaises(SwitcherConfigurationFailure, sources.fetch)
+        # only one of them was started
+        self.assertEqual(sum(sources.calls_d.values()), 1)
+
+    def test_ttl(self):
+        sources = self.get_sources(sites_ttl=3600)
+        sources.fetch()
+        sources.fetch()
+        self.assertEqual(sources.calls_d['sites'], 1)
+        self.assertEqual(sources.calls_d['schedconfig'], 2)
+
+    def test_failure_without_stale_data(self):
+        sources = self.get_sources()
+        sources.failing.add('sites')
+        self.assertRaises(SwitcherConfigurationFailure, sources.fetch)
+
+    def test_deadline(self):
+        sources = self.get_sources(fetch_deadline=1)
+        sources.release_d['sites'] = threading.Event()
+        start_t = time.time()
+        self.assertRaises(SwitcherConfigurationFailure, sources.fetch)
+        # the deadline plus the margin to wait for the threads
+        self.assertTrue(time.time() - start_t < 5)
+
+    def test_deadline_keeps_threads(self):
+        sources = self.get_sources(fetch_deadline=1)
+        sources.release_d['sites'] = threading.Event()
+        self.assertRaises(SwitcherConfigurationFailure, sources.fetch)
+        pool = sources.pool
+        # the hanging fetch is waited for again, not started twice
+        self.assertRaises(SwitcherConfigurationFailure, sources.fetch)
+        self.assertTrue(sources.pool is pool)
+        self.assertEqual(sources.calls_d['sites'], 1)
+        self.assertEqual(sources.calls_d['schedconfig'], 2)
+
+
+class TestStale(unittest.TestCase):
+
+    def setUp(self):
+        self.sources = FakeSources(get_conf(fetch_deadline=1, sites_max_staleness=3600))
+        self.sources.fetch()
+
+    def tearDown(self):
+        for event in self.sources.release_d.values():
+            event.set()
+        self.sources.close()
+
+    def wait_calls(self, name, ncalls):
+        for i in range(50):
+            if self.sources.calls_d[name] >= ncalls:
+                return
+            time.sleep(0.1)
+
+    def test_failure_uses_stale_data(self):
+        self.sources.failing.add('sites')
+        data_d = self.sources.fetch()
+        self.assertEqual(data_d['sites'], 'sites')
+        # fetched again in the background
+        self.wait_calls('sites', 3)
+        self.assertEqual(self.sources.calls_d['sites'], 3)
+
+    def test_failure_beyond_max_staleness(self):
+        self.sources.failing.add('ddmtopology')
+        self.assertRaises(SwitcherConfigurationFailure, self.sources.fetch)
+
+    def test_no_concurrent_fetches(self):
+        release = threading.Event()
+        self.sources.release_d['sites'] = release
+        data_d = self.sources.fetch()
+        self.assertEqual(data_d['sites'], 'sites')
+        # the fetch beyond the deadline is still running,
+        # and neither the background fetch nor the next cycle start another
+        data_d = self.sources.fetch()
+        self.assertEqual(data_d['sites'], 'sites')
+        self.assertEqual(self.sources.calls_d['sites'], 2)
+        # once it finishes, its data is recorded
+        self.sources.release_d.pop('sites')
+        self.sources.cached_d['sites'] = (0, 'old', None)
+        release.set()
+        for i in range(50):
+            if self.sources.cached_d['sites'][0] > 0:
+                break
+            time.sleep(0.1)
+        self.assertNotEqual(self.sources.cached_d['sites'][0], 0)
+        self.assertEqual(self.sources.calls_d['sites'], 2)
+
+    def test_background_fetch_is_bounded(self):
+        self.assertEqual(self.sources._get_max_fetch_time('sites'), 1)
+        sources = FakeSources(get_conf(max_trials=2, connect_timeout=3, read_timeout=7, backoff_max=5))
+        self.assertEqual(sources._get_max_fetch_time('sites'), 25)
+
+
+class TestReload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        # accepts connections, but never answers
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_file(self):
+        path = os.path.join(self.tmpdir, 'schedconfig.json')
+        json.dump({'Q0': {'status': 'online', 'type': 'analysis'}}, open(path, 'w'))
+        sources = Sources(get_conf(schedconfig=path))
+        self.assertEqual(sources.reload('schedconfig', SCHEDCONFIG_STATUS), {'Q0': {'status': 'online'}})
+
+    def test_hanging_source(self):
+        url = 'http://127.0.0.1:%s/schedconfig' %self.server.getsockname()[1]
+        sources = Sources(get_conf(schedconfig=url, connect_timeout=1, read_timeout=1,
+                                   max_trials=2, backoff=0.5))
+        start_t = time.time()
+        self.assertRaises(SwitcherConfigurationFailure, sources.reload, 'schedconfig')
+        # 2 attempts, and the backoff between them
+        self.assertTrue(time.time() - start_t < 5)
+
+    def test_reevaluate(self):
+        data_d = get_inputs(int(time.time()))
+        topology = get_topology(Topology, data_d)
+        topology.evaluate()
+        path = os.path.join(self.tmpdir, 'schedconfig.json')
+        schedconfig = dict([(qname, dict(qdata, status='test')) for qname, qdata in data_d['schedconfig'].items()])
+        json.dump(schedconfig, open(path, 'w'))
+        topology.reevaluate(Sources(get_conf(schedconfig=path)))
+        self.assertEqual(topology.queue_d['Q2'].event.queue_final_status, 'test')
+        # the source hangs after the actions were done
+        url = 'http://127.0.0.1:%s/schedconfig' %self.server.getsockname()[1]
+        sources = Sources(get_conf(schedconfig=url, connect_timeout=1, read_timeout=1, max_trials=1))
+        start_t = time.time()
+        self.assertRaises(SwitcherConfigurationFailure, topology.reevaluate, sources)
+        self.assertTrue(time.time() - start_t < 5)
+
+    def test_client(self):
+        # the pool of connections shared with the fetch step and AGIS
+        class Client(object):
+            def __init__(self):
+                self.url_l = []
+            def get(self, url, headers=None, timeout=None):
+                self.url_l.append((url, timeout))
+                raise IOError('no connection')
+        client = Client()
+        sources = Sources(get_conf(schedconfig='http://localhost/schedconfig', max_trials=1,
+                                   connect_timeout=3, read_timeout=7), client)
+        self.assertRaises(SwitcherConfigurationFailure, sources.reload, 'schedconfig')
+        self.assertEqual(client.url_l, [('http://localhost/schedconfig', (3, 7))])
+
+    def test_deadline(self):
+        url = 'http://127.0.0.1:%s/schedconfig' %self.server.getsockname()[1]
+        sources = Sources(get_conf(schedconfig=url, read_timeout=60, fetch_deadline=2))
+        start_t = time.time()
+        self.assertRaises(SwitcherConfigurationFailure, sources.reload, 'schedconfig')
+        self.assertTrue(time.time() - start_t < 5)
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_exponential_backoff(self):
+        retry = RetryPolicy(5, 2, 10)
+        self.assertEqual([retry.delay(i) for i in range(1, 5)], [2, 4, 8, 10])
+
+    def test_jitter(self):
+        retry = RetryPolicy(5, 8, 8, True)
+        for i in range(20):
+            self.assertTrue(4 <= retry.delay(1) <= 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
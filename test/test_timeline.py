@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# tests for the bitmaps of downtimes,
+# used to skip queues with no time with all their CEs INACTIVE
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import random
+import unittest
+
+import switcher.topology.queue
+from switcher.timeinterval import Timeline
+from switcher.topology.ce import CE
+from switcher.topology.queue import Queue
+
+from test_batch import FrozenTime
+from test_downtime import NOW, get_downtime
+from test_topology import get_thresholds
+
+
+class TestTimeline(unittest.TestCase):
+
+    def setUp(self):
+        # 10 slots: [100, 200), [200, 300), ... [1000, 1100)
+        self.timeline = Timeline(100, 1000, 100)
+
+    def test_mask(self):
+        mask = self.timeline.mask
+        self.assertEqual(self.timeline.full, 2**10 - 1)
+        self.assertEqual(mask(100, 200), 1)
+        self.assertEqual(mask(100, 201), 3)
+        self.assertEqual(mask(950, 1000), 1 << 8)
+        self.assertEqual(mask(1000, 2000), 1 << 9)
+        self.assertEqual(mask(0, 2000), self.timeline.full)
+
+    def test_edges(self):
+        mask = self.timeline.mask
+        # empty, or reversed, intervals
+        self.assertEqual(mask(150, 150), 0)
+        self.assertEqual(mask(300, 200), 0)
+        # after the end of the Timeline
+        self.assertEqual(mask(1001, 2000), 0)
+        # finished before the start of the Timeline: in the first slot
+        self.assertEqual(mask(0, 50), 1)
+        self.assertEqual(mask(0, 100), 1)
+
+    def test_overlap(self):
+        # overlapping intervals always have common bits
+        rnd = random.Random(4)
+        for trial in range(2000):
+            a = sorted([rnd.randint(0, 1200), rnd.randint(0, 1200)])
+            b = sorted([rnd.randint(0, 1200), rnd.randint(0, 1200)])
+            start_t = max(a[0], b[0])
+            if start_t < min(a[1], b[1]) and start_t <= self.timeline.end_t:
+                self.assertTrue(self.timeline.mask(*a) & self.timeline.mask(*b))
+
+
+class TestPrefilter(unittest.TestCase):
+
+    def setUp(self):
+        self.time = switcher.topology.queue.time
+        switcher.topology.queue.time = FrozenTime()
+        self.get_ce_timeline = Queue._get_ce_timeline
+        self.thresholds = get_thresholds()
+
+    def tearDown(self):
+        switcher.topology.queue.time = self.time
+        Queue._get_ce_timeline = self.get_ce_timeline
+
+    def get_queue(self, qtype, ce_data_l):
+        qdata = {'status': 'online', 'tier_level': 2, 'type': qtype, 'astorages': {}}
+        queue = Queue('Q0', qdata, self.thresholds)
+        for endpoint, interval_l in ce_data_l:
+            ce = CE(endpoint, self.thresholds)
+            for start_t, end_t in interval_l:
+                ce.add_downtime(get_downtime(endpoint, start_t, end_t))
+            queue.add_ce(ce)
+        return queue
+
+    def get_status(self, queue):
+        event = queue._get_new_status()
+        return event.new_status, event.comment
+
+    def test_same_decisions(self):
+        hour = 3600
+        rnd = random.Random(5)
+        case_l = []
+        for trial in range(1000):
+            ce_data_l = []
+            for i in range(rnd.randint(1, 3)):
+                interval_l = []
+                for j in range(rnd.randint(0, 3)):
+                    start_t = NOW + rnd.randint(-10, 30)*hour + rnd.choice([-1, 0, 1, 1800])
+                    interval_l.append((start_t, start_t + rnd.choice([1, 5, 30, 80])*hour))
+                ce_data_l.append(('ce%s' %i, interval_l))
+            case_l.append((rnd.choice(['analysis', 'production']), ce_data_l))
+
+        with_timeline = [self.get_status(self.get_queue(*case)) for case in case_l]
+        Queue._get_ce_timeline = lambda self: None
+        without_timeline = [self.get_status(self.get_queue(*case)) for case in case_l]
+        self.assertEqual(with_timeline, without_timeline)
+        # not all of them online
+        self.assertTrue(len(set([status for status, comment in with_timeline])) > 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
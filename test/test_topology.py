@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+#
+# tests for the evaluation of the whole topology, and for its update across cycles,
+# with both implementations, on a small set of inputs
+# to run them, from this directory:
+#       source setup.sh
+#       python -m unittest discover -p 'test_*.py'
+#
+
+import copy
+import logging
+import os
+import random
+import time
+import unittest
+
+from ConfigParser import SafeConfigParser
+from datetime import datetime
+
+from switcher.thresholds import Thresholds
+from switcher.topology.columnar import ColumnarTopology
+from switcher.topology.topology import Topology
+from switcher.utils import AllowedEntities
+
+logging.disable(logging.CRITICAL)
+
+ETC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etc')
+
+
+def get_conf(name):
+    conf = SafeConfigParser()
+    conf.read(os.path.join(ETC, name))
+    return conf
+
+
+def get_thresholds():
+    return Thresholds(get_conf('downtimes-example.conf'))
+
+
+def timestamp(t):
+    return datetime.utcfromtimestamp(t).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def get_downtime(endpoint_l, start_t, end_t, type='CE'):
+    return {'affected_services': type,
+            'description': 'maintenance',
+            'classification': 'SCHEDULED',
+            'services': [{'type': type, 'endpoint': endpoint, 'name': endpoint} for endpoint in endpoint_l],
+            'info_url': 'http://localhost/%s' %endpoint_l[0],
+            'severity': 'OUTAGE',
+            'start_time': timestamp(start_t),
+            'end_time': timestamp(end_t)}
+
+
+def get_inputs(now):
+    """
+    builds the content of the sources for a small topology:
+    one site per queue, each queue with 2 CEs, and
+        -- Q0, Q1: quiet queues,
+        -- Q2: all its CEs in downtime soon,
+        -- Q3: one of its CEs in downtime soon,
+        -- Q4: all its CEs in downtime in a week,
+        -- Q5: set offline by Switcher, with no downtimes,
+        -- Q6: all its CEs in downtime soon, already offline,
+        -- Q7: its storage in downtime soon.
+    :return dict: with the same keys as Sources.fetch()
+    """
+    schedconfig = {}
+    ddmtopology = {}
+    switcherstatus = {}
+    calendar = {}
+    sites = []
+    for i in range(8):
+        qname = 'Q%s' %i
+        site = 'SITE%s' %i
+        token = '%s_DATADISK' %site
+        ce_l = ['ce%s.site%s.org:9619' %(j, i) for j in range(2)]
+        schedconfig[qname] = {'vo_name': 'atlas', 'cloud': 'CERN', 'atlas_site': site,
+                              'panda_resource': qname, 'probe': None, 'status': 'online',
+                              'tier_level': 2, 'type': 'analysis',
+                              'astorages': {'write_lan': [token]},
+                              'queues': [{'ce_name': ce.split(':')[0], 'ce_endpoint': ce, 'ce_state': 'ACTIVE'} for ce in ce_l]}
+        ddmtopology[token] = {'arprotocols': {'write_lan': [{'endpoint': 'srm://%s.org' %token}]}}
+        switcherstatus[qname] = {'a': {'mode': {'AUTO': {'switcher': {'value': 'ONLINE'}}}}}
+        sites.append({'name': site, 'datapolicies': []})
+        if i in (2, 6):
+            calendar[site] = [get_downtime(ce_l, now + 3600, now + 10*3600)]
+        if i == 3:
+            calendar[site] = [get_downtime(ce_l[:1], now + 3600, now + 10*3600)]
+        if i == 4:
+            calendar[site] = [get_downtime(ce_l, now + 7*24*3600, now + 8*24*3600)]
+        if i == 7:
+            calendar[site] = [get_downtime(['srm://%s.org' %token], now + 3600, now + 10*3600, 'SRM')]
+    for qname in ['Q5', 'Q6']:
+        switcherstatus[qname]['a']['mode']['AUTO']['switcher']['value'] = 'OFFLINE'
+    return {'schedconfig': schedconfig,
+            'ddmtopology': ddmtopology,
+            'switcherstatus': switcherstatus,
+            'downtimescalendar': calendar,
+            'sites': sites}
+
+
+def get_topology(topology_class, data_d, thresholds=None):
+    topology = topology_class(data_d['schedconfig'],
+                              AllowedEntities(), AllowedEntities(), AllowedEntities(),
+                              data_d['ddmtopology'],
+                              get_conf('notifications-example.conf'),
+                              thresholds or get_thresholds())
+    add_cycle_inputs(topology, data_d)
+    return topology
+
+
+def add_cycle_inputs(topology, data_d):
+    topology.add_switcher_status(data_d['switcherstatus'])
+    topology.add_downtimes(data_d['downtimescalendar'])
+    topology.add_nucleus(data_d['sites'])
+
+
+def get_actions(topology):
+    """
+    the action written in the SSB for each queue
+    :return dict: queue name -> new status, or None for no action
+    """
+    out = {}
+    for name, status, type, event in topology.iter_queue_rows():
+        out[name] = event and (event.new_status, event.status_changed)
+    return out
+
+
+def change_inputs(schedconfig, ddmtopology, rnd, step):
+    """
+    makes random changes in schedconfig and DDM topology:
+    queues added, removed, or with new CEs, tokens, sites...
+    """
+    for i in range(rnd.randint(1, 4)):
+        qname = rnd.choice(sorted(schedconfig))
+        qdata = schedconfig[qname]
+        op = rnd.choice(['remove', 'add', 'ce', 'state', 'token', 'ddm', 'site', 'type'])
+        if op == 'remove':
+            del schedconfig[qname]
+        elif op == 'add':
+            new = 'NEW%s_%s' %(step, i)
+            schedconfig[new] = copy.deepcopy(qdata)
+            schedconfig[new]['panda_resource'] = new
+        elif op == 'ce':
+            # a CE shared with other queues
+            endpoint = rnd.choice(['shared.org:9619', 'ce0.site1.org:9619'])
+            qdata['queues'] = qdata['queues'][:1] +\
+                              [{'ce_name': endpoint.split(':')[0], 'ce_endpoint': endpoint, 'ce_state': 'ACTIVE'}]
+        elif op == 'state':
+            endpoint = qdata['queues'][0]['ce_endpoint']
+            state = rnd.choice(['ACTIVE', 'INACTIVE'])
+            for other in schedconfig.values():
+                for ce in other['queues']:
+                    if ce['ce_endpoint'] == endpoint:
+                        ce['ce_state'] = state
+        elif op == 'token':
+            qdata['astorages'] = {'write_lan': [rnd.choice(sorted(ddmtopology))]}
+        elif op == 'ddm':
+            token = rnd.choice(sorted(ddmtopology))
+            ddmtopology[token] = {'arprotocols': {'write_wan': [{'endpoint': 'srm://moved.%s.org' %token}]}}
+        elif op == 'site':
+            qdata['atlas_site'] = 'SITE%s' %rnd.randint(0, 9)
+        else:
+            qdata['type'] = rnd.choice(['analysis', 'production'])
+
+
+class TestEvaluate(unittest.TestCase):
+
+    def setUp(self):
+        self.data_d = get_inputs(int(time.time()))
+
+    def evaluate(self, topology_class, selective):
+        topology = get_topology(topology_class, self.data_d)
+        topology.evaluate(selective=selective)
+        return topology
+
+    def test_decisions(self):
+        actions = get_actions(self.evaluate(Topology, False))
+        self.assertEqual(actions['Q0'], ('online', False))
+        self.assertEqual(actions['Q2'], ('offline', True))
+        self.assertEqual(actions['Q3'], ('online', False))
+        self.assertEqual(actions['Q4'], ('online', False))
+        self.assertEqual(actions['Q5'], ('online', True))
+        self.assertEqual(actions['Q6'], ('offline', False))
+        self.assertEqual(actions['Q7'], ('offline', True))
+
+    def test_selective(self):
+        full = self.evaluate(Topology, False)
+        selective = self.evaluate(Topology, True)
+        self.assertEqual(get_actions(selective), get_actions(full))
+        self.assertEqual(selective.get_dirty_queues(), set(['Q2', 'Q3', 'Q4', 'Q5', 'Q6', 'Q7']))
+
+    def test_columnar(self):
+        full = self.evaluate(Topology, False)
+        columnar = self.evaluate(ColumnarTopology, True)
+        self.assertEqual(get_actions(columnar), get_actions(full))
+        # quiet queues are not materialized
+        self.assertFalse('Q0' in columnar.queue_d)
+
+
+class TestBuild(unittest.TestCase):
+
+    def setUp(self):
+        self.data_d = get_inputs(int(time.time()))
+
+    def test_downtimes_created_when_needed(self):
+        topology = get_topology(Topology, self.data_d)
+        quiet = topology.ce_d['ce0.site0.org:9619']
+        busy = topology.ce_d['ce0.site2.org:9619']
+        self.assertTrue(quiet.endpointdowntimes is None)
+        self.assertEqual(quiet.getEndpointDowntimes().getlist(), [])
+        self.assertEqual(len(busy.getEndpointDowntimes().getlist()), 1)
+        topology.clear()
+        self.assertTrue(busy.endpointdowntimes is None)
+
+    def test_columnar_objects_created_when_needed(self):
+        topology = get_topology(ColumnarTopology, self.data_d)
+        self.assertEqual(topology.queue_d, {})
+        topology.evaluate()
+        self.assertEqual(set(topology.queue_d), topology.get_dirty_queues())
+        self.assertEqual(sorted(topology.ce_d),
+                         sorted(['ce%s.site%s.org:9619' %(j, i) for i in range(2, 8) for j in range(2)]))
+
+
+class TestUpdate(unittest.TestCase):
+    """
+    a topology kept across cycles, and updated with the new inputs,
+    against a topology built from scratch each cycle
+    """
+
+    def setUp(self):
+        self.data_d = get_inputs(int(time.time()))
+        self.rnd = random.Random(6)
+
+    def dump(self, topology):
+        out = {'ce': sorted(topology.ce_d), 'ddm': sorted(topology.ddm_d)}
+        for qname, queue in topology.queue_d.items():
+            out[qname] = (queue.status, queue.switcher_status,
+                          queue.event and (queue.event.new_status, queue.event.comment),
+                          sorted([(ce.endpoint, ce.state, ce.event and ce.event.new_status)
+                                  for ce in queue.cehandler.getlist()]),
+                          sorted([ddm.endpoint for ddm in queue.ddmhandler.getlist()]))
+        return out
+
+    def test_same_as_fresh(self):
+        data_d = self.data_d
+        kept = get_topology(Topology, data_d)
+        kept.evaluate()
+        for step in range(30):
+            data_d = dict(data_d)
+            data_d['schedconfig'] = copy.deepcopy(data_d['schedconfig'])
+            data_d['ddmtopology'] = copy.deepcopy(data_d['ddmtopology'])
+            change_inputs(data_d['schedconfig'], data_d['ddmtopology'], self.rnd, step)
+            kept.update(data_d['schedconfig'], data_d['ddmtopology'])
+            add_cycle_inputs(kept, data_d)
+            kept.evaluate()
+            fresh = get_topology(Topology, data_d)
+            fresh.evaluate()
+            self.assertEqual(self.dump(kept), self.dump(fresh))
+
+    def test_removal(self):
+        for topology_class in [Topology, ColumnarTopology]:
+            topology = get_topology(topology_class, self.data_d)
+            topology.evaluate()
+            schedconfig = dict(self.data_d['schedconfig'])
+            del schedconfig['Q0']
+            self.assertEqual(topology.update(schedconfig, self.data_d['ddmtopology']), True)
+            self.assertFalse('Q0' in [row[0] for row in topology.iter_queue_rows()])
+            # a queue that can not be built again is removed too
+            schedconfig = dict(schedconfig)
+            schedconfig['Q1'] = dict(schedconfig['Q1'], vo_name='cms')
+            self.assertEqual(topology.update(schedconfig, self.data_d['ddmtopology']), True)
+            self.assertFalse('Q1' in [row[0] for row in topology.iter_queue_rows()])
+            self.assertEqual(topology.update(schedconfig, self.data_d['ddmtopology']), False)
+
+    def test_no_change(self):
+        topology = get_topology(Topology, self.data_d)
+        topology.evaluate()
+        before = self.dump(topology)
+        self.assertEqual(topology.update(self.data_d['schedconfig'], self.data_d['ddmtopology']), False)
+        add_cycle_inputs(topology, self.data_d)
+        topology.evaluate()
+        self.assertEqual(self.dump(topology), before)
+
+
+if __name__ == '__main__':
+    unittest.main()